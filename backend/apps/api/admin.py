@@ -1,4 +1,26 @@
 from django.contrib import admin
-from .models import ContactSupport
+from .models import ContactSupport, SearchDocument
 
 admin.site.register(ContactSupport)
+
+
+@admin.register(SearchDocument)
+class SearchDocumentAdmin(admin.ModelAdmin):
+    list_display = (
+        'title',
+        'doc_type',
+        'object_id',
+        'is_public',
+        'owner',
+        'updated_at',
+    )
+
+    list_filter = (
+        'doc_type',
+        'is_public',
+    )
+
+    search_fields = (
+        'title',
+        'object_id',
+    )
@@ -1,11 +1,12 @@
 from django.apps import AppConfig
+from django.db.models.signals import post_migrate
 
 
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.api'
-    
+
     def ready(self):
-        # Register API endpoints
-        # This is a good place to perform any initialization for API endpoints
-        pass
+        from . import signals
+        signals.connect_search_signals()
+        post_migrate.connect(signals.create_search_index, sender=self)
@@ -0,0 +1,162 @@
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+import django
+from django.core.management.base import BaseCommand
+from django.db import connections
+from django.db.models import Q
+from apps.caching.versioning import instances_changed
+from apps.experiments.analysis import (
+    ANALYSIS_VERSION, METRIC_FIELDS, analyze_stored_trace, analyze_trace)
+from apps.experiments.models import Experiment
+
+
+def _init_worker():
+    # Workers started with "spawn" import this module without a configured Django
+    django.setup()
+
+
+def _analyze(row):
+    """
+    Run in a worker process: ``(pk, digest or Trace, type)`` ->
+    ``(pk, metrics, error)``. Workers only read the trace store, never the database.
+    """
+    pk, source, experiment_type = row
+    try:
+        if isinstance(source, str):
+            return pk, analyze_stored_trace(source, experiment_type), None
+        return pk, analyze_trace(source, experiment_type), None
+    except Exception as e:
+        return pk, None, str(e)
+
+
+def _with_delta_traces(batch):
+    """
+    Replace the missing digest of delta-encoded versions by their trace,
+    rebuilt in this process. Returns the rows and ``{pk: error}`` of the
+    traces that could not be rebuilt.
+    """
+    pending = [pk for pk, trace_digest, _ in batch if trace_digest is None]
+    if not pending:
+        return batch, {}
+    experiments = Experiment.objects.in_bulk(pending)
+    rows, errors = [], {}
+    for pk, trace_digest, experiment_type in batch:
+        if trace_digest is None:
+            try:
+                trace_digest = experiments[pk].get_trace()
+            except Exception as e:
+                errors[pk] = str(e)
+                continue
+        rows.append((pk, trace_digest, experiment_type))
+    return rows, errors
+
+
+class Command(BaseCommand):
+    help = 'Recompute the derived metrics of experiments with the current analysis'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--all', action='store_true',
+            help='Reanalyze every experiment, not only those analyzed by an older version')
+        parser.add_argument(
+            '--after-pk', type=int, default=0,
+            help='Skip experiments up to this primary key (to resume an interrupted --all run)')
+        parser.add_argument(
+            '--experiment-type', help='Only reanalyze experiments of this type')
+        parser.add_argument(
+            '--research-id', help='Only reanalyze experiments of this research project')
+        parser.add_argument(
+            '--latest-only', action='store_true',
+            help='Only reanalyze the latest version of each experiment')
+        parser.add_argument(
+            '--workers', type=int, default=os.cpu_count() or 1,
+            help='Number of worker processes (default: one per CPU)')
+        parser.add_argument(
+            '--batch-size', type=int, default=500,
+            help='Number of experiments read and written back at a time')
+
+    def handle(self, *args, **options):
+        experiments = Experiment.objects.filter(
+            Q(trace_digest__isnull=False) | Q(delta_base__isnull=False),
+            pk__gt=options['after_pk'])
+        if not options['all']:
+            # Rows are marked as they are written, so rerunning after an
+            # interruption continues where the previous run stopped
+            experiments = experiments.exclude(analysis_version=ANALYSIS_VERSION)
+        if options['experiment_type']:
+            experiments = experiments.filter(
+                experiment_type=options['experiment_type'])
+        if options['research_id']:
+            experiments = experiments.filter(
+                research__research_id=options['research_id'])
+        if options['latest_only']:
+            experiments = experiments.filter(is_latest_version=True)
+
+        unpacked = Experiment.objects.filter(
+            trace_digest__isnull=True, delta_base__isnull=True, data_points__isnull=False).count()
+        if unpacked:
+            self.stdout.write(self.style.WARNING(
+                f'Skipping {unpacked} experiments without a packed trace; '
+                f'run pack_experiment_traces first'))
+
+        total = experiments.count()
+        workers = max(1, options['workers'])
+        batch_size = max(1, options['batch_size'])
+        self.stdout.write(
+            f'Reanalyzing {total} experiments with {workers} workers '
+            f'(analysis version {ANALYSIS_VERSION})...')
+        if not total:
+            return
+
+        rows = experiments.order_by('pk').values_list(
+            'pk', 'trace_digest', 'experiment_type')
+        fields = list(METRIC_FIELDS) + ['analysis_version']
+        processed = failed = 0
+        last_pk = options['after_pk']
+        started = time.monotonic()
+
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker) as pool:
+            while True:
+                # Each batch is read completely by its own query, so no cursor
+                # stays open while the connection is closed below
+                batch = list(rows.filter(pk__gt=last_pk)[:batch_size])
+                if not batch:
+                    break
+                last_pk = batch[-1][0]
+                rows_to_analyze, errors = _with_delta_traces(batch)
+                if not processed:
+                    # The pool forks its workers at the first map(); they must
+                    # not inherit the parent's database connection
+                    connections.close_all()
+
+                updated = []
+                chunksize = max(1, len(rows_to_analyze) // (workers * 4))
+                results = [(pk, None, error) for pk, error in errors.items()]
+                results += pool.map(_analyze, rows_to_analyze, chunksize=chunksize)
+                for pk, metrics, error in results:
+                    if error is not None:
+                        failed += 1
+                        self.stdout.write(self.style.ERROR(
+                            f'Could not analyze experiment {pk}: {error}'))
+                        continue
+                    updated.append(Experiment(
+                        pk=pk, analysis_version=ANALYSIS_VERSION, **metrics))
+                Experiment.objects.bulk_update(updated, fields)
+                # bulk_update() sends no post_save, so the cached views are
+                # invalidated here
+                instances_changed(Experiment, Experiment.objects.filter(
+                    pk__in=[experiment.pk for experiment in updated]
+                ).values_list('experiment_id', flat=True))
+
+                processed += len(batch)
+                elapsed = time.monotonic() - started
+                rate = processed / elapsed if elapsed else 0
+                remaining = (total - processed) / rate if rate else 0
+                self.stdout.write(
+                    f'{processed}/{total} ({processed / total:.0%}), '
+                    f'{rate:.0f}/s, ~{remaining:.0f}s left, last pk {batch[-1][0]}')
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Reanalyzed {processed - failed} experiments ({failed} failed)'))
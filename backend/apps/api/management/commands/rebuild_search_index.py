@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS
+from apps.api.search import rebuild_documents
+from apps.common import fulltext
+
+
+class Command(BaseCommand):
+    help = 'Create or rebuild the full-text search indexes'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--documents', action='store_true',
+            help='Also regenerate the site-wide search documents from their source objects')
+        parser.add_argument(
+            '--database', default=DEFAULT_DB_ALIAS,
+            help='Database to rebuild the indexes on')
+
+    def handle(self, *args, **options):
+        using = options['database']
+        if options['documents']:
+            total = rebuild_documents(using=using)
+            self.stdout.write(self.style.SUCCESS(f'Regenerated {total} search documents'))
+
+        for index in fulltext.registry:
+            index.rebuild(using=using)
+            if index.is_supported(using=using):
+                self.stdout.write(self.style.SUCCESS(f'Rebuilt the search index of {index.model_label}'))
+            else:
+                self.stdout.write(self.style.WARNING(
+                    f'Full-text search is not available for {index.model_label} on this '
+                    f'database; searches fall back to substring matching'))
@@ -1,7 +1,7 @@
 from django.db import models
 from django.contrib.auth.models import User
 
-from apps.common.models import CreatedAtModel
+from apps.common.models import CreatedAtModel, TimeStampedModel
 
 
 class ContactSupport(CreatedAtModel):
@@ -22,3 +22,42 @@ class ContactSupport(CreatedAtModel):
         verbose_name = "Contact Support"
         verbose_name_plural = "Contact Support Requests"
         ordering = ['-created_at']
+
+
+class SearchDocument(TimeStampedModel):
+    """
+    One searchable entity (publication, dataset, experiment or researcher)
+    in the site-wide search index, kept in sync by apps.api.search
+    """
+    DOC_TYPES = (
+        ('publication', 'Publication'),
+        ('dataset', 'Dataset'),
+        ('experiment', 'Experiment'),
+        ('researcher', 'Researcher'),
+    )
+
+    doc_type = models.CharField(max_length=20, choices=DOC_TYPES, db_index=True)
+    object_id = models.CharField(max_length=255)
+    title = models.CharField(max_length=500)
+    body = models.TextField(blank=True, default='')
+    is_public = models.BooleanField(default=False)
+    owner = models.ForeignKey(
+        User, on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    research = models.ForeignKey(
+        'research.Research', on_delete=models.SET_NULL, null=True, blank=True, related_name='+')
+    # Data category of datasets, counted as a search facet
+    category = models.CharField(max_length=100, blank=True, null=True)
+    # Filter columns: the year of publications and the data type of datasets
+    year = models.PositiveSmallIntegerField(blank=True, null=True)
+    data_type = models.CharField(max_length=50, blank=True, null=True)
+    date = models.DateTimeField(blank=True, null=True)
+    # Fields returned with a search hit, so results need no further queries
+    data = models.JSONField(default=dict, blank=True)
+
+    def __str__(self):
+        return f"{self.get_doc_type_display()}: {self.title}"
+
+    class Meta:
+        verbose_name = "Search Document"
+        verbose_name_plural = "Search Documents"
+        unique_together = ('doc_type', 'object_id')
@@ -0,0 +1,258 @@
+"""
+Site-wide search over publications, datasets, experiments and researchers.
+
+Every searchable object is mirrored into one SearchDocument row, and all rows
+share a single full-text index (see apps.common.fulltext), so one query ranks
+the mixed result set and one grouped count gives the per-type facets.
+Documents are refreshed from post_save/post_delete signals (signals.py);
+`manage.py rebuild_search_index --documents` regenerates them all.
+"""
+from django.core.paginator import Paginator
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models import Q
+
+from apps.caching.versioning import bump_version
+from apps.common.facets import cached_facet_counts
+from apps.common.fulltext import FullTextIndex, tokenize
+from .models import SearchDocument
+
+document_index = FullTextIndex('api.SearchDocument', {
+    'title': 'A',
+    'body': 'C',
+}, name='api_searchdocument')
+
+DEFAULT_PAGE_SIZE = 20
+MAX_PAGE_SIZE = 100
+SEARCH_FACETS = {
+    'type': 'doc_type',
+    'data_category': 'category',
+}
+
+
+def _text(*values):
+    return ' '.join(str(value) for value in values if value)
+
+
+def _year(value):
+    value = (value or '').strip()
+    return int(value) if value.isdigit() else None
+
+
+def _publication(publication):
+    return {
+        'title': publication.title,
+        'body': _text(publication.author, publication.abstract, publication.journal,
+                      publication.publisher, publication.doi),
+        'is_public': publication.is_public,
+        'owner_id': publication.user_id,
+        'research_id': None,
+        'year': _year(publication.year),
+        'date': publication.created_at,
+        'data': {
+            'author': publication.author,
+            'year': publication.year,
+            'journal': publication.journal,
+            'doi': publication.doi,
+            'citations': publication.citations,
+        },
+    }
+
+
+def _dataset(upload):
+    return {
+        'title': upload.file_name,
+        'body': _text(upload.description, upload.experiment_type, upload.method,
+                      upload.electrode_type, upload.instrument),
+        # Uploads have no visibility flag; only the uploader and research members see them
+        'is_public': False,
+        'owner_id': upload.uploaded_by_id,
+        'research_id': upload.research_id_id,
+        'category': upload.category.name if upload.category else None,
+        'data_type': upload.data_type_id,
+        'date': upload.upload_date,
+        'data': {
+            'description': upload.description,
+            'category': upload.data_type.name if upload.data_type else None,
+            'dataCategory': upload.category.name if upload.category else None,
+            'author': upload.uploaded_by.username,
+            'downloads': upload.downloads_count,
+            'method': upload.method,
+            'electrode': upload.electrode_type,
+            'instrument': upload.instrument,
+        },
+    }
+
+
+def _experiment(experiment):
+    if not experiment.is_latest_version:
+        # Superseded versions are reachable from the latest one
+        return None
+    return {
+        'title': experiment.title,
+        'body': _text(experiment.description, experiment.experiment_id,
+                      experiment.get_experiment_type_display(),
+                      experiment.electrode_material, experiment.electrolyte),
+        'is_public': False,
+        'owner_id': experiment.researcher_id,
+        'research_id': experiment.research_id,
+        'date': experiment.created_at,
+        'data': {
+            'experiment_id': experiment.experiment_id,
+            'experiment_type': experiment.experiment_type,
+            'scan_rate': experiment.scan_rate,
+            'version': experiment.version,
+        },
+    }
+
+
+def _researcher(researcher):
+    return {
+        'title': researcher.name,
+        'body': _text(researcher.institution, researcher.orcid_id),
+        'is_public': True,
+        'owner_id': researcher.user_account_id,
+        'research_id': None,
+        'date': None,
+        'data': {
+            'institution': researcher.institution,
+            'orcid_id': researcher.orcid_id,
+        },
+    }
+
+
+# doc_type -> (model label, document builder, related fields the builder reads)
+SOURCES = {
+    'publication': ('publication.Publication', _publication, ()),
+    'dataset': ('data.FileUpload', _dataset, ('data_type', 'category', 'uploaded_by')),
+    'experiment': ('experiments.Experiment', _experiment, ()),
+    'researcher': ('research.Researcher', _researcher, ()),
+}
+
+
+def index_object(doc_type, instance, using=DEFAULT_DB_ALIAS):
+    """Create or refresh the search document of a source object"""
+    fields = SOURCES[doc_type][1](instance)
+    if fields is None:
+        return remove_object(doc_type, instance.pk, using=using)
+    document, _ = SearchDocument.objects.using(using).update_or_create(
+        doc_type=doc_type, object_id=str(instance.pk), defaults=fields)
+    document_index.index(document, using=using)
+    bump_version(SearchDocument._meta.label)
+    return document
+
+
+def remove_object(doc_type, pk, using=DEFAULT_DB_ALIAS):
+    """Drop the search document of a deleted source object"""
+    documents = SearchDocument.objects.using(using).filter(
+        doc_type=doc_type, object_id=str(pk))
+    for document_pk in documents.values_list('pk', flat=True):
+        document_index.unindex(document_pk, using=using)
+    documents.delete()
+    bump_version(SearchDocument._meta.label)
+
+
+def rebuild_documents(using=DEFAULT_DB_ALIAS, batch_size=1000):
+    """Regenerate every search document from its source objects"""
+    from django.apps import apps
+
+    SearchDocument.objects.using(using).all().delete()
+    total = 0
+    for doc_type, (label, build, related) in SOURCES.items():
+        objects = apps.get_model(label).objects.using(using).select_related(*related)
+        batch = []
+        for instance in objects.iterator(chunk_size=batch_size):
+            fields = build(instance)
+            if fields is None:
+                continue
+            batch.append(SearchDocument(
+                doc_type=doc_type, object_id=str(instance.pk), **fields))
+            if len(batch) == batch_size:
+                SearchDocument.objects.using(using).bulk_create(batch)
+                total += len(batch)
+                batch = []
+        SearchDocument.objects.using(using).bulk_create(batch)
+        total += len(batch)
+    document_index.rebuild(using=using)
+    bump_version(SearchDocument._meta.label)
+    return total
+
+
+def visible_documents(user):
+    """Documents the user may see: public ones, their own and their researches'"""
+    documents = SearchDocument.objects.all()
+    if not user.is_authenticated:
+        return documents.filter(is_public=True)
+    if user.is_staff:
+        return documents
+    from apps.research.permissions import accessible_research_ids
+    return documents.filter(
+        Q(is_public=True) | Q(owner=user) | Q(research__in=accessible_research_ids(user)))
+
+
+def _visibility_scope(user):
+    """Part of the facet cache key: users who see the same documents share it"""
+    if not user.is_authenticated:
+        return 'public'
+    return 'staff' if user.is_staff else f'user:{user.pk}'
+
+
+def filter_documents(documents, year_from=None, year_to=None, data_type=None, category=None):
+    """
+    Narrow publications by year and datasets by data type or data category;
+    documents of the other types are not affected by these filters
+    """
+    if year_from is not None:
+        documents = documents.filter(~Q(doc_type='publication') | Q(year__gte=year_from))
+    if year_to is not None:
+        documents = documents.filter(~Q(doc_type='publication') | Q(year__lte=year_to))
+    if data_type:
+        documents = documents.filter(~Q(doc_type='dataset') | Q(data_type=data_type))
+    if category:
+        documents = documents.filter(~Q(doc_type='dataset') | Q(category=category))
+    return documents
+
+
+def search(query, user, doc_types=None, page=1, page_size=DEFAULT_PAGE_SIZE, **filters):
+    """
+    Ranked, paginated search across all document types.
+    ``filters`` are passed to filter_documents(). ``facets`` counts the
+    matches per type and per dataset category before ``doc_types`` is
+    applied, so clients can show the totals of the types that are filtered out.
+    """
+    documents = filter_documents(visible_documents(user), **filters)
+    matches = document_index.search(documents, query)
+    facets = cached_facet_counts(matches, SEARCH_FACETS, 'search', {
+        'query': ' '.join(tokenize(query)),
+        'scope': _visibility_scope(user),
+        **filters,
+    })
+
+    if doc_types:
+        matches = matches.filter(doc_type__in=doc_types)
+
+    page_size = max(1, min(page_size, MAX_PAGE_SIZE))
+    results = matches.order_by('-search_rank', '-date', 'pk').values(
+        'doc_type', 'object_id', 'title', 'date', 'data', 'search_rank')
+    # The total is counted from the results themselves: the facets may be
+    # cached from before the latest changes
+    paginator = Paginator(results, page_size)
+    current_page = paginator.get_page(page)
+
+    return {
+        'count': paginator.count,
+        'page': current_page.number,
+        'num_pages': paginator.num_pages,
+        'page_size': page_size,
+        'facets': facets,
+        'results': [
+            {
+                'type': row['doc_type'],
+                'id': row['object_id'],
+                'title': row['title'],
+                'date': row['date'],
+                'score': row['search_rank'],
+                **row['data'],
+            }
+            for row in current_page.object_list
+        ],
+    }
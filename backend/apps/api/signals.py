@@ -0,0 +1,32 @@
+from django.apps import apps
+from django.db.models.signals import post_delete, post_save
+
+from . import search
+
+
+def _saved(doc_type):
+    def handler(sender, instance, using, raw=False, **kwargs):
+        if not raw:
+            search.index_object(doc_type, instance, using=using)
+    return handler
+
+
+def _deleted(doc_type):
+    def handler(sender, instance, using, **kwargs):
+        search.remove_object(doc_type, instance.pk, using=using)
+    return handler
+
+
+def connect_search_signals():
+    """Keep the search documents in step with their source models"""
+    for doc_type, (label, _, _) in search.SOURCES.items():
+        model = apps.get_model(label)
+        post_save.connect(_saved(doc_type), sender=model, weak=False,
+                          dispatch_uid=f'search_index_{doc_type}')
+        post_delete.connect(_deleted(doc_type), sender=model, weak=False,
+                            dispatch_uid=f'search_remove_{doc_type}')
+
+
+def create_search_index(sender, using, **kwargs):
+    """Create the site-wide search index after migrate"""
+    search.document_index.ensure(using=using)
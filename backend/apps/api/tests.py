@@ -1,3 +1,111 @@
+from django.contrib.auth.models import User
+from django.core.cache import cache
 from django.test import TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from apps.api.models import SearchDocument
+from apps.data.models import DataCategory, DataType, FileUpload
+from apps.publication.models import Publication
+
+
+class SearchViewTests(TestCase):
+    """SearchView ranks every document type in one list from the search index"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.owner = User.objects.create_user(username='owner', password='secret')
+        cls.other = User.objects.create_user(username='other', password='secret')
+        Publication.objects.create(
+            title='Ferrocene electrochemistry', author='A. Author', year='2019', doi='10.1/a')
+        Publication.objects.create(
+            title='Electrode kinetics', author='B. Author', abstract='Ferrocene standard',
+            year='2023', doi='10.1/b')
+        FileUpload.objects.create(
+            file_name='ferrocene.csv', content='E,I\n', uploaded_by=cls.owner,
+            data_type=DataType.objects.create(id='cv', name='Cyclic Voltammetry'),
+            category=DataCategory.objects.create(name=DataCategory.PUBLISHED))
+
+    def setUp(self):
+        # Facet counts are cached per query
+        cache.clear()
+
+    def _search(self, user=None, **params):
+        if user:
+            self.client.force_login(user)
+        response = self.client.get(reverse('v0:search'), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def _type_count(self, data, doc_type):
+        return {row['value']: row['count'] for row in data['facets']['type']}.get(doc_type, 0)
+
+    def test_documents_follow_saves(self):
+        self.assertEqual(SearchDocument.objects.filter(doc_type='publication').count(), 2)
+        Publication.objects.get(doi='10.1/a').delete()
+        self.assertEqual(SearchDocument.objects.filter(doc_type='publication').count(), 1)
+
+    def test_results_are_ranked_across_types(self):
+        data = self._search(self.owner, query='ferrocene')
+        self.assertEqual(data['count'], 3)
+        self.assertEqual(self._type_count(data, 'publication'), 2)
+        self.assertEqual(self._type_count(data, 'dataset'), 1)
+        titles = [row['title'] for row in data['results']]
+        # Title matches rank above the abstract-only match
+        self.assertEqual(titles[-1], 'Electrode kinetics')
+        scores = [row['score'] for row in data['results']]
+        self.assertEqual(scores, sorted(scores, reverse=True))
+
+    def test_private_documents_are_hidden(self):
+        self.assertEqual(self._type_count(self._search(query='ferrocene'), 'dataset'), 0)
+        self.assertEqual(self._type_count(self._search(self.other, query='ferrocene'), 'dataset'), 0)
+
+    def test_type_filter_keeps_all_facets(self):
+        data = self._search(self.owner, query='ferrocene', type='dataset')
+        self.assertEqual(data['count'], 1)
+        self.assertEqual(data['results'][0]['type'], 'dataset')
+        self.assertEqual(self._type_count(data, 'publication'), 2)
+
+    def test_pages(self):
+        data = self._search(self.owner, query='ferrocene', page_size=2, page=2)
+        self.assertEqual((data['page'], data['num_pages']), (2, 2))
+        self.assertEqual(len(data['results']), 1)
+
+    def test_year_filters_only_publications(self):
+        data = self._search(self.owner, query='ferrocene', year_from=2020)
+        self.assertEqual(data['count'], 2)
+        self.assertEqual(self._type_count(data, 'publication'), 1)
+        self.assertEqual(self._type_count(data, 'dataset'), 1)
+
+        data = self._search(self.owner, query='ferrocene', year_to=2019)
+        titles = {row['title'] for row in data['results']}
+        self.assertEqual(titles, {'Ferrocene electrochemistry', 'ferrocene.csv'})
+
+        data = self._search(self.owner, query='ferrocene', year_from=2020, year_to=2022)
+        self.assertEqual(self._type_count(data, 'publication'), 0)
+        self.assertEqual(self._type_count(data, 'dataset'), 1)
+
+    def test_data_type_filters_only_datasets(self):
+        data = self._search(self.owner, query='ferrocene', data_type='cv')
+        self.assertEqual(self._type_count(data, 'dataset'), 1)
+        data = self._search(self.owner, query='ferrocene', data_type='eis')
+        self.assertEqual(self._type_count(data, 'dataset'), 0)
+        self.assertEqual(self._type_count(data, 'publication'), 2)
+        self.assertEqual(data['count'], 2)
+
+    def test_category_filters_only_datasets(self):
+        data = self._search(self.owner, query='ferrocene', category=DataCategory.PUBLISHED)
+        self.assertEqual(self._type_count(data, 'dataset'), 1)
+        data = self._search(self.owner, query='ferrocene', category=DataCategory.RESEARCH)
+        self.assertEqual(self._type_count(data, 'dataset'), 0)
+        self.assertEqual(self._type_count(data, 'publication'), 2)
+
+    def test_count_follows_changes_while_facets_are_cached(self):
+        self.assertEqual(self._search(query='ferrocene')['count'], 2)
+        Publication.objects.create(title='Ferrocene films', author='C. Author', year='2024', doi='10.1/c')
+        data = self._search(query='ferrocene', page_size=1)
+        self.assertEqual((data['count'], data['num_pages']), (3, 3))
+
+    def test_invalid_type(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse('v0:search'), {'query': 'x', 'type': 'nope'})
+        self.assertEqual(response.status_code, 400)
@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class CachingConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.caching'
+
+    def ready(self):
+        from . import checks, signals  # noqa: F401
+        signals.connect_version_signals()
@@ -0,0 +1,15 @@
+from django.conf import settings
+from django.core.checks import Error, register
+
+
+@register()
+def check_shared_cache(app_configs, **kwargs):
+    """Cache versions and locks must be shared by every server process"""
+    backend = settings.CACHES.get('default', {}).get('BACKEND', '')
+    if settings.DEBUG or not backend.endswith('.LocMemCache'):
+        return []
+    return [Error(
+        'The default cache is local to each process.',
+        hint='Use a shared cache such as the database or Redis cache (see CACHES in settings.py).',
+        id='caching.E001',
+    )]
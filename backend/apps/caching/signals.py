@@ -0,0 +1,18 @@
+from django.apps import apps
+from django.db.models.signals import post_delete, post_save
+
+from .versioning import VERSIONED_MODELS, instance_changed
+
+
+def bump_instance_version(sender, instance, **kwargs):
+    instance_changed(instance)
+
+
+def connect_version_signals():
+    """Bump cache versions whenever a versioned model is saved or deleted"""
+    for label in VERSIONED_MODELS:
+        model = apps.get_model(label)
+        post_save.connect(bump_instance_version, sender=model,
+                          dispatch_uid=f'cache_version_save_{label}')
+        post_delete.connect(bump_instance_version, sender=model,
+                            dispatch_uid=f'cache_version_delete_{label}')
@@ -0,0 +1,98 @@
+"""
+Cache reads that keep expiring entries from stampeding the database.
+
+get_or_compute() stores each value together with its logical expiry time and
+the time it took to compute, and keeps it in the cache for a grace period
+after that expiry:
+
+* Early refresh: shortly before expiry, each read recomputes the value with
+  a probability that grows as expiry approaches and with the cost of the
+  computation (the XFetch rule), so hot entries are usually refreshed before
+  they ever expire.
+* Stale-while-revalidate: during the grace period the stale value is served
+  while a single background job recomputes it.
+* Single flight: recomputation is guarded by a lock key set with
+  ``cache.add()``, which is atomic on every backend. On a cold miss, the
+  requests that lose the race wait briefly for the winner's value instead of
+  querying the database themselves.
+"""
+import logging
+import math
+import random
+import time
+
+from django.core.cache import cache
+
+from apps.common import tasks
+
+logger = logging.getLogger(__name__)
+
+# Seconds a recomputation may hold the lock; also the longest a request
+# waits for another one's value
+LOCK_TIMEOUT = 10
+WAIT_INTERVAL = 0.05
+# Higher values refresh earlier
+EARLY_REFRESH_BETA = 1.0
+
+
+def _lock_key(key):
+    return f'lock:{key}'
+
+
+def _store(key, compute, timeout, stale_timeout):
+    started = time.monotonic()
+    value = compute()
+    duration = time.monotonic() - started
+    cache.set(key, (value, time.time() + timeout, duration), timeout + stale_timeout)
+    return value
+
+
+def _refresh(key, compute, timeout, stale_timeout):
+    # Runs in the background, where an exception would go unnoticed; the
+    # stale value keeps being served and the next read retries
+    try:
+        _store(key, compute, timeout, stale_timeout)
+    except Exception:
+        logger.exception('Background refresh of cache key %s failed', key)
+    finally:
+        cache.delete(_lock_key(key))
+
+
+def get_or_compute(key, compute, timeout, stale_timeout=None, beta=EARLY_REFRESH_BETA):
+    """
+    Cached value of ``compute()``, fresh for ``timeout`` seconds and served
+    stale for up to ``stale_timeout`` more (default: ``timeout``) while it
+    is recomputed in the background. ``compute`` may return None, which is
+    cached like any other value.
+    """
+    if stale_timeout is None:
+        stale_timeout = timeout
+    lock_key = _lock_key(key)
+
+    entry = cache.get(key)
+    if entry is not None:
+        value, expires_at, duration = entry
+        if expires_at - time.time() > duration * beta * -math.log(1.0 - random.random()):
+            return value
+        # Expired or picked for early refresh: one request recomputes
+        if cache.add(lock_key, 1, LOCK_TIMEOUT):
+            tasks.submit(_refresh, key, compute, timeout, stale_timeout)
+        return value
+
+    # Cold miss: one request computes, the others wait for its result
+    if cache.add(lock_key, 1, LOCK_TIMEOUT):
+        try:
+            return _store(key, compute, timeout, stale_timeout)
+        finally:
+            cache.delete(lock_key)
+
+    deadline = time.monotonic() + LOCK_TIMEOUT
+    while time.monotonic() < deadline:
+        time.sleep(WAIT_INTERVAL)
+        entry = cache.get(key)
+        if entry is not None:
+            return entry[0]
+        if cache.get(lock_key) is None:
+            # The computing request failed; do not wait for it any longer
+            break
+    return _store(key, compute, timeout, stale_timeout)
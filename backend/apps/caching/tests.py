@@ -1,3 +1,160 @@
-from django.test import TestCase
+import time
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from apps.caching import stampede
+from apps.caching.checks import check_shared_cache
+from apps.caching.stampede import get_or_compute
+from apps.caching.versioning import bump_version, get_version, instances_changed, versioned_key
+from apps.research.models import Research
+
+
+class VersionedKeyTests(TestCase):
+    """Keys change when their model or instance changes, and only then"""
+
+    def setUp(self):
+        cache.clear()
+
+    def test_key_is_stable_until_bumped(self):
+        key = versioned_key('detail', 'research.Research', 'RES-1')
+        self.assertEqual(versioned_key('detail', 'research.Research', 'RES-1'), key)
+        bump_version('research.Research', 'RES-1')
+        self.assertNotEqual(versioned_key('detail', 'research.Research', 'RES-1'), key)
+
+    def test_instances_are_versioned_separately(self):
+        other = versioned_key('detail', 'research.Research', 'RES-2')
+        listing = versioned_key('list', 'research.Research')
+        bump_version('research.Research', 'RES-1')
+        self.assertEqual(versioned_key('detail', 'research.Research', 'RES-2'), other)
+        self.assertEqual(versioned_key('list', 'research.Research'), listing)
+
+    def test_evicted_version_restarts_newer(self):
+        version = get_version('research.Research', 'RES-1')
+        bump_version('research.Research', 'RES-1')
+        cache.delete('version:research.Research:RES-1')
+        self.assertGreater(get_version('research.Research', 'RES-1'), version + 1)
+
+    def test_saving_and_deleting_bump_versions(self):
+        user = User.objects.create_user(username='researcher', password='secret')
+        project = Research.objects.create(research_id='RES-1', title='Project', head_researcher=user)
+        detail = versioned_key('detail', 'research.Research', 'RES-1')
+        listing = versioned_key('list', 'research.Research')
+        unrelated = versioned_key('detail', 'research.Research', 'RES-2')
+
+        project.title = 'Renamed'
+        project.save()
+        self.assertNotEqual(versioned_key('detail', 'research.Research', 'RES-1'), detail)
+        self.assertNotEqual(versioned_key('list', 'research.Research'), listing)
+        self.assertEqual(versioned_key('detail', 'research.Research', 'RES-2'), unrelated)
+
+        detail = versioned_key('detail', 'research.Research', 'RES-1')
+        project.delete()
+        self.assertNotEqual(versioned_key('detail', 'research.Research', 'RES-1'), detail)
+
+    def test_bulk_changes_bump_versions(self):
+        changed = versioned_key('detail', 'research.Research', 'RES-1')
+        unchanged = versioned_key('detail', 'research.Research', 'RES-2')
+        listing = versioned_key('list', 'research.Research')
+        instances_changed(Research, ['RES-1'])
+        self.assertNotEqual(versioned_key('detail', 'research.Research', 'RES-1'), changed)
+        self.assertEqual(versioned_key('detail', 'research.Research', 'RES-2'), unchanged)
+        self.assertNotEqual(versioned_key('list', 'research.Research'), listing)
+
+
+class GetOrComputeTests(TestCase):
+    """Fresh, stale and contended reads of get_or_compute()"""
+
+    key = 'stampede-test'
+
+    def setUp(self):
+        cache.clear()
+        self.compute = mock.Mock(return_value='computed')
+
+    def _cache_entry(self, value, expires_in, duration=0.0):
+        cache.set(self.key, (value, time.time() + expires_in, duration), 300)
+
+    def test_cold_miss_computes_once(self):
+        self.assertEqual(get_or_compute(self.key, self.compute, 60), 'computed')
+        self.assertEqual(get_or_compute(self.key, self.compute, 60), 'computed')
+        self.compute.assert_called_once_with()
+        self.assertIsNone(cache.get(stampede._lock_key(self.key)))
+
+    def test_none_is_cached(self):
+        self.compute.return_value = None
+        get_or_compute(self.key, self.compute, 60)
+        self.assertIsNone(get_or_compute(self.key, self.compute, 60))
+        self.compute.assert_called_once_with()
+
+    def test_fresh_value_is_served(self):
+        self._cache_entry('cached', expires_in=60)
+        with mock.patch.object(stampede.tasks, 'submit') as submit:
+            self.assertEqual(get_or_compute(self.key, self.compute, 60), 'cached')
+        self.compute.assert_not_called()
+        submit.assert_not_called()
+
+    def test_stale_value_is_served_while_one_refresh_runs(self):
+        self._cache_entry('stale', expires_in=-1)
+        with mock.patch.object(stampede.tasks, 'submit') as submit:
+            self.assertEqual(get_or_compute(self.key, self.compute, 60), 'stale')
+            self.assertEqual(get_or_compute(self.key, self.compute, 60), 'stale')
+        self.compute.assert_not_called()
+        submit.assert_called_once_with(stampede._refresh, self.key, self.compute, 60, 60)
+
+        # The refresh stores the new value and releases the lock
+        stampede._refresh(self.key, self.compute, 60, 60)
+        self.assertEqual(get_or_compute(self.key, self.compute, 60), 'computed')
+        self.assertIsNone(cache.get(stampede._lock_key(self.key)))
+
+    def test_failed_refresh_is_logged_and_keeps_the_stale_value(self):
+        self._cache_entry('stale', expires_in=-1)
+        cache.add(stampede._lock_key(self.key), 1)
+        self.compute.side_effect = RuntimeError('database is down')
+        with self.assertLogs('apps.caching.stampede', 'ERROR') as logs:
+            stampede._refresh(self.key, self.compute, 60, 60)
+        self.assertIn('database is down', logs.output[0])
+        self.assertIsNone(cache.get(stampede._lock_key(self.key)))
+        with mock.patch.object(stampede.tasks, 'submit') as submit:
+            self.assertEqual(get_or_compute(self.key, self.compute, 60), 'stale')
+        submit.assert_called_once()
+
+    def test_waits_for_the_lock_holder(self):
+        cache.add(stampede._lock_key(self.key), 1)
+
+        def winner_stores(seconds):
+            self._cache_entry('winner', expires_in=60)
+
+        with mock.patch.object(stampede.time, 'sleep', side_effect=winner_stores) as sleep:
+            self.assertEqual(get_or_compute(self.key, self.compute, 60), 'winner')
+        sleep.assert_called_once_with(stampede.WAIT_INTERVAL)
+        self.compute.assert_not_called()
+
+    def test_computes_when_the_lock_holder_fails(self):
+        cache.add(stampede._lock_key(self.key), 1)
+
+        def winner_fails(seconds):
+            cache.delete(stampede._lock_key(self.key))
+
+        with mock.patch.object(stampede.time, 'sleep', side_effect=winner_fails):
+            self.assertEqual(get_or_compute(self.key, self.compute, 60), 'computed')
+        self.compute.assert_called_once_with()
+
+
+class SharedCacheCheckTests(SimpleTestCase):
+    """The per-process LocMemCache is only accepted in DEBUG"""
+
+    locmem = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+    @override_settings(DEBUG=False, CACHES=locmem)
+    def test_local_cache_is_an_error(self):
+        self.assertEqual([error.id for error in check_shared_cache(None)], ['caching.E001'])
+
+    @override_settings(DEBUG=True, CACHES=locmem)
+    def test_local_cache_in_debug(self):
+        self.assertEqual(check_shared_cache(None), [])
+
+    @override_settings(DEBUG=False)
+    def test_configured_cache_is_shared(self):
+        self.assertEqual(check_shared_cache(None), [])
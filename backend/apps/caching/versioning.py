@@ -0,0 +1,73 @@
+"""
+Versioned cache keys.
+
+Every cached value derived from a model instance embeds the current version
+of that instance in its key, and every list or aggregate embeds the version
+of the whole model. Saving or deleting an instance bumps both (signals.py),
+so readers build new keys and never see stale entries, while entries of
+unchanged instances stay valid. Superseded entries are never read again and
+expire on their own.
+
+Versions start from the current time rather than 1, so a version key that
+was evicted can not come back with a number that is still in use.
+"""
+import time
+
+from django.core.cache import cache
+
+# Models whose cache entries are versioned, with the field that identifies
+# an instance in cache keys (the one the cached views look instances up by)
+VERSIONED_MODELS = {
+    'experiments.Experiment': 'experiment_id',
+    'research.Research': 'research_id',
+    'publication.Publication': 'pk',
+    'data.Dataset': 'id',
+}
+
+
+def _version_key(label, identifier=None):
+    if identifier is None:
+        return f'version:{label}'
+    return f'version:{label}:{identifier}'
+
+
+def get_version(label, identifier=None):
+    """Current version of a model, or of one instance when ``identifier`` is given"""
+    key = _version_key(label, identifier)
+    version = cache.get(key)
+    if version is None:
+        cache.add(key, time.time_ns(), None)
+        version = cache.get(key)
+    return version
+
+
+def bump_version(label, identifier=None):
+    key = _version_key(label, identifier)
+    try:
+        cache.incr(key)
+    except ValueError:
+        # Not cached: any new starting value is newer than the evicted one
+        cache.set(key, time.time_ns(), None)
+
+
+def versioned_key(name, label, identifier=None):
+    """Cache key for ``name`` that changes whenever the model (or instance) changes"""
+    version = get_version(label, identifier)
+    if identifier is None:
+        return f'{name}:{label}:v{version}'
+    return f'{name}:{label}:{identifier}:v{version}'
+
+
+def instance_changed(instance):
+    """Invalidate the cache entries of a saved or deleted instance"""
+    label = instance._meta.label
+    bump_version(label, getattr(instance, VERSIONED_MODELS[label]))
+    bump_version(label)
+
+
+def instances_changed(model, identifiers):
+    """Invalidate the cache entries of instances changed without signals, e.g. by bulk_update()"""
+    label = model._meta.label
+    for identifier in identifiers:
+        bump_version(label, identifier)
+    bump_version(label)
@@ -1,80 +1,69 @@
-from django.core.cache import cache
 from django.http import JsonResponse
-from django.core.paginator import Paginator
-from django.views.decorators.cache import cache_page
 
+from apps.common.pagination import paginate_by_cursor
 from apps.experiments.models import Experiment
+from .stampede import get_or_compute
+from .versioning import versioned_key
+
 
-# Cache the results for 5 minutes (300 seconds)
-@cache_page(300)
 def get_data_types(request):
     """Return all data types with caching"""
     from apps.data.models import DataType
-    data_types = list(DataType.objects.all().values())
+    data_types = get_or_compute(
+        'data_types', lambda: list(DataType.objects.all().values()), 300)
     return JsonResponse({"data_types": data_types})
 
 
 def get_paginated_experiments(request):
-    """Return paginated experiment data"""
-    page = request.GET.get('page', 1)
-    page_size = request.GET.get('page_size', 10)
-    
-    # Get all experiments
-    experiments = Experiment.objects.all().order_by('-date_created')
-    
-    # Paginate the results
-    paginator = Paginator(experiments, page_size)
-    current_page = paginator.get_page(page)
-    
-    # Create the response data
-    data = {
-        'count': paginator.count,
-        'num_pages': paginator.num_pages,
-        'current_page': int(page),
-        'has_next': current_page.has_next(),
-        'has_previous': current_page.has_previous(),
-        'results': list(current_page.object_list.values(
-            'experiment_id', 'title', 'experiment_type', 'date_created'
-        ))
-    }
-    
+    """
+    Return paginated experiment data, newest first.
+    Pass the returned ``next_cursor``/``previous_cursor`` as ``?cursor=``.
+    """
+    def load_page():
+        experiments = Experiment.objects.values(
+            'id', 'experiment_id', 'title', 'experiment_type', 'created_at')
+        data = paginate_by_cursor(experiments, request.GET)
+        for row in data['results']:
+            del row['id']
+        return data
+
+    # Pages are cached until any experiment changes
+    params = '&'.join(f'{key}={request.GET.get(key, "")}' for key in ('cursor', 'page_size', 'count'))
+    cache_key = f"{versioned_key('experiment_page', 'experiments.Experiment')}:{params}"
+    try:
+        data = get_or_compute(cache_key, load_page, 600)
+    except ValueError as e:
+        return JsonResponse({'error': str(e)}, status=400)
     return JsonResponse(data)
 
 
+def _load_experiment(experiment_id):
+    data = Experiment.objects.filter(experiment_id=experiment_id).first()
+    if data is None:
+        return None
+    return {
+        'experiment_id': data.experiment_id,
+        'title': data.title,
+        'description': data.description,
+        'experiment_type': data.experiment_type,
+        'scan_rate': data.scan_rate,
+        'electrode_material': data.electrode_material,
+        'electrolyte': data.electrolyte,
+        'temperature': data.temperature,
+        # Exclude large data_points to save cache space
+        'peak_anodic_current': data.peak_anodic_current,
+        'peak_cathodic_current': data.peak_cathodic_current,
+        'peak_anodic_potential': data.peak_anodic_potential,
+        'peak_cathodic_potential': data.peak_cathodic_potential,
+    }
+
+
 def get_cached_experiment(request, experiment_id):
     """Get a single experiment with caching"""
-    # Try to get from cache first
-    cache_key = f'experiment_{experiment_id}'
-    experiment = cache.get(cache_key)
-    
-    if not experiment:
-        # If not in cache, get from database
-        try:
-            data = Experiment.objects.get(experiment_id=experiment_id)
-            experiment = {
-                'experiment_id': data.experiment_id,
-                'title': data.title,
-                'description': data.description,
-                'experiment_type': data.experiment_type,
-                'scan_rate': data.scan_rate,
-                'electrode_material': data.electrode_material,
-                'electrolyte': data.electrolyte,
-                'temperature': data.temperature,
-                # Exclude large data_points to save cache space
-                'peak_anodic_current': data.peak_anodic_current,
-                'peak_cathodic_current': data.peak_cathodic_current,
-                'peak_anodic_potential': data.peak_anodic_potential,
-                'peak_cathodic_potential': data.peak_cathodic_potential,
-            }
-            # Save to cache for 10 minutes
-            cache.set(cache_key, experiment, 600)
-        except Experiment.DoesNotExist:
-            return JsonResponse({'error': 'Experiment not found'}, status=404)
-    
+    # The key changes whenever the experiment is saved or deleted, so a hit
+    # is never outdated and unknown IDs can be cached as well
+    cache_key = versioned_key('experiment', 'experiments.Experiment', experiment_id)
+    experiment = get_or_compute(cache_key, lambda: _load_experiment(experiment_id), 600)
+    if experiment is None:
+        return JsonResponse({'error': 'Experiment not found'}, status=404)
     return JsonResponse(experiment)
-
-
-def clear_cache(request):
-    """Clear the cache"""
-    cache.clear()
-    return JsonResponse({'message': 'Cache cleared'})
\ No newline at end of file
@@ -0,0 +1,56 @@
+import tempfile
+
+import xlsxwriter
+from django.http import FileResponse
+
+# Rows per worksheet in .xlsx, including the header row
+EXCEL_MAX_ROWS = 1048576
+EXCEL_CONTENT_TYPE = 'application/vnd.openxmlformats-officedocument.spreadsheetml.sheet'
+
+
+def write_workbook(sheets):
+    """
+    Write an .xlsx workbook row by row into a temporary file and return the
+    open file, rewound to the start.
+
+    ``sheets`` is an iterable of ``(name, header, rows)``; ``header`` may be
+    None and ``rows`` may be any iterable of sequences. The workbook is written
+    in xlsxwriter's ``constant_memory`` mode, so only the current row is held in
+    memory. Sheets longer than Excel's row limit continue on "<name> (2)", ...
+    """
+    output = tempfile.TemporaryFile()
+    workbook = xlsxwriter.Workbook(output, {'constant_memory': True})
+    header_format = workbook.add_format(
+        {'bold': True, 'bg_color': '#D9E1F2', 'border': 1})
+
+    for name, header, rows in sheets:
+        part = 1
+        worksheet, row_num = _add_sheet(workbook, name, part, header, header_format)
+        for row in rows:
+            if row_num == EXCEL_MAX_ROWS:
+                part += 1
+                worksheet, row_num = _add_sheet(
+                    workbook, name, part, header, header_format)
+            worksheet.write_row(row_num, 0, row)
+            row_num += 1
+
+    workbook.close()
+    output.seek(0)
+    return output
+
+
+def _add_sheet(workbook, name, part, header, header_format):
+    if part > 1:
+        suffix = f' ({part})'
+        name = name[:31 - len(suffix)] + suffix
+    worksheet = workbook.add_worksheet(name[:31])
+    if header is None:
+        return worksheet, 0
+    worksheet.write_row(0, 0, header, header_format)
+    return worksheet, 1
+
+
+def excel_response(output, filename):
+    """Stream a workbook file returned by write_workbook as an attachment"""
+    return FileResponse(
+        output, as_attachment=True, filename=filename, content_type=EXCEL_CONTENT_TYPE)
@@ -0,0 +1,95 @@
+"""
+Facet counts for filtered querysets.
+
+All facets are counted with a single GROUP BY over the combination of the
+facet columns; the per-facet totals are then summed from those rows. The
+number of rows is the number of distinct combinations, which stays small for
+the low-cardinality columns facets are used for. Facets over a to-many
+relation would repeat rows in that combination, so each of them is counted
+with a GROUP BY of its own.
+"""
+import hashlib
+import json
+from collections import Counter
+
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db.models import Count
+
+
+def _is_multivalued(model, path):
+    """Whether the field lookup ``path`` crosses a to-many relation of ``model``"""
+    for name in path.split('__'):
+        try:
+            field = model._meta.get_field(name)
+        except FieldDoesNotExist:
+            return False
+        if field.one_to_many or field.many_to_many:
+            return True
+        if not field.is_relation:
+            return False
+        model = field.related_model
+    return False
+
+
+def _sorted_counts(counter):
+    return [{'value': value, 'count': count}
+            for value, count in sorted(counter.items(), key=lambda item: (-item[1], str(item[0])))]
+
+
+def facet_counts(queryset, fields):
+    """
+    Count the rows of ``queryset`` per value of each facet.
+    ``fields`` maps facet names to field lookups (or expressions). Returns
+    ``{facet: [{'value': ..., 'count': n}, ...]}``, most frequent first.
+    """
+    queryset = queryset.order_by()
+    multivalued = {name: path for name, path in fields.items()
+                   if isinstance(path, str) and _is_multivalued(queryset.model, path)}
+    lookups = {name: path for name, path in fields.items()
+               if isinstance(path, str) and name not in multivalued}
+    expressions = {name: path for name, path in fields.items() if not isinstance(path, str)}
+
+    counters = {name: Counter() for name in fields}
+    if lookups or expressions:
+        rows = queryset.values(*lookups.values(), **expressions).annotate(facet_count=Count('pk'))
+        for row in rows:
+            for name in (*lookups, *expressions):
+                value = row[lookups[name]] if name in lookups else row[name]
+                if value not in (None, ''):
+                    counters[name][value] += row['facet_count']
+
+    for name, path in multivalued.items():
+        rows = queryset.values(path).annotate(facet_count=Count('pk', distinct=True))
+        for row in rows:
+            if row[path] not in (None, ''):
+                counters[name][row[path]] += row['facet_count']
+
+    return {name: _sorted_counts(counter) for name, counter in counters.items()}
+
+
+def facet_cache_key(namespace, params, label):
+    """
+    Cache key for the facets of a parameter set, independent of order and
+    spacing, that changes whenever the model ``label`` changes
+    """
+    from apps.caching.versioning import versioned_key
+
+    normalized = sorted(
+        (key, ' '.join(str(value).split()))
+        for key, value in params.items() if value not in (None, ''))
+    digest = hashlib.sha1(json.dumps(normalized).encode('utf-8')).hexdigest()
+    return versioned_key(f'facets:{namespace}:{digest}', label)
+
+
+def cached_facet_counts(queryset, fields, namespace, params):
+    """
+    facet_counts(), cached for ``settings.FACET_CACHE_TIMEOUT`` per normalized
+    ``params`` and version of the queryset's model
+    """
+    from apps.caching.stampede import get_or_compute
+
+    return get_or_compute(
+        facet_cache_key(namespace, params, queryset.model._meta.label),
+        lambda: facet_counts(queryset, fields),
+        settings.FACET_CACHE_TIMEOUT)
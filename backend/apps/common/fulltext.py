@@ -0,0 +1,199 @@
+"""
+Full-text indexes over model text columns.
+
+On SQLite the indexed columns are mirrored into an FTS5 table keyed by the
+row's primary key; callers keep it current with index()/unindex() (usually
+from post_save/post_delete signals). On PostgreSQL a GIN index over a
+weighted ``tsvector`` of the same columns is maintained by the database
+itself, so index()/unindex() do nothing there.
+
+Other databases, or an SQLite build without FTS5 or older than 3.35, fall
+back to ``icontains``.
+"""
+import re
+
+from django.apps import apps
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.db.models import BooleanField, FloatField, Q, Value
+from django.db.models.expressions import RawSQL
+
+SEARCH_CONFIG = 'english'
+# bm25() column weights on SQLite matching PostgreSQL's weight classes
+BM25_WEIGHTS = {'A': 10.0, 'B': 4.0, 'C': 1.0, 'D': 0.5}
+
+_TOKEN_RE = re.compile(r'\w+')
+
+# Every FullTextIndex, so they can be rebuilt together
+registry = []
+
+
+def tokenize(query):
+    """Split a user query into the word tokens an index is searched with"""
+    return _TOKEN_RE.findall(query.lower())
+
+
+class FullTextIndex:
+    """
+    Full-text index over ``fields`` (``{field: weight class}``) of ``model``
+    (an ``'app_label.ModelName'`` label).
+    """
+
+    def __init__(self, model, fields, name):
+        self.model_label = model
+        self.fields = dict(fields)
+        # FTS5 table on SQLite, GIN index on PostgreSQL
+        self.table_name = f'{name}_fts'
+        self.index_name = f'{name}_search_idx'
+        # Aliases whose index has been checked, with whether it is usable
+        self._ready = {}
+        registry.append(self)
+
+    @property
+    def model(self):
+        return apps.get_model(self.model_label)
+
+    def _vector(self, table):
+        return ' || '.join(
+            f"setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(\"{table}\".\"{field}\", '')), "
+            f"'{weight}')"
+            for field, weight in self.fields.items())
+
+    def is_supported(self, using=DEFAULT_DB_ALIAS):
+        """Whether the database has a usable full-text index"""
+        if using not in self._ready:
+            connection = connections[using]
+            if connection.vendor == 'sqlite':
+                # Ranking needs MATERIALIZED common table expressions (3.35)
+                self._ready[using] = (
+                    connection.Database.sqlite_version_info >= (3, 35) and
+                    self.table_name in connection.introspection.table_names())
+            else:
+                self._ready[using] = connection.vendor == 'postgresql'
+        return self._ready[using]
+
+    def ensure(self, using=DEFAULT_DB_ALIAS):
+        """Create the index if it does not exist yet; True if it was created"""
+        connection = connections[using]
+        table = self.model._meta.db_table
+        self._ready.pop(using, None)
+        with connection.cursor() as cursor:
+            if table not in connection.introspection.table_names(cursor):
+                # post_migrate also runs when the model's table was not created
+                return False
+            if connection.vendor == 'sqlite':
+                if self.table_name in connection.introspection.table_names(cursor):
+                    return False
+                try:
+                    cursor.execute(
+                        f'CREATE VIRTUAL TABLE "{self.table_name}" USING fts5('
+                        f'{", ".join(self.fields)}, tokenize="unicode61")')
+                except Exception:
+                    # SQLite built without FTS5: searches use icontains
+                    return False
+                self._fill_sqlite(cursor)
+                return True
+            if connection.vendor == 'postgresql':
+                cursor.execute(
+                    f'CREATE INDEX IF NOT EXISTS "{self.index_name}" ON "{table}" '
+                    f'USING GIN (({self._vector(table)}))')
+                return True
+        return False
+
+    def rebuild(self, using=DEFAULT_DB_ALIAS):
+        """Re-index every row"""
+        connection = connections[using]
+        if self.ensure(using):
+            # A newly created index already covers every row
+            return
+        with connection.cursor() as cursor:
+            if connection.vendor == 'sqlite' and self.is_supported(using):
+                cursor.execute(f'DELETE FROM "{self.table_name}"')
+                self._fill_sqlite(cursor)
+            elif connection.vendor == 'postgresql':
+                cursor.execute(f'REINDEX INDEX "{self.index_name}"')
+
+    def _fill_sqlite(self, cursor):
+        meta = self.model._meta
+        columns = ', '.join(self.fields)
+        cursor.execute(
+            f'INSERT INTO "{self.table_name}" (rowid, {columns}) '
+            f'SELECT "{meta.pk.column}", {columns} FROM "{meta.db_table}"')
+
+    def _uses_table(self, using):
+        return connections[using].vendor == 'sqlite' and self.is_supported(using)
+
+    def index(self, instance, using=DEFAULT_DB_ALIAS):
+        """Add or refresh one row in the SQLite index"""
+        if not self._uses_table(using):
+            return
+        values = [getattr(instance, field) for field in self.fields]
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM "{self.table_name}" WHERE rowid = %s', [instance.pk])
+            cursor.execute(
+                f'INSERT INTO "{self.table_name}" (rowid, {", ".join(self.fields)}) '
+                f'VALUES (%s, {", ".join(["%s"] * len(self.fields))})',
+                [instance.pk] + values)
+
+    def unindex(self, pk, using=DEFAULT_DB_ALIAS):
+        """Remove one row from the SQLite index"""
+        if not self._uses_table(using):
+            return
+        with connections[using].cursor() as cursor:
+            cursor.execute(
+                f'DELETE FROM "{self.table_name}" WHERE rowid = %s', [pk])
+
+    def search(self, queryset, query):
+        """
+        Restrict a queryset to the rows matching ``query`` and annotate them
+        with ``search_rank`` (higher is better).
+        Every word must match; the last one also matches as a prefix, so
+        partial input works while typing. The queryset is not reordered.
+        """
+        tokens = tokenize(query)
+        if not tokens:
+            return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+
+        using = queryset.db
+        vendor = connections[using].vendor
+        meta = self.model._meta
+        table = meta.db_table
+
+        if vendor == 'sqlite' and self.is_supported(using):
+            match = ' '.join(f'"{token}"' for token in tokens) + '*'
+            weights = ', '.join(
+                str(BM25_WEIGHTS[weight]) for weight in self.fields.values())
+            # MATCH runs once for the filter and once, materialized, for the
+            # ranks; each row then looks its rank up by rowid
+            return queryset.filter(
+                pk__in=RawSQL(
+                    f'SELECT rowid FROM "{self.table_name}" '
+                    f'WHERE "{self.table_name}" MATCH %s', [match])
+            ).annotate(
+                # bm25() is lower for better matches
+                search_rank=RawSQL(
+                    f'WITH ranks AS MATERIALIZED ('
+                    f'SELECT rowid AS id, -bm25("{self.table_name}", {weights}) AS rank '
+                    f'FROM "{self.table_name}" WHERE "{self.table_name}" MATCH %s) '
+                    f'SELECT rank FROM ranks WHERE ranks.id = "{table}"."{meta.pk.column}"',
+                    [match], output_field=FloatField())
+            )
+
+        if vendor == 'postgresql':
+            match = ' & '.join(tokens) + ':*'
+            vector = self._vector(table)
+            return queryset.filter(
+                RawSQL(f"{vector} @@ to_tsquery('{SEARCH_CONFIG}', %s)", [match],
+                       output_field=BooleanField())
+            ).annotate(
+                search_rank=RawSQL(
+                    f"ts_rank({vector}, to_tsquery('{SEARCH_CONFIG}', %s))",
+                    [match], output_field=FloatField())
+            )
+
+        condition = Q()
+        for token in tokens:
+            condition &= Q(*[Q(**{f'{field}__icontains': token}) for field in self.fields],
+                           _connector=Q.OR)
+        return queryset.filter(condition).annotate(
+            search_rank=Value(0.0, output_field=FloatField()))
@@ -0,0 +1,20 @@
+from django.db import models
+
+
+class PayloadQuerySet(models.QuerySet):
+    def with_payload(self):
+        """Load every column, including the model's PAYLOAD_FIELDS"""
+        return self.defer(None)
+
+
+class MetadataManager(models.Manager.from_queryset(PayloadQuerySet)):
+    """
+    Default manager that leaves the model's large ``PAYLOAD_FIELDS`` (raw
+    file text, legacy JSON data) out of every query, so listings only move
+    metadata. Code that needs the payload asks for it with
+    ``with_payload()``; a deferred field that is accessed anyway is loaded
+    with one extra query for that row.
+    """
+
+    def get_queryset(self):
+        return super().get_queryset().defer(*self.model.PAYLOAD_FIELDS)
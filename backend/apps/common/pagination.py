@@ -0,0 +1,111 @@
+"""
+Keyset (cursor) pagination.
+
+Pages are ordered by ``(field, pk)``, newest first, and a page is selected
+with a WHERE on that pair instead of an OFFSET, so every page costs the same
+as the first one and no COUNT(*) is needed. Cursors are opaque strings that
+encode the position of the first or last row of the current page.
+"""
+import base64
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connections
+from django.db.models import Q
+
+DEFAULT_PAGE_SIZE = 10
+MAX_PAGE_SIZE = 100
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def encode_cursor(value, pk, direction):
+    if hasattr(value, 'isoformat'):
+        # Keep microseconds, which DjangoJSONEncoder would truncate
+        value = value.isoformat()
+    payload = json.dumps([value, pk, direction], cls=DjangoJSONEncoder)
+    return base64.urlsafe_b64encode(payload.encode('utf-8')).decode('ascii').rstrip('=')
+
+
+def decode_cursor(cursor, field):
+    """Return ``(value, pk, direction)``; ``field`` converts the stored value back"""
+    try:
+        padded = cursor + '=' * (-len(cursor) % 4)
+        value, pk, direction = json.loads(base64.urlsafe_b64decode(padded))
+        if direction not in ('next', 'previous'):
+            raise ValueError(direction)
+        return field.to_python(value), pk, direction
+    except Exception:
+        raise InvalidCursor('Invalid cursor')
+
+
+def estimate_count(queryset):
+    """
+    Row count of a queryset; on PostgreSQL the planner's estimate, which does
+    not scan the matching rows
+    """
+    if connections[queryset.db].vendor == 'postgresql':
+        plan = json.loads(queryset.order_by().explain(format='json'))
+        if isinstance(plan, list):
+            return int(plan[0]['Plan']['Plan Rows'])
+    return queryset.count()
+
+
+def _position(item, field, pk_name):
+    if isinstance(item, dict):
+        return item[field], item[pk_name]
+    return getattr(item, field), item.pk
+
+
+def paginate_by_cursor(queryset, params, field='created_at', default_page_size=DEFAULT_PAGE_SIZE):
+    """
+    Return one page of ``queryset`` (model instances or ``values()`` rows,
+    which must include ``field`` and the primary key) selected by the
+    ``cursor`` and ``page_size`` query parameters.
+
+    ``count=approximate`` or ``count=exact`` adds the total number of rows.
+    Raises InvalidCursor or ValueError for malformed parameters.
+    """
+    model_field = queryset.model._meta.get_field(field)
+    pk_name = queryset.model._meta.pk.name
+    page_size = max(1, min(int(params.get('page_size') or default_page_size), MAX_PAGE_SIZE))
+
+    cursor = params.get('cursor')
+    direction = 'next'
+    ordered = queryset.order_by(f'-{field}', f'-{pk_name}')
+    if cursor:
+        value, pk, direction = decode_cursor(cursor, model_field)
+        if direction == 'next':
+            ordered = ordered.filter(
+                Q(**{f'{field}__lt': value}) | Q(**{field: value, f'{pk_name}__lt': pk}))
+        else:
+            # Walk backwards from the cursor, then restore the newest-first order
+            ordered = queryset.order_by(field, pk_name).filter(
+                Q(**{f'{field}__gt': value}) | Q(**{field: value, f'{pk_name}__gt': pk}))
+
+    rows = list(ordered[:page_size + 1])
+    has_more = len(rows) > page_size
+    rows = rows[:page_size]
+    if direction == 'previous':
+        rows.reverse()
+        has_next, has_previous = bool(cursor), has_more
+    else:
+        has_next, has_previous = has_more, bool(cursor)
+
+    page = {
+        'results': rows,
+        'page_size': page_size,
+        'has_next': has_next,
+        'has_previous': has_previous,
+        'next_cursor': encode_cursor(*_position(rows[-1], field, pk_name), 'next') if has_next and rows else None,
+        'previous_cursor': encode_cursor(*_position(rows[0], field, pk_name), 'previous') if has_previous and rows else None,
+    }
+
+    count = params.get('count')
+    if count == 'exact':
+        page['count'] = queryset.count()
+    elif count == 'approximate':
+        page['count'] = estimate_count(queryset)
+    return page
@@ -0,0 +1,26 @@
+"""
+Shared worker pool for work that should not run on the request thread
+(bulk exports, dataset comparisons, ...). Jobs record their own state in
+the database, so callers only need to submit and poll.
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+
+_executor = ThreadPoolExecutor(
+    max_workers=settings.BACKGROUND_WORKERS, thread_name_prefix='background')
+
+
+def _run(func, args, kwargs):
+    # Worker threads get their own connection, which must not outlive the job
+    close_old_connections()
+    try:
+        return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+def submit(func, *args, **kwargs):
+    """Run ``func(*args, **kwargs)`` on the background pool"""
+    return _executor.submit(_run, func, args, kwargs)
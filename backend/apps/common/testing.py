@@ -0,0 +1,76 @@
+import os
+import re
+import shutil
+import tempfile
+import zipfile
+from contextlib import contextmanager
+
+from django.apps import apps
+from django.db import connection
+from django.test.utils import CaptureQueriesContext, override_settings
+
+# For tests that count queries: the database cache would add queries of its own
+LOCAL_CACHES = {'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+
+
+def xlsx_sheet_rows(file):
+    """``{sheet name: number of rows}`` of an .xlsx file, in workbook order"""
+    with zipfile.ZipFile(file) as workbook:
+        names = re.findall(r'<sheet name="([^"]*)"', workbook.read('xl/workbook.xml').decode('utf-8'))
+        return {
+            name: workbook.read(f'xl/worksheets/sheet{number}.xml').decode('utf-8').count('<row ')
+            for number, name in enumerate(names, start=1)
+        }
+
+
+def payload_columns():
+    """Quoted ``table.column`` of the PAYLOAD_FIELDS of every model that declares them"""
+    quote = connection.ops.quote_name
+    columns = []
+    for model in apps.get_models():
+        for name in getattr(model, 'PAYLOAD_FIELDS', ()):
+            column = model._meta.get_field(name).column
+            columns.append(f'{quote(model._meta.db_table)}.{quote(column)}')
+    return columns
+
+
+class PayloadAssertionsMixin:
+    """TestCase mixin for checking that views only load metadata"""
+
+    @contextmanager
+    def assertNoPayloadLoaded(self):
+        """Fail if a query in the block selects a PAYLOAD_FIELDS column"""
+        columns = payload_columns()
+        with CaptureQueriesContext(connection) as context:
+            yield context
+        for query in context.captured_queries:
+            sql = query['sql']
+            if not sql.startswith('SELECT'):
+                continue
+            # Filtering or ordering on a payload column does not transfer it
+            selected = sql.split(' FROM ', 1)[0]
+            loaded = [column for column in columns if column in selected]
+            if loaded:
+                self.fail(f"Query loads payload column(s) {', '.join(loaded)}: {sql}")
+
+
+class TemporaryMediaMixin:
+    """TestCase mixin that points MEDIA_ROOT and the stores under it at a temporary directory"""
+
+    @classmethod
+    def setUpClass(cls):
+        cls._media_root = tempfile.mkdtemp(prefix='test-media-')
+        cls._media_settings = override_settings(
+            MEDIA_ROOT=cls._media_root,
+            TRACE_STORE_ROOT=os.path.join(cls._media_root, 'traces'),
+            EXPORT_ROOT=os.path.join(cls._media_root, 'exports'),
+            CONVERSION_CACHE_ROOT=os.path.join(cls._media_root, 'conversions'),
+        )
+        cls._media_settings.enable()
+        super().setUpClass()
+
+    @classmethod
+    def tearDownClass(cls):
+        super().tearDownClass()
+        cls._media_settings.disable()
+        shutil.rmtree(cls._media_root, ignore_errors=True)
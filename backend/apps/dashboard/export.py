@@ -1,26 +1,32 @@
-from django.http import HttpResponse, JsonResponse
+from django.http import JsonResponse, StreamingHttpResponse
 import csv
+import io
 import json
-import pandas as pd
-from io import BytesIO
-import datetime
+import textwrap
 
+from apps.common.excel import excel_response, write_workbook
 from apps.experiments.models import Experiment
 
 
-def export_experiment_csv(request, experiment_id):
-    """Export a single experiment as CSV"""
-    try:
-        experiment = Experiment.objects.get(experiment_id=experiment_id)
-    except Experiment.DoesNotExist:
-        return JsonResponse({'error': 'Experiment not found'}, status=404)
+# Number of data points serialized per streamed chunk
+EXPORT_CHUNK_POINTS = 10000
 
-    # Create the HttpResponse object with CSV header
-    response = HttpResponse(content_type='text/csv')
-    response[
-        'Content-Disposition'] = f'attachment; filename="{experiment.experiment_id}_{experiment.title.replace(" ", "_")}.csv"'
 
-    writer = csv.writer(response)
+def _iter_trace_chunks(experiment):
+    """Yield the experiment's trace in slices, read from the memory-mapped store"""
+    trace = experiment.get_trace(mmap=True)
+    for offset in range(0, len(trace), EXPORT_CHUNK_POINTS):
+        yield trace[offset:offset + EXPORT_CHUNK_POINTS]
+
+
+def _export_filename(experiment, extension):
+    return f'{experiment.experiment_id}_{experiment.title.replace(" ", "_")}.{extension}'
+
+
+def experiment_csv_chunks(experiment):
+    """Yield the CSV export of an experiment as text chunks"""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
 
     # Write metadata as header rows
     writer.writerow(['Experiment ID', experiment.experiment_id])
@@ -31,34 +37,46 @@ def export_experiment_csv(request, experiment_id):
     writer.writerow(['Electrode Material', experiment.electrode_material])
     writer.writerow(['Electrolyte', experiment.electrolyte])
     writer.writerow(['Temperature (°C)', experiment.temperature])
-    writer.writerow(['Date Created', experiment.date_created])
+    writer.writerow(['Date Created', experiment.created_at])
     writer.writerow([])  # Empty row as separator
 
     # Write data headers
     data_headers = ['Potential (V)', 'Current (μA)', 'Time (s)']
     writer.writerow(data_headers)
 
-    # Write data points
-    data_points = experiment.data_points
-    for point in data_points:
-        writer.writerow([
-            point.get('potential', ''),
-            point.get('current', ''),
-            point.get('time', '')
-        ])
+    # Write data points one chunk at a time
+    for chunk in _iter_trace_chunks(experiment):
+        columns = chunk.to_columns()
+        writer.writerows(
+            zip(columns['potential'], columns['current'], columns['time']))
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
 
-    return response
+    yield buffer.getvalue()
 
 
-def export_experiment_json(request, experiment_id):
-    """Export a single experiment as JSON"""
+def export_experiment_csv(request, experiment_id):
+    """Export a single experiment as CSV, streamed in chunks of data points"""
     try:
         experiment = Experiment.objects.get(experiment_id=experiment_id)
     except Experiment.DoesNotExist:
         return JsonResponse({'error': 'Experiment not found'}, status=404)
 
-    # Create the data dictionary
-    data = {
+    response = StreamingHttpResponse(
+        experiment_csv_chunks(experiment), content_type='text/csv')
+    response[
+        'Content-Disposition'] = f'attachment; filename="{_export_filename(experiment, "csv")}"'
+    return response
+
+
+def experiment_json_chunks(experiment):
+    """
+    Yield the JSON export of an experiment as text chunks.
+    Produces the same document as ``json.dump(data, fp, indent=4)`` with
+    data_points as the last key, without building the full list in memory.
+    """
+    metadata = {
         'experiment_id': experiment.experiment_id,
         'title': experiment.title,
         'description': experiment.description,
@@ -67,80 +85,72 @@ def export_experiment_json(request, experiment_id):
         'electrode_material': experiment.electrode_material,
         'electrolyte': experiment.electrolyte,
         'temperature': experiment.temperature,
-        'date_created': experiment.date_created.isoformat(),
-        'date_updated': experiment.date_updated.isoformat(),
+        'date_created': experiment.created_at.isoformat(),
+        'date_updated': experiment.updated_at.isoformat(),
         'peak_anodic_current': experiment.peak_anodic_current,
         'peak_cathodic_current': experiment.peak_cathodic_current,
         'peak_anodic_potential': experiment.peak_anodic_potential,
         'peak_cathodic_potential': experiment.peak_cathodic_potential,
-        'data_points': experiment.data_points
     }
+    # Reopen the metadata object to append the data_points array
+    yield json.dumps(metadata, indent=4)[:-2] + ',\n    "data_points": ['
 
-    # Create the HttpResponse object with JSON header
-    response = HttpResponse(content_type='application/json')
-    response[
-        'Content-Disposition'] = f'attachment; filename="{experiment.experiment_id}_{experiment.title.replace(" ", "_")}.json"'
+    empty = True
+    for chunk in _iter_trace_chunks(experiment):
+        # Each chunk is dumped as a list, unwrapped and indented one level
+        # deeper so the items line up as members of data_points
+        items = json.dumps(chunk.to_records(), indent=4)[2:-2]
+        yield ('\n' if empty else ',\n') + textwrap.indent(items, '    ')
+        empty = False
+
+    yield ']\n}' if empty else '\n    ]\n}'
 
-    # Write the JSON data
-    json.dump(data, response, indent=4)
 
+def export_experiment_json(request, experiment_id):
+    """Export a single experiment as JSON, streamed in chunks of data points"""
+    try:
+        experiment = Experiment.objects.get(experiment_id=experiment_id)
+    except Experiment.DoesNotExist:
+        return JsonResponse({'error': 'Experiment not found'}, status=404)
+
+    response = StreamingHttpResponse(
+        experiment_json_chunks(experiment), content_type='application/json')
+    response[
+        'Content-Disposition'] = f'attachment; filename="{_export_filename(experiment, "json")}"'
     return response
 
 
+def _excel_data_rows(experiment):
+    for chunk in _iter_trace_chunks(experiment):
+        columns = chunk.to_columns()
+        yield from zip(columns['potential'], columns['current'], columns['time'])
+
+
 def export_experiment_excel(request, experiment_id):
-    """Export a single experiment as Excel"""
+    """
+    Export a single experiment as Excel.
+    The workbook is written row by row to a temporary file and streamed out;
+    data beyond Excel's row limit continues on additional sheets.
+    """
     try:
         experiment = Experiment.objects.get(experiment_id=experiment_id)
     except Experiment.DoesNotExist:
         return JsonResponse({'error': 'Experiment not found'}, status=404)
 
-    # Create a pandas DataFrame with the metadata
-    metadata = {
-        'Property': [
-            'Experiment ID', 'Title', 'Description', 'Experiment Type',
-            'Scan Rate (mV/s)', 'Electrode Material', 'Electrolyte',
-            'Temperature (°C)', 'Date Created'
-        ],
-        'Value': [
-            experiment.experiment_id, experiment.title, experiment.description,
-            experiment.experiment_type, experiment.scan_rate, experiment.electrode_material,
-            experiment.electrolyte, experiment.temperature, experiment.date_created
-        ]
-    }
-    metadata_df = pd.DataFrame(metadata)
-
-    # Create a pandas DataFrame with the data points
-    data_points = experiment.data_points
-    data_df = pd.DataFrame(data_points)
-
-    # Create an Excel writer
-    output = BytesIO()
-    with pd.ExcelWriter(output, engine='xlsxwriter') as writer:
-        metadata_df.to_excel(writer, sheet_name='Metadata', index=False)
-        data_df.to_excel(writer, sheet_name='Data', index=False)
-
-        # Get the xlsxwriter workbook and worksheet objects
-        workbook = writer.book
-        metadata_worksheet = writer.sheets['Metadata']
-        data_worksheet = writer.sheets['Data']
-
-        # Add some formatting
-        header_format = workbook.add_format(
-            {'bold': True, 'bg_color': '#D9E1F2', 'border': 1})
-
-        # Apply the header format to the metadata sheet
-        for col_num, value in enumerate(metadata_df.columns.values):
-            metadata_worksheet.write(0, col_num, value, header_format)
-
-        # Apply the header format to the data sheet
-        for col_num, value in enumerate(data_df.columns.values):
-            data_worksheet.write(0, col_num, value, header_format)
-
-    # Set up the HTTP response
-    output.seek(0)
-    response = HttpResponse(output.read(
-    ), content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-    response[
-        'Content-Disposition'] = f'attachment; filename="{experiment.experiment_id}_{experiment.title.replace(" ", "_")}.xlsx"'
-
-    return response
+    metadata = [
+        ['Experiment ID', experiment.experiment_id],
+        ['Title', experiment.title],
+        ['Description', experiment.description],
+        ['Experiment Type', experiment.experiment_type],
+        ['Scan Rate (mV/s)', experiment.scan_rate],
+        ['Electrode Material', experiment.electrode_material],
+        ['Electrolyte', experiment.electrolyte],
+        ['Temperature (°C)', experiment.temperature],
+        ['Date Created', experiment.created_at.isoformat()],
+    ]
+
+    output = write_workbook([
+        ('Metadata', ['Property', 'Value'], metadata),
+        ('Data', ['potential', 'current', 'time'], _excel_data_rows(experiment)),
+    ])
+    return excel_response(output, _export_filename(experiment, 'xlsx'))
@@ -4,6 +4,11 @@ import pandas as pd
 import numpy as np
 from django_plotly_dash import DjangoDash
 
+from apps.experiments.downsampling import downsample
+
+# Upper bound on points sent to the browser per trace
+MAX_PLOT_POINTS = 2000
+
 # Keep existing PublicationsViz app
 # ... keep existing code (PublicationsViz app)
 
@@ -155,6 +160,9 @@ def update_graph(plot_type, selected_scan_rates, normalize):
         if normalize == 'yes' and 'Current' in y_title:
             y = y / np.max(np.abs(y))
             y_title = 'Normalized Current'
+
+        # Reduce long series to a shape-preserving subset before plotting
+        x, y = downsample(x.to_numpy(), y.to_numpy(), MAX_PLOT_POINTS)
         
         # Add trace for this scan rate
         fig.add_trace(go.Scatter(
@@ -1,3 +1,172 @@
-from django.test import TestCase
+import csv
+import io
+import json
+from unittest import mock
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.test import RequestFactory, SimpleTestCase, TestCase
+from django.urls import reverse
+
+from apps.common import excel
+from apps.common.excel import write_workbook
+from apps.common.testing import PayloadAssertionsMixin, TemporaryMediaMixin, xlsx_sheet_rows
+from apps.dashboard import export
+from apps.data.models import DataType, FileUpload
+from apps.experiments.models import (
+    Electrode, Experiment, ExperimentFile, Instrument, VoltammetryTechnique)
+
+DATA_POINTS = [{'potential': 0.01 * i, 'current': 1.5 * i, 'time': 0.1 * i} for i in range(25)]
+
+
+class StreamedExportTests(TemporaryMediaMixin, TestCase):
+    """Streamed exports are the same documents the unstreamed ones were"""
+
+    @classmethod
+    def setUpTestData(cls):
+        options = {
+            'researcher': User.objects.create_user(username='researcher', password='secret'),
+            'instrument': Instrument.objects.create(name='Potentiostat'),
+            'electrode': Electrode.objects.create(type='Glassy Carbon'),
+            'voltammetry_technique': VoltammetryTechnique.objects.create(name='Cyclic Voltammetry'),
+            'experiment_type': 'cyclic',
+            'scan_rate': 100,
+        }
+        Experiment.objects.create(
+            experiment_id='EXP-1', title='Ferrocene run', description='Über "quoted"',
+            data_points=DATA_POINTS, **options)
+        Experiment.objects.create(experiment_id='EXP-EMPTY', title='Empty', **options)
+
+    def _body(self, view, experiment_id):
+        response = view(RequestFactory().get('/'), experiment_id)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content).decode('utf-8')
+
+    def test_json_matches_json_dumps(self):
+        # Chunks that do not divide the trace evenly
+        with mock.patch.object(export, 'EXPORT_CHUNK_POINTS', 7):
+            body = self._body(export.export_experiment_json, 'EXP-1')
+        document = json.loads(body)
+        self.assertEqual(body, json.dumps(document, indent=4))
+        self.assertEqual(list(document)[-1], 'data_points')
+        self.assertEqual(len(document['data_points']), len(DATA_POINTS))
+        self.assertEqual(document['data_points'][3]['current'], DATA_POINTS[3]['current'])
+
+    def test_json_without_data_points(self):
+        body = self._body(export.export_experiment_json, 'EXP-EMPTY')
+        document = json.loads(body)
+        self.assertEqual(document['data_points'], [])
+        self.assertEqual(body, json.dumps(document, indent=4))
+
+    def test_csv_has_every_point(self):
+        with mock.patch.object(export, 'EXPORT_CHUNK_POINTS', 7):
+            body = self._body(export.export_experiment_csv, 'EXP-1')
+        rows = list(csv.reader(io.StringIO(body)))
+        header = rows.index(['Potential (V)', 'Current (μA)', 'Time (s)'])
+        data = rows[header + 1:]
+        self.assertEqual(len(data), len(DATA_POINTS))
+        self.assertEqual(float(data[-1][1]), DATA_POINTS[-1]['current'])
+
+
+class WorkbookTests(SimpleTestCase):
+    """Workbooks are written row by row and split at Excel's row limit"""
+
+    def test_sheets_split_at_row_limit(self):
+        rows = ([number, number * 0.5] for number in range(25))
+        with mock.patch.object(excel, 'EXCEL_MAX_ROWS', 10):
+            output = write_workbook([('Data', ['n', 'half'], rows), ('Metadata', None, [['a', 1]])])
+        with output:
+            sheets = xlsx_sheet_rows(output)
+        # Every part repeats the header
+        self.assertEqual(sheets, {'Data': 10, 'Data (2)': 10, 'Data (3)': 8, 'Metadata': 1})
+
+    def test_long_sheet_names_keep_their_suffix(self):
+        name = 'Voltammetry measurements of run 12'
+        with mock.patch.object(excel, 'EXCEL_MAX_ROWS', 2):
+            output = write_workbook([(name, None, [[1], [2], [3]])])
+        with output:
+            sheets = list(xlsx_sheet_rows(output))
+        self.assertEqual(sheets, [name[:31], name[:27] + ' (2)'])
+
+
+class RecentDatasetsTests(PayloadAssertionsMixin, TestCase):
+    """The homepage listing shows upload metadata without the file contents"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='uploader', password='secret')
+        data_type = DataType.objects.create(id='cv', name='Cyclic Voltammetry')
+        for number in range(7):
+            FileUpload.objects.create(
+                file_name=f'run-{number}.csv', content='E,I\n0.1,2.0\n' * 1000,
+                uploaded_by=user, data_type=data_type)
+
+    def test_listing_does_not_load_content(self):
+        with self.assertNoPayloadLoaded():
+            response = self.client.get(reverse('v0:recent_datasets'))
+        self.assertEqual(response.status_code, 200)
+        datasets = response.json()
+        self.assertEqual(len(datasets), 5)
+        self.assertEqual(datasets[0]['author'], 'uploader')
+        self.assertEqual(datasets[0]['category'], 'Cyclic Voltammetry')
+
+
+class SearchFacetTests(TestCase):
+    """Facet counts of the voltammetry search, and their cache"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='researcher', password='secret')
+        options = {
+            'researcher': cls.user,
+            'instrument': Instrument.objects.create(name='Potentiostat'),
+            'electrode': Electrode.objects.create(type='Glassy Carbon'),
+            'voltammetry_technique': VoltammetryTechnique.objects.create(name='Cyclic Voltammetry'),
+            'scan_rate': 100,
+        }
+        cls.first = Experiment.objects.create(
+            experiment_id='EXP-1', title='First', experiment_type='cyclic', electrode_material='Pt', **options)
+        Experiment.objects.create(
+            experiment_id='EXP-2', title='Second', experiment_type='cyclic', electrode_material='Au', **options)
+        Experiment.objects.create(
+            experiment_id='EXP-3', title='Third', experiment_type='square_wave', electrode_material='Pt', **options)
+        for category in ('published', 'research', 'research'):
+            ExperimentFile.objects.create(
+                experiment=cls.first, file_name=f'{category}.csv', file_path='x', data_category=category)
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_login(self.user)
+
+    def _facets(self, **params):
+        response = self.client.get(reverse('v0:search_voltammetry_data'), params)
+        self.assertEqual(response.status_code, 200)
+        return {name: {row['value']: row['count'] for row in rows}
+                for name, rows in response.json()['facets'].items()}
+
+    def test_counts(self):
+        facets = self._facets()
+        # The files of EXP-1 count it once per category, and nowhere else more than once
+        self.assertEqual(facets['experiment_type'], {'cyclic': 2, 'square_wave': 1})
+        self.assertEqual(facets['electrode_material'], {'Pt': 2, 'Au': 1})
+        self.assertEqual(facets['instrument'], {'Potentiostat': 3})
+        self.assertEqual(facets['data_category'], {'published': 1, 'research': 1})
+
+        facets = self._facets(electrode_material='pt')
+        self.assertEqual(facets['experiment_type'], {'cyclic': 1, 'square_wave': 1})
+
+    def test_cache_hit(self):
+        self._facets(experiment_type='cyclic')
+        with mock.patch('apps.common.facets.facet_counts') as facet_counts:
+            self._facets(experiment_type=' cyclic ')
+        facet_counts.assert_not_called()
+
+    def test_exact_filters_are_case_sensitive(self):
+        self._facets(experiment_type='cyclic')
+        self.assertEqual(self._facets(experiment_type='Cyclic')['experiment_type'], {})
+
+    def test_changes_invalidate(self):
+        self.assertEqual(self._facets()['experiment_type']['cyclic'], 2)
+        self.first.experiment_type = 'square_wave'
+        self.first.save()
+        self.assertEqual(self._facets()['experiment_type'], {'cyclic': 1, 'square_wave': 2})
@@ -1,4 +1,4 @@
-from .views import DashboardSummaryView, UserActivityView, RecentExperimentsView, RecentDatasetsView
+from .views import DashboardSummaryView, UserActivityView, RecentExperimentsView, RecentDatasetsView, get_search_suggestions, search_voltammetry_data
 from django.urls import path
 
 
@@ -8,4 +8,6 @@ urlpatterns = [
     path('activity/',UserActivityView.as_view(), name='user_activity'),
     path('recent-experiments/',RecentExperimentsView.as_view(), name='recent_experiments'),
     path('recent-datasets/',RecentDatasetsView.as_view(), name='recent_datasets'),
+    path('search/', search_voltammetry_data, name='search_voltammetry_data'),
+    path('search/suggestions/', get_search_suggestions, name='search_suggestions'),
 ]
\ No newline at end of file
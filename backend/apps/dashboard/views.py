@@ -5,7 +5,22 @@ from django.db.models import Q
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework.permissions import IsAuthenticated
-from .models import FileUpload
+from apps.data.models import FileUpload
+from apps.common.facets import cached_facet_counts
+from apps.common.fulltext import tokenize
+from apps.experiments.models import Experiment
+from apps.experiments.search import search_experiments
+from apps.experiments.suggestions import suggestion_index
+
+SEARCH_PAGE_SIZE = 50
+SEARCH_MAX_PAGE_SIZE = 200
+SEARCH_FACETS = {
+    'experiment_type': 'experiment_type',
+    'electrode_material': 'electrode_material',
+    'instrument': 'instrument__name',
+    'technique': 'voltammetry_technique__name',
+    'data_category': 'files__data_category',
+}
 
 def get_voltammetry_data(request, experiment_id=None):
     """API view to get voltammetry data"""
@@ -42,73 +57,78 @@ def voltammetry_dashboard(request):
     return render(request, 'dashboard/voltammetry.html', {'experiments': experiments})
 
 def search_voltammetry_data(request):
-    """Advanced search API with filters"""
+    """
+    Advanced search API with filters.
+    ``query`` is matched against the full-text index of the experiment
+    metadata and results are ranked by relevance; ``limit``/``offset`` page them.
+    ``facets`` holds the number of matches per experiment type, electrode
+    material, instrument, technique and data category of the files.
+    """
     query = request.GET.get('query', '')
     experiment_type = request.GET.get('experiment_type', '')
     electrode_material = request.GET.get('electrode_material', '')
     date_from = request.GET.get('date_from', '')
     date_to = request.GET.get('date_to', '')
-    
+    try:
+        limit = max(1, min(int(request.GET.get('limit', SEARCH_PAGE_SIZE)), SEARCH_MAX_PAGE_SIZE))
+        offset = max(int(request.GET.get('offset', 0)), 0)
+    except ValueError:
+        return JsonResponse({'error': 'limit and offset must be integers'}, status=400)
+
     # Start with all objects
-    queryset = VoltammetryData.objects.all()
-    
-    # Apply search query if provided
-    if query:
-        queryset = queryset.filter(
-            Q(title__icontains=query) |
-            Q(description__icontains=query) |
-            Q(experiment_id__icontains=query) |
-            Q(electrode_material__icontains=query) |
-            Q(electrolyte__icontains=query)
-        )
-    
+    queryset = Experiment.objects.all()
+
     # Apply filters
     if experiment_type:
         queryset = queryset.filter(experiment_type=experiment_type)
     if electrode_material:
         queryset = queryset.filter(electrode_material__icontains=electrode_material)
     if date_from:
-        queryset = queryset.filter(date_created__gte=date_from)
+        queryset = queryset.filter(created_at__gte=date_from)
     if date_to:
-        queryset = queryset.filter(date_created__lte=date_to)
-    
+        queryset = queryset.filter(created_at__lte=date_to)
+
+    # Apply search query if provided, best matches first
+    if query:
+        queryset = search_experiments(queryset, query).order_by('-search_rank', '-created_at')
+    else:
+        queryset = queryset.order_by('-created_at')
+
+    # Include total count for pagination
+    count = queryset.count()
+
+    # Counts per filter value, for the current filter set
+    facets = cached_facet_counts(queryset, SEARCH_FACETS, 'voltammetry_search', {
+        'query': ' '.join(tokenize(query)),
+        'experiment_type': experiment_type,
+        # Matched case-insensitively
+        'electrode_material': electrode_material.lower(),
+        'date_from': date_from,
+        'date_to': date_to,
+    })
+
     # Convert results to list of dictionaries (without full data points)
     results = queryset.values(
         'experiment_id', 'title', 'experiment_type', 'electrode_material',
-        'date_created', 'scan_rate'
-    )
-    
-    # Include total count for pagination
-    count = queryset.count()
-    
+        'created_at', 'scan_rate'
+    )[offset:offset + limit]
+
     return JsonResponse({
-        'results': list(results), 
-        'count': count
+        'results': list(results),
+        'count': count,
+        'facets': facets,
     })
 
 def get_search_suggestions(request):
-    """API endpoint for search autocomplete suggestions"""
+    """
+    API endpoint for search autocomplete suggestions.
+    Served from the in-process prefix index, without a database query.
+    """
     query = request.GET.get('query', '')
     if not query or len(query) < 2:
         return JsonResponse({'suggestions': []})
-    
-    # Get suggestions from different fields
-    title_suggestions = VoltammetryData.objects.filter(
-        title__icontains=query
-    ).values_list('title', flat=True).distinct()[:5]
-    
-    electrode_suggestions = VoltammetryData.objects.filter(
-        electrode_material__icontains=query
-    ).values_list('electrode_material', flat=True).distinct()[:3]
-    
-    electrolyte_suggestions = VoltammetryData.objects.filter(
-        electrolyte__icontains=query
-    ).values_list('electrolyte', flat=True).distinct()[:3]
-    
-    # Combine all suggestions
-    all_suggestions = list(title_suggestions) + list(electrode_suggestions) + list(electrolyte_suggestions)
-    
-    return JsonResponse({'suggestions': all_suggestions[:10]})
+
+    return JsonResponse({'suggestions': suggestion_index.suggest(query)})
 
 
 class DashboardSummaryView(APIView):
@@ -160,7 +180,8 @@ class RecentDatasetsView(APIView):
     API view to get recent public datasets for the homepage.
     """
     def get(self, request):
-        recent_datasets = FileUpload.objects.filter().order_by('-created_at')[:5]
+        recent_datasets = FileUpload.objects.select_related(
+            'data_type', 'uploaded_by').order_by('-upload_date')[:5]
         datasets = []
         for dataset in recent_datasets:
             datasets.append({
@@ -169,7 +190,7 @@ class RecentDatasetsView(APIView):
                 'description': dataset.description,
                 'category': dataset.data_type.name if dataset.data_type else "Unknown",
                 'access': 'public',
-                'author': dataset.user.username,
+                'author': dataset.uploaded_by.username,
                 'date': dataset.upload_date.isoformat(),
                 'downloads': dataset.downloads_count,
                 'method': dataset.method,
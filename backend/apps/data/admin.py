@@ -1,10 +1,10 @@
 from django.contrib import admin
-from .models import Dataset, DatasetComparison, DataCategory, FileUpload, DataType
+from .models import Blob, Dataset, DatasetComparison, DataCategory, FileUpload, DataType
 
 @admin.register(DatasetComparison)
 class DatasetComparisonAdmin(admin.ModelAdmin):
-    list_display = ('comparison_id', 'title', 'created_by', 'is_public', 'created_at')
-    list_filter = ('is_public',)
+    list_display = ('comparison_id', 'title', 'created_by', 'is_public', 'status', 'created_at')
+    list_filter = ('is_public', 'status')
     search_fields = ('comparison_id', 'title', 'created_by__username')
     date_hierarchy = 'created_at'
 
@@ -15,6 +15,13 @@ class DatasetAdmin(admin.ModelAdmin):
     search_fields = ('title', 'file_type')
     date_hierarchy = 'created_at'
 
+@admin.register(Blob)
+class BlobAdmin(admin.ModelAdmin):
+    list_display = ('digest', 'kind', 'size', 'ref_count', 'updated_at')
+    list_filter = ('kind',)
+    search_fields = ('digest',)
+    readonly_fields = ('kind', 'digest', 'size', 'ref_count')
+
 admin.register(DataCategory)
 admin.register(FileUpload)
 admin.register(DataType)
\ No newline at end of file
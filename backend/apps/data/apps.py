@@ -4,3 +4,7 @@ from django.apps import AppConfig
 class DataConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'apps.data'
+
+    def ready(self):
+        from . import signals
+        signals.connect_blob_signals()
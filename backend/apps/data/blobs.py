@@ -0,0 +1,222 @@
+"""
+Content-addressed storage for uploaded data: files are named by the SHA-256
+of their bytes, so identical content is stored once. The Blob model counts
+the references in BLOB_REFERENCES, and ``manage.py collect_blobs`` deletes
+blobs that are no longer referenced.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+from collections import Counter
+
+from django.apps import apps
+from django.conf import settings
+from django.core.files.storage import FileSystemStorage
+from django.db.models import F
+from django.utils import timezone
+from django.utils.deconstruct import deconstructible
+
+from apps.experiments.traces import trace_path
+
+BLOB_DIR = 'blobs'
+CHUNK_SIZE = 1024 * 1024
+
+KIND_FILE = 'file'
+KIND_TRACE = 'trace'
+
+# Fields that reference blobs: model label -> {field: blob kind}
+BLOB_REFERENCES = {
+    'data.FileUpload': {'file': KIND_FILE, 'trace_digest': KIND_TRACE, 'delta': KIND_FILE},
+    'data.Dataset': {'file_path': KIND_FILE},
+    'experiments.Experiment': {'trace_digest': KIND_TRACE, 'trace_delta': KIND_FILE},
+}
+
+
+def blob_name(digest):
+    return f'{BLOB_DIR}/{digest[:2]}/{digest}'
+
+
+def reference_digest(kind, value):
+    """Digest referenced by a field value, or None (e.g. files stored before blobs)"""
+    if not value:
+        return None
+    if kind == KIND_FILE:
+        name = str(value)
+        if not name.startswith(f'{BLOB_DIR}/'):
+            return None
+        return os.path.basename(name)
+    return value
+
+
+@deconstructible
+class BlobStorage(FileSystemStorage):
+    """File system storage that names files by the SHA-256 of their contents"""
+
+    def get_available_name(self, name, max_length=None):
+        # The name is replaced by the digest in _save()
+        return name
+
+    def _save(self, name, content):
+        directory = self.path(BLOB_DIR)
+        os.makedirs(directory, exist_ok=True)
+        handle, staging = tempfile.mkstemp(prefix='.tmp-', dir=directory)
+        try:
+            sha = hashlib.sha256()
+            with os.fdopen(handle, 'wb') as staged:
+                for chunk in content.chunks(CHUNK_SIZE):
+                    if isinstance(chunk, str):
+                        chunk = chunk.encode('utf-8')
+                    sha.update(chunk)
+                    staged.write(chunk)
+            digest = sha.hexdigest()
+            path = self.path(blob_name(digest))
+            if os.path.exists(path):
+                # Already stored; keep the collector away from it
+                touch(KIND_FILE, digest)
+                os.utime(path)
+                os.remove(staging)
+            else:
+                os.makedirs(os.path.dirname(path), exist_ok=True)
+                if self.file_permissions_mode is not None:
+                    os.chmod(staging, self.file_permissions_mode)
+                os.replace(staging, path)
+        except BaseException:
+            if os.path.exists(staging):
+                os.remove(staging)
+            raise
+        return blob_name(digest)
+
+
+blob_storage = BlobStorage()
+
+
+def _stored_path(kind, digest):
+    if kind == KIND_FILE:
+        return blob_storage.path(blob_name(digest))
+    return trace_path(digest)
+
+
+def stored_size(kind, digest):
+    """Bytes the blob takes on disk (a trace includes its pyramid levels)"""
+    path = _stored_path(kind, digest)
+    if os.path.isfile(path):
+        return os.path.getsize(path)
+    return sum(
+        os.path.getsize(os.path.join(root, name))
+        for root, _, names in os.walk(path) for name in names)
+
+
+def delete_stored(kind, digest):
+    path = _stored_path(kind, digest)
+    if os.path.isdir(path):
+        shutil.rmtree(path, ignore_errors=True)
+    elif os.path.exists(path):
+        os.remove(path)
+
+
+def stored_digests(kind):
+    """``(digest, mtime)`` of every blob of a kind on disk"""
+    root = blob_storage.path(BLOB_DIR) if kind == KIND_FILE else settings.TRACE_STORE_ROOT
+    if not os.path.isdir(root):
+        return
+    for prefix in os.listdir(root):
+        directory = os.path.join(root, prefix)
+        if len(prefix) != 2 or not os.path.isdir(directory):
+            continue
+        for digest in os.listdir(directory):
+            if not digest.startswith('.tmp-'):
+                yield digest, os.path.getmtime(os.path.join(directory, digest))
+
+
+def touch(kind, digest):
+    from .models import Blob
+    Blob.objects.filter(kind=kind, digest=digest).update(updated_at=timezone.now())
+
+
+def acquire(kind, digest):
+    """Count one more reference to a blob"""
+    from .models import Blob
+    blobs = Blob.objects.filter(kind=kind, digest=digest)
+    if blobs.update(ref_count=F('ref_count') + 1, updated_at=timezone.now()):
+        return
+    _, created = Blob.objects.get_or_create(
+        kind=kind, digest=digest,
+        defaults={'size': stored_size(kind, digest), 'ref_count': 1})
+    if not created:
+        blobs.update(ref_count=F('ref_count') + 1, updated_at=timezone.now())
+
+
+def release(kind, digest):
+    """Count one reference less; unreferenced blobs are left to collect_garbage()"""
+    from .models import Blob
+    Blob.objects.filter(kind=kind, digest=digest, ref_count__gt=0).update(
+        ref_count=F('ref_count') - 1, updated_at=timezone.now())
+
+
+def count_references():
+    """Count the references of every blob from the referencing rows"""
+    counts = Counter()
+    for label, fields in BLOB_REFERENCES.items():
+        rows = apps.get_model(label).objects.values_list(*fields)
+        for row in rows.iterator(chunk_size=5000):
+            for (field, kind), value in zip(fields.items(), row):
+                digest = reference_digest(kind, value)
+                if digest:
+                    counts[kind, digest] += 1
+    return counts
+
+
+def recount():
+    """
+    Recompute all reference counts from the referencing rows, e.g. after bulk
+    changes that bypassed the signals. Returns the number of corrected blobs.
+    """
+    from .models import Blob
+
+    counts = count_references()
+    corrected = 0
+    for blob in Blob.objects.iterator():
+        count = counts.pop((blob.kind, blob.digest), 0)
+        if count != blob.ref_count:
+            Blob.objects.filter(pk=blob.pk).update(ref_count=count, updated_at=timezone.now())
+            corrected += 1
+    for (kind, digest), count in counts.items():
+        Blob.objects.create(kind=kind, digest=digest, ref_count=count,
+                            size=stored_size(kind, digest))
+        corrected += 1
+    return corrected
+
+
+def collect_garbage(min_age, dry_run=False):
+    """
+    Delete blobs unreferenced for longer than ``min_age`` (a timedelta), and
+    stored data older than that which is neither counted nor referenced
+    (e.g. left by a failed upload). Returns the number of blobs and the
+    bytes freed.
+    """
+    from .models import Blob
+
+    cutoff = timezone.now() - min_age
+    removed = freed = 0
+    for blob in Blob.objects.filter(ref_count=0, updated_at__lt=cutoff).iterator():
+        # Only delete the data when nothing referenced the blob in the meantime
+        if dry_run or Blob.objects.filter(
+                pk=blob.pk, ref_count=0, updated_at=blob.updated_at).delete()[0]:
+            if not dry_run:
+                delete_stored(blob.kind, blob.digest)
+            removed += 1
+            freed += blob.size
+
+    # Data stored before reference counting existed has references but no row
+    referenced = count_references()
+    for kind in (KIND_FILE, KIND_TRACE):
+        known = set(Blob.objects.filter(kind=kind).values_list('digest', flat=True))
+        known.update(digest for blob_kind, digest in referenced if blob_kind == kind)
+        for digest, mtime in stored_digests(kind):
+            if digest not in known and mtime < cutoff.timestamp():
+                freed += stored_size(kind, digest)
+                if not dry_run:
+                    delete_stored(kind, digest)
+                removed += 1
+    return removed, freed
@@ -0,0 +1,132 @@
+"""
+On-disk cache of converted dataset downloads.
+
+DownloadView parses a dataset and renders it as CSV or Excel with the
+requested options. The rendered file is kept under
+``settings.CONVERSION_CACHE_ROOT``, named by a hash of the dataset's content
+digest and the options, so repeat downloads are served from disk without
+parsing anything. A changed dataset has a new digest and therefore new
+entries; the old ones age out.
+
+Reading an entry updates its modification time, and after every store the
+least recently used entries are removed until the directory fits in
+``settings.CONVERSION_CACHE_MAX_BYTES``. Outputs larger than
+``settings.CONVERSION_CACHE_MAX_FILE_BYTES`` are not kept.
+"""
+import hashlib
+import json
+import os
+import tempfile
+
+from django.conf import settings
+
+from apps.caching.stampede import get_or_compute
+from apps.caching.versioning import versioned_key
+from .blobs import CHUNK_SIZE, KIND_FILE, reference_digest
+
+# Seconds the digest of a legacy dataset is cached; saving the dataset
+# changes the key, so this only bounds how long unused entries stay around
+DIGEST_CACHE_TIMEOUT = 24 * 60 * 60
+
+
+def content_digest(dataset):
+    """
+    SHA-256 of the dataset text, or None when the dataset has none. Files in
+    the blob store are named by it. For legacy inline content or files the
+    digest is cached until the dataset changes, so the (deferred) content
+    column is only read when the digest is not cached.
+    """
+    # Datasets stored as blobs have no inline content
+    digest = reference_digest(KIND_FILE, dataset.file_path)
+    if digest:
+        return digest
+    return get_or_compute(
+        versioned_key('download_digest', 'data.Dataset', dataset.id),
+        lambda: _hash_content(dataset), DIGEST_CACHE_TIMEOUT)
+
+
+def _hash_content(dataset):
+    if not dataset.content and not dataset.file_path:
+        return None
+    sha = hashlib.sha256()
+    with dataset.open_content() as content:
+        while True:
+            chunk = content.read(CHUNK_SIZE)
+            if not chunk:
+                break
+            sha.update(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+    return sha.hexdigest()
+
+
+def conversion_key(digest, **options):
+    encoded = json.dumps([digest, options], sort_keys=True)
+    return hashlib.sha256(encoded.encode('utf-8')).hexdigest()
+
+
+def _path(key):
+    return os.path.join(settings.CONVERSION_CACHE_ROOT, key)
+
+
+def get_cached(key):
+    """Open the cached output for a key (binary), or None"""
+    try:
+        output = open(_path(key), 'rb')
+    except FileNotFoundError:
+        return None
+    # Mark as recently used; an entry evicted meanwhile stays readable while open
+    try:
+        os.utime(output.fileno())
+    except OSError:
+        pass
+    return output
+
+
+def store(key, write):
+    """
+    Render an output with ``write(file)`` into the cache and return it open
+    for reading. Outputs over the size limit are returned without being kept.
+    """
+    root = settings.CONVERSION_CACHE_ROOT
+    os.makedirs(root, exist_ok=True)
+    handle, staging = tempfile.mkstemp(prefix='.tmp-', dir=root)
+    output = os.fdopen(handle, 'w+b')
+    try:
+        write(output)
+        output.flush()
+        if output.tell() <= settings.CONVERSION_CACHE_MAX_FILE_BYTES:
+            os.replace(staging, _path(key))
+            evict()
+        else:
+            os.remove(staging)
+    except BaseException:
+        output.close()
+        if os.path.exists(staging):
+            os.remove(staging)
+        raise
+    output.seek(0)
+    return output
+
+
+def evict():
+    """Remove the least recently used entries until the cache fits its size limit"""
+    root = settings.CONVERSION_CACHE_ROOT
+    entries = []
+    with os.scandir(root) as scan:
+        for entry in scan:
+            if entry.name.startswith('.tmp-') or not entry.is_file():
+                continue
+            try:
+                stat = entry.stat()
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, entry.path))
+
+    total = sum(size for _, size, _ in entries)
+    for _, size, path in sorted(entries):
+        if total <= settings.CONVERSION_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(path)
+        except FileNotFoundError:
+            pass
+        total -= size
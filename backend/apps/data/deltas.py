@@ -0,0 +1,127 @@
+"""
+Delta encoding for version chains.
+
+When a new version of an upload or experiment is created, the version it
+replaces keeps only a delta against the new one and its full content can be
+released from the blob or trace store. Reading an old version walks the
+chain of deltas from the nearest version that is still stored in full: the
+latest one, or a snapshot, which is kept every
+``settings.VERSION_SNAPSHOT_INTERVAL`` versions to bound the walk.
+
+Text content is diffed by rows (lines) and rebuilt into a temporary file one
+row at a time. The diff holds both versions in memory, so versions larger
+than ``settings.DELTA_MAX_BYTES`` are kept in full. Traces are patched per
+array: a sparse list of changed points when the lengths match, otherwise a
+splice of the part between the common prefix and suffix.
+"""
+import difflib
+import io
+import json
+import zlib
+from functools import partial
+from itertools import islice
+
+import numpy as np
+from django.conf import settings
+
+from apps.experiments.traces import CHANNELS, TRACE_DTYPE, Trace
+from .ingest import CHUNK_SIZE, iter_lines
+
+
+def is_snapshot(version):
+    """Versions that are always stored in full"""
+    return version % settings.VERSION_SNAPSHOT_INTERVAL == 0
+
+
+def _lines(file):
+    """Text lines of a binary file, split at newlines only and read in chunks"""
+    return iter_lines(iter(partial(file.read, CHUNK_SIZE), b''))
+
+
+def encode_text_delta(base, target):
+    """
+    Bytes that turn the binary file ``base`` into ``target`` with
+    write_text_delta(). Both files are diffed in memory.
+    """
+    base_lines = list(_lines(base))
+    target_lines = list(_lines(target))
+    operations = []
+    matcher = difflib.SequenceMatcher(None, base_lines, target_lines)
+    for tag, i1, i2, j1, j2 in matcher.get_opcodes():
+        if tag == 'equal':
+            operations.append([i1, i2])
+        elif j2 > j1:
+            operations.append(target_lines[j1:j2])
+    return zlib.compress(json.dumps(operations).encode('utf-8'))
+
+
+def write_text_delta(base, delta, output):
+    """Write the binary file ``base`` patched with ``delta`` to ``output``, one row at a time"""
+    base_lines = _lines(base)
+    position = 0
+    for operation in json.loads(zlib.decompress(delta)):
+        if isinstance(operation[0], int):
+            # Rows copied from the base, which are referenced in order
+            start, end = operation
+            for line in islice(base_lines, start - position, end - position):
+                output.write(line.encode('utf-8'))
+            position = end
+        else:
+            output.write(''.join(operation).encode('utf-8'))
+
+
+def _equal(a, b):
+    return (a == b) | (np.isnan(a) & np.isnan(b))
+
+
+def encode_trace_delta(base, target):
+    """Bytes that turn the Trace ``base`` into ``target`` with apply_trace_delta()"""
+    arrays = {}
+    if len(base) == len(target):
+        changed = np.zeros(len(base), dtype=bool)
+        for name in CHANNELS:
+            changed |= ~_equal(getattr(base, name), getattr(target, name))
+        index = np.flatnonzero(changed)
+        arrays['index'] = index
+        for name in CHANNELS:
+            arrays[name] = getattr(target, name)[index]
+    else:
+        common = min(len(base), len(target))
+        same = np.ones(common, dtype=bool)
+        same_tail = np.ones(common, dtype=bool)
+        for name in CHANNELS:
+            same &= _equal(getattr(base, name)[:common], getattr(target, name)[:common])
+            same_tail &= _equal(getattr(base, name)[len(base) - common:],
+                                getattr(target, name)[len(target) - common:])
+        prefix = common if same.all() else int(np.argmin(same))
+        suffix = common if same_tail.all() else common - 1 - int(np.flatnonzero(~same_tail)[-1])
+        suffix = min(suffix, common - prefix)
+        arrays['splice'] = np.array([prefix, suffix])
+        for name in CHANNELS:
+            arrays[name] = getattr(target, name)[prefix:len(target) - suffix]
+
+    buffer = io.BytesIO()
+    np.savez_compressed(buffer, **arrays)
+    return buffer.getvalue()
+
+
+def apply_trace_delta(base, delta):
+    with np.load(io.BytesIO(delta)) as arrays:
+        if 'index' in arrays:
+            index = arrays['index']
+            channels = []
+            for name in CHANNELS:
+                values = np.array(getattr(base, name), dtype=TRACE_DTYPE)
+                values[index] = arrays[name]
+                channels.append(values)
+        else:
+            prefix, suffix = (int(value) for value in arrays['splice'])
+            channels = [
+                np.concatenate([
+                    getattr(base, name)[:prefix],
+                    arrays[name],
+                    getattr(base, name)[len(base) - suffix:],
+                ])
+                for name in CHANNELS
+            ]
+    return Trace(*channels)
@@ -0,0 +1,142 @@
+"""
+Streaming ingestion of uploaded data files.
+
+Uploads are read in fixed-size chunks and decoded incrementally. Every line
+is validated and parsed as it arrives, and the trace columns are appended to
+compact float arrays, so memory use depends on the number of parsed values
+and never on the size of the text. The raw file is streamed to storage by
+Django's storage API and the parsed columns go to the trace store
+(apps.experiments.traces).
+"""
+import codecs
+import csv
+import math
+import re
+from array import array
+
+import numpy as np
+
+from apps.experiments.traces import CHANNELS, Trace, build_pyramid, write_trace
+
+CHUNK_SIZE = 1024 * 1024
+
+# Column headers recognized as trace channels, lower-cased and without units
+CHANNEL_ALIASES = {
+    'potential': ('potential', 'e', 'ewe', 'voltage', 'v', 'we(1).potential'),
+    'current': ('current', 'i', '<i>', 'we(1).current'),
+    'time': ('time', 't'),
+}
+
+
+class IngestError(ValueError):
+    pass
+
+
+def iter_lines(chunks, encoding='utf-8'):
+    """Decode an iterable of byte chunks and yield its lines, line endings included"""
+    try:
+        decoder = codecs.getincrementaldecoder(encoding)()
+    except LookupError:
+        raise IngestError(f'Unknown encoding: {encoding}')
+
+    pending = ''
+    try:
+        for chunk in chunks:
+            lines = (pending + decoder.decode(chunk)).split('\n')
+            pending = lines.pop()
+            for line in lines:
+                yield line + '\n'
+        pending += decoder.decode(b'', final=True)
+    except UnicodeDecodeError:
+        raise IngestError(f'File is not valid {encoding} text')
+    if pending:
+        yield pending
+
+
+def _column_name(header):
+    # 'Potential (V)' -> 'potential', 'I [mA]' -> 'i'
+    return re.sub(r'[(\[].*?[)\]]', '', header).strip().lower()
+
+
+def match_channels(header):
+    """``{channel: column index}`` for the channels named in a header row"""
+    names = [_column_name(cell) for cell in header]
+    columns = {}
+    for channel, aliases in CHANNEL_ALIASES.items():
+        for index, name in enumerate(names):
+            if name in aliases:
+                columns[channel] = index
+                break
+    return columns
+
+
+def _is_number(cell):
+    try:
+        float(cell)
+    except ValueError:
+        return False
+    return True
+
+
+def parse_trace(lines, delimiter=','):
+    """
+    Parse delimited text into a Trace, one line at a time.
+
+    A non-numeric first row is the header, whose column names locate the
+    channels (see CHANNEL_ALIASES); without one the columns are potential,
+    current and time in that order. Blank lines and lines starting with '#'
+    are skipped and empty cells become NaN. Returns None when the file has
+    no potential and current columns, and raises IngestError for rows of the
+    wrong width or non-numeric trace values.
+    """
+    values = {channel: array('d') for channel in CHANNELS}
+    columns = None
+    width = None
+
+    reader = csv.reader(lines, delimiter=delimiter)
+    for cells in reader:
+        if not cells or not ''.join(cells).strip() or cells[0].startswith('#'):
+            continue
+        cells = [cell.strip() for cell in cells]
+
+        if columns is None:
+            width = len(cells)
+            if all(_is_number(cell) for cell in cells if cell):
+                columns = dict(zip(CHANNELS, range(width)))
+            else:
+                columns = match_channels(cells)
+                if 'potential' not in columns or 'current' not in columns:
+                    return None
+                continue
+
+        if len(cells) != width:
+            raise IngestError(
+                f'Line {reader.line_num}: expected {width} columns, found {len(cells)}')
+        for channel in CHANNELS:
+            index = columns.get(channel)
+            cell = cells[index] if index is not None else ''
+            try:
+                values[channel].append(float(cell) if cell else math.nan)
+            except ValueError:
+                raise IngestError(f'Line {reader.line_num}: {cell!r} is not a number')
+
+    if columns is None or 'current' not in columns:
+        return None
+    return Trace(*(np.frombuffer(values[channel], dtype=np.float64) for channel in CHANNELS))
+
+
+def read_upload_trace(upload, delimiter=',', encoding='utf-8'):
+    """Parse the trace of an uploaded file without reading it into memory at once"""
+    return parse_trace(iter_lines(upload.chunks(CHUNK_SIZE), encoding), delimiter)
+
+
+def store_trace(trace):
+    """
+    Write a parsed trace and its pyramid levels to the trace store.
+    Returns ``(digest, num_points)``, or ``(None, 0)`` when there is no trace.
+    """
+    if trace is None or not len(trace):
+        return None, 0
+    digest = write_trace(trace)
+    build_pyramid(digest, trace)
+    return digest, len(trace)
@@ -0,0 +1,30 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand
+from apps.data import blobs
+
+
+class Command(BaseCommand):
+    help = 'Delete stored files and traces that are no longer referenced'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--min-age', type=int, default=60,
+            help='Minutes a blob must have been unreferenced before it is deleted')
+        parser.add_argument(
+            '--recount', action='store_true',
+            help='Recompute the reference counts from the database first')
+        parser.add_argument(
+            '--dry-run', action='store_true',
+            help='Only report what would be deleted')
+
+    def handle(self, *args, **options):
+        if options['recount']:
+            corrected = blobs.recount()
+            self.stdout.write(f'Corrected {corrected} reference counts')
+
+        removed, freed = blobs.collect_garbage(
+            timedelta(minutes=options['min_age']), dry_run=options['dry_run'])
+        verb = 'Would delete' if options['dry_run'] else 'Deleted'
+        self.stdout.write(self.style.SUCCESS(
+            f'{verb} {removed} blobs ({freed / 1024 / 1024:.1f} MB)'))
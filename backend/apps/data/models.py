@@ -1,8 +1,38 @@
+import io
+import tempfile
 import uuid
+from django.conf import settings
+from django.core.files.base import ContentFile, File
 from django.db import models
 from django.contrib.auth.models import User
 
+from apps.common.managers import MetadataManager
 from apps.common.models import CreatedAtModel, TimeStampedModel
+from apps.experiments.traces import read_trace
+from .blobs import KIND_FILE, KIND_TRACE, blob_storage
+from .deltas import encode_text_delta, is_snapshot, write_text_delta
+from .ingest import parse_trace, read_upload_trace, store_trace
+
+
+class Blob(TimeStampedModel):
+    """
+    Reference count of a content-addressed file or trace (see blobs.py).
+    ``updated_at`` is the time of the last change of the count.
+    """
+    KIND_CHOICES = (
+        (KIND_FILE, 'File'),
+        (KIND_TRACE, 'Trace'),
+    )
+    kind = models.CharField(max_length=10, choices=KIND_CHOICES)
+    digest = models.CharField(max_length=64)
+    size = models.BigIntegerField(default=0)
+    ref_count = models.PositiveIntegerField(default=0, db_index=True)
+
+    def __str__(self):
+        return f"{self.kind} {self.digest[:12]} ({self.ref_count} references)"
+
+    class Meta:
+        unique_together = ('kind', 'digest')
 
 
 class DataType(models.Model):
@@ -43,6 +73,8 @@ class DataCategory(models.Model):
 
 
 class Dataset(CreatedAtModel):
+    PAYLOAD_FIELDS = ('content',)
+
     id = models.UUIDField(auto_created=True, default=uuid.uuid4)
     title = models.CharField(max_length=255, primary_key=True)
     content = models.TextField(
@@ -53,6 +85,8 @@ class Dataset(CreatedAtModel):
     )
     description = models.TextField(blank=True, default='')
     file_path = models.CharField(max_length=500)
+    # Name of the uploaded file; the stored blob is named by its content hash
+    file_name = models.CharField(max_length=255, blank=True, default='')
     file_size = models.BigIntegerField()
     file_type = models.CharField(max_length=100)
     is_public = models.BooleanField(default=False)
@@ -73,9 +107,20 @@ class Dataset(CreatedAtModel):
         related_name='research_datasets'
     )
 
+    objects = MetadataManager()
+
     def __str__(self):
         return f"{self.title} ({self.file_type})"
 
+    def open_content(self):
+        """
+        File object with the dataset text: the stored file at ``file_path``
+        (binary, read as it is consumed) or the legacy inline content
+        """
+        if self.content or not self.file_path:
+            return io.StringIO(self.content)
+        return blob_storage.open(self.file_path, 'rb')
+
 
 class DatasetComparison(TimeStampedModel):
     """Model for comparing multiple datasets"""
@@ -86,9 +131,26 @@ class DatasetComparison(TimeStampedModel):
         User, on_delete=models.CASCADE, related_name='created_comparisons')
     is_public = models.BooleanField(default=False)
 
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    )
+
+    research = models.ForeignKey(
+        'research.Research',
+        on_delete=models.SET_NULL,
+        null=True,
+        blank=True,
+        related_name='comparisons'
+    )
+
     # Store the experiment IDs and comparison results as JSON
     datasets = models.JSONField(default=list)  # List of experiment_ids
     comparison_results = models.JSONField(default=dict)
+    status = models.CharField(
+        max_length=20, choices=STATUS_CHOICES, default='pending')
 
     def __str__(self):
         return f"{self.title} ({self.comparison_id})"
@@ -99,8 +161,22 @@ class DatasetComparison(TimeStampedModel):
 
 
 class FileUpload(models.Model):
+    PAYLOAD_FIELDS = ('content',)
+
     file_name = models.CharField(max_length=255)
-    content = models.TextField()
+    # Legacy inline text; files are kept in the blob store (`file`) instead
+    content = models.TextField(blank=True, default='')
+    file = models.FileField(storage=blob_storage, blank=True, null=True)
+    file_size = models.BigIntegerField(default=0)
+    # Parsed potential/current/time columns in the trace store
+    trace_digest = models.CharField(
+        max_length=64, blank=True, null=True, db_index=True,
+        help_text="SHA-256 key of the parsed trace in the trace store")
+    num_points = models.PositiveIntegerField(default=0)
+    # Older versions keep only a delta against the next newer version (deltas.py)
+    delta = models.FileField(storage=blob_storage, blank=True, null=True)
+    delta_base = models.ForeignKey(
+        'self', on_delete=models.SET_NULL, null=True, blank=True, related_name='delta_versions')
     description = models.TextField(blank=True, null=True)
     uploaded_by = models.ForeignKey(
         User, on_delete=models.CASCADE, related_name='file_uploads')
@@ -132,18 +208,97 @@ class FileUpload(models.Model):
         default=0, help_text="Number of times this file has been downloaded")
     delimiter = models.CharField(max_length=5, default=',')
 
+    objects = MetadataManager()
+
     def __str__(self):
         return f"{self.file_name} ({self.data_type}) v({self.version}) (by {self.uploaded_by})"
 
+    def set_content(self, text):
+        """
+        Store text in the blob store, parse its trace and point this upload
+        at both (without saving). Raises IngestError for malformed text.
+        """
+        trace = parse_trace(io.StringIO(text), self.delimiter or ',')
+        data = text.encode('utf-8')
+        self.file.save(self.file_name, ContentFile(data), save=False)
+        self.file_size = len(data)
+        self.content = ''
+        self.trace_digest, self.num_points = store_trace(trace)
+
+    def store_as_delta(self, base):
+        """
+        Keep only a delta of this version against ``base``, a newer version,
+        and release the full file and trace. Snapshots are kept in full.
+        """
+        if is_snapshot(self.version) or not self.file or self.delta_base_id:
+            return
+        if self.file.name == base.file.name:
+            # Same content, already stored once
+            return
+        if max(self.file_size, base.file_size) > settings.DELTA_MAX_BYTES:
+            # Too large to diff in memory
+            return
+        with base.open_content() as target, self.open_content() as content:
+            delta = encode_text_delta(target, content)
+        self.delta.save(f'{self.file_name}.delta', ContentFile(delta), save=False)
+        self.delta_base = base
+        self.file = None
+        self.trace_digest = None
+        self.save()
+
+    def materialize(self):
+        """Store this version in full again, e.g. before its delta base is deleted"""
+        if not self.delta_base_id:
+            return
+        self.set_content(self.read_content())
+        self.delta = None
+        self.delta_base = None
+        self.save()
+
     def create_new_version(self, new_content):
         """Create a new version of this file"""
-        new_version = FileUpload.objects.get(pk=self.pk)
+        new_version = FileUpload.objects.with_payload().get(pk=self.pk)
         new_version.pk = None  # Create a new record
         new_version.version = self.version + 1
-        new_version.content = new_content
+        new_version.set_content(new_content)
+        new_version.delta = None
+        new_version.delta_base = None
         new_version.save()
+        self.store_as_delta(new_version)
         return new_version
 
+    def open_content(self):
+        """
+        Binary file object with the text of the upload: the stored file, the
+        legacy inline content, or for delta-encoded versions a temporary file
+        rebuilt from the newer versions
+        """
+        # Uploads with a stored file have no inline content; checking the
+        # file first keeps the deferred content column from being loaded
+        if self.file:
+            return self.file.open('rb')
+        if self.content or not self.delta_base_id:
+            return io.BytesIO(self.content.encode('utf-8'))
+        output = tempfile.TemporaryFile()
+        with self.delta_base.open_content() as base, self.delta.open('rb') as delta:
+            write_text_delta(base, delta.read(), output)
+        output.seek(0)
+        return output
+
+    def read_content(self):
+        """Text of the upload (see open_content())"""
+        with self.open_content() as content:
+            return content.read().decode('utf-8')
+
+    def get_trace(self, mmap=False):
+        """Parsed trace of the upload, or None when the file holds no trace"""
+        if self.trace_digest:
+            return read_trace(self.trace_digest, mmap=mmap)
+        if self.delta_base_id:
+            with self.open_content() as content:
+                return read_upload_trace(File(content), self.delimiter or ',')
+        return None
+
     @property
     def access_status(self):
         """Return a string representation of the access status"""
@@ -151,19 +306,21 @@ class FileUpload(models.Model):
 
     def export_as_csv(self):
         """Export content as CSV format"""
-        return self.content
+        return self.read_content()
 
     def export_as_tsv(self):
         """Export content as TSV format (replace commas with tabs)"""
-        if ',' in self.content:
-            return self.content.replace(',', '\t')
-        return self.content
+        content = self.read_content()
+        if ',' in content:
+            return content.replace(',', '\t')
+        return content
 
     def export_with_delimiter(self, delimiter):
         """Export with custom delimiter"""
-        if ',' in self.content and delimiter != ',':
-            return self.content.replace(',', delimiter)
-        return self.content
+        content = self.read_content()
+        if ',' in content and delimiter != ',':
+            return content.replace(',', delimiter)
+        return content
 
     class Meta:
         verbose_name = "Uploaded File"
@@ -44,7 +44,8 @@ class FileUploadSerializer(serializers.ModelSerializer):
             'upload_date',
             'experiment_type',
             'data_type',
-            'is_public',
+            'file_size',
+            'num_points',
             'version',
             'category',
             'research_id',
@@ -53,3 +54,5 @@ class FileUploadSerializer(serializers.ModelSerializer):
             'instrument',
             'delimiter',
         ]
+        # Filled in by FileUploadCreateView from the uploaded file and the request
+        read_only_fields = ['file_name', 'uploaded_by', 'file_size', 'num_points']
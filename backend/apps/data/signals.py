@@ -0,0 +1,66 @@
+from django.apps import apps
+from django.db.models.signals import post_delete, post_save, pre_delete, pre_save
+
+from .blobs import BLOB_REFERENCES, acquire, reference_digest, release
+
+
+def _references(instance):
+    fields = BLOB_REFERENCES[instance._meta.label]
+    return {field: reference_digest(kind, getattr(instance, field))
+            for field, kind in fields.items()}
+
+
+def remember_blob_references(sender, instance, using, update_fields=None, **kwargs):
+    """Keep the blobs referenced before the save, whose counts may drop"""
+    fields = BLOB_REFERENCES[sender._meta.label]
+    instance._blob_references = {}
+    if update_fields is not None and not set(update_fields) & set(fields):
+        # The references are not written
+        instance._blob_references = None
+    elif not instance._state.adding and instance.pk is not None:
+        row = sender.objects.using(using).filter(pk=instance.pk).values(*fields).first()
+        if row:
+            instance._blob_references = {
+                field: reference_digest(kind, row[field]) for field, kind in fields.items()}
+
+
+def count_blob_references(sender, instance, **kwargs):
+    before = getattr(instance, '_blob_references', None)
+    if before is None:
+        return
+    fields = BLOB_REFERENCES[sender._meta.label]
+    for field, digest in _references(instance).items():
+        if before.get(field) != digest:
+            if digest:
+                acquire(fields[field], digest)
+            if before.get(field):
+                release(fields[field], before[field])
+    instance._blob_references = None
+
+
+def release_blob_references(sender, instance, **kwargs):
+    fields = BLOB_REFERENCES[sender._meta.label]
+    for field, digest in _references(instance).items():
+        if digest:
+            release(fields[field], digest)
+
+
+def materialize_delta_versions(sender, instance, **kwargs):
+    """Older versions stored as deltas against a deleted version are stored in full again"""
+    for version in instance.delta_versions.all():
+        version.materialize()
+
+
+def connect_blob_signals():
+    """Count the blob references of every model listed in BLOB_REFERENCES"""
+    for label in BLOB_REFERENCES:
+        model = apps.get_model(label)
+        pre_save.connect(remember_blob_references, sender=model,
+                         dispatch_uid=f'blob_references_pre_save_{label}')
+        post_save.connect(count_blob_references, sender=model,
+                          dispatch_uid=f'blob_references_post_save_{label}')
+        post_delete.connect(release_blob_references, sender=model,
+                            dispatch_uid=f'blob_references_post_delete_{label}')
+        if any(field.name == 'delta_base' for field in model._meta.get_fields()):
+            pre_delete.connect(materialize_delta_versions, sender=model,
+                               dispatch_uid=f'delta_versions_pre_delete_{label}')
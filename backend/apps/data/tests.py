@@ -1,3 +1,296 @@
-from django.test import TestCase
+import io
+import os
+from datetime import timedelta
+from unittest import mock
 
-# Create your tests here.
+import numpy as np
+import pandas as pd
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.files.base import ContentFile
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import SimpleTestCase, TestCase, override_settings
+from django.urls import reverse
+
+from apps.common.testing import PayloadAssertionsMixin, TemporaryMediaMixin, xlsx_sheet_rows
+from apps.data import blobs, ingest, views
+from apps.data.blobs import KIND_FILE, KIND_TRACE, blob_storage
+from apps.data.ingest import IngestError, iter_lines, parse_trace, read_upload_trace, store_trace
+from apps.data.models import Blob, Dataset, FileUpload
+from apps.experiments.traces import read_trace, trace_path
+
+TABLE = 'E,I,t\n' + ''.join(f'{0.01 * i:.2f},{2e-6 * i:.2e},{i}\n' for i in range(50))
+
+
+CSV = 'Potential (V),Current (A),Time (s)\n' + ''.join(
+    f'{0.01 * i:.2f},{2e-6 * i:.2e},{0.1 * i:.1f}\n' for i in range(200))
+
+
+def _upload(user, text=CSV, name='run.csv'):
+    upload = FileUpload(file_name=name, uploaded_by=user)
+    upload.set_content(text)
+    upload.save()
+    return upload
+
+
+class DownloadTests(TemporaryMediaMixin, PayloadAssertionsMixin, TestCase):
+    """Downloads are converted chunk by chunk with the same result as one DataFrame"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.dataset = Dataset.objects.create(
+            title='run', content=TABLE, file_path='run.csv', file_size=len(TABLE), file_type='csv')
+
+    def setUp(self):
+        # Content digests are cached per dataset version
+        cache.clear()
+
+    def _download(self, **params):
+        response = self.client.get(reverse('v0:download', args=[self.dataset.id]), params)
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content) if response.streaming else response.content
+
+    def test_csv_matches_one_dataframe(self):
+        expected = pd.read_csv(io.StringIO(TABLE)).to_csv(sep=';', index=False)
+        with mock.patch.object(views, 'READ_CHUNK_ROWS', 7):
+            self.assertEqual(self._download(delimiter=';').decode('utf-8'), expected)
+            body = self._download(headers=0, skiprows=1).decode('utf-8')
+        self.assertEqual(len(body.splitlines()), 49)
+
+    def test_excel_has_every_row(self):
+        with mock.patch.object(views, 'READ_CHUNK_ROWS', 7):
+            sheets = xlsx_sheet_rows(io.BytesIO(self._download(format='excel')))
+        self.assertEqual(sheets, {'Sheet1': 51})
+
+    def test_repeat_download_is_served_from_cache(self):
+        first = self._download(delimiter=';')
+        with mock.patch.object(views.pd, 'read_csv') as read_csv, self.assertNoPayloadLoaded():
+            self.assertEqual(self._download(delimiter=';'), first)
+        read_csv.assert_not_called()
+        # Other options are another conversion
+        self.assertNotEqual(self._download(delimiter='\t'), first)
+
+    def test_changed_dataset_is_converted_again(self):
+        self._download()
+        self.dataset.content = 'E,I\n1,2\n'
+        self.dataset.save()
+        self.assertEqual(self._download(), b'E,I\n1,2\n')
+
+
+class StreamingIngestTests(TemporaryMediaMixin, SimpleTestCase):
+    """Uploads are decoded and parsed chunk by chunk"""
+
+    def test_lines_split_across_chunks(self):
+        data = 'É,1\nµ,2\nlast'.encode('utf-8')
+        chunks = [data[index:index + 3] for index in range(0, len(data), 3)]
+        self.assertEqual(list(iter_lines(chunks)), ['É,1\n', 'µ,2\n', 'last'])
+
+    def test_invalid_text(self):
+        with self.assertRaisesMessage(IngestError, 'not valid utf-8'):
+            list(iter_lines([b'E,I\n', b'\xff\xfe\n']))
+        with self.assertRaisesMessage(IngestError, 'Unknown encoding'):
+            list(iter_lines([b'E,I\n'], encoding='no-such-codec'))
+
+    def test_small_chunks_parse_like_the_whole_file(self):
+        upload = SimpleUploadedFile('run.csv', CSV.encode('utf-8'))
+        with mock.patch.object(ingest, 'CHUNK_SIZE', 7):
+            trace = read_upload_trace(upload)
+        expected = parse_trace(io.StringIO(CSV))
+        self.assertEqual(len(trace), 200)
+        np.testing.assert_array_equal(trace.potential, expected.potential)
+        np.testing.assert_array_equal(trace.current, expected.current)
+        np.testing.assert_array_equal(trace.time, expected.time)
+
+    def test_header_locates_channels(self):
+        text = '# exported by the potentiostat\nt;I [mA];Ewe (V)\n\n0;1.5;-0.2\n1;;-0.1\n'
+        trace = parse_trace(io.StringIO(text), ';')
+        np.testing.assert_array_equal(trace.potential, [-0.2, -0.1])
+        np.testing.assert_array_equal(trace.time, [0.0, 1.0])
+        self.assertEqual(trace.current[0], 1.5)
+        self.assertTrue(np.isnan(trace.current[1]))
+
+    def test_headerless_columns(self):
+        trace = parse_trace(io.StringIO('0.1,2.0,0\n0.2,4.0,1\n'))
+        np.testing.assert_array_equal(trace.current, [2.0, 4.0])
+
+    def test_malformed_rows(self):
+        with self.assertRaisesMessage(IngestError, 'Line 3: expected 3 columns, found 2'):
+            parse_trace(io.StringIO('E,I,t\n0,1,0\n0,1\n'))
+        with self.assertRaisesMessage(IngestError, "Line 2: 'abc' is not a number"):
+            parse_trace(io.StringIO('E,I,t\nabc,1,0\n'))
+
+    def test_files_without_a_trace(self):
+        self.assertIsNone(parse_trace(io.StringIO('Name,Value\nscan rate,100\n')))
+        self.assertIsNone(parse_trace(io.StringIO('')))
+        self.assertEqual(store_trace(None), (None, 0))
+
+    def test_store_trace(self):
+        trace = parse_trace(io.StringIO(CSV))
+        digest, num_points = store_trace(trace)
+        self.assertEqual(num_points, 200)
+        np.testing.assert_array_equal(read_trace(digest).current, trace.current)
+
+
+class BlobReferenceTests(TemporaryMediaMixin, TestCase):
+    """Shared blobs are counted per reference and only collected when unreferenced"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='uploader', password='secret')
+
+    def _blob(self, kind, digest):
+        return Blob.objects.get(kind=kind, digest=digest)
+
+    def _file_digest(self, upload):
+        return blobs.reference_digest(KIND_FILE, upload.file.name)
+
+    def test_identical_uploads_share_blobs(self):
+        first, second = _upload(self.user), _upload(self.user, name='copy.csv')
+        self.assertEqual(first.file.name, second.file.name)
+        self.assertEqual(first.trace_digest, second.trace_digest)
+        self.assertEqual(self._blob(KIND_FILE, self._file_digest(first)).ref_count, 2)
+        self.assertEqual(self._blob(KIND_TRACE, first.trace_digest).ref_count, 2)
+
+    def test_deleting_a_shared_blob_keeps_it_for_the_other_reference(self):
+        first, second = _upload(self.user), _upload(self.user, name='copy.csv')
+        digest = self._file_digest(first)
+        path = blob_storage.path(first.file.name)
+
+        first.delete()
+        self.assertEqual(self._blob(KIND_FILE, digest).ref_count, 1)
+        blobs.collect_garbage(timedelta(0))
+        self.assertTrue(os.path.exists(path))
+        self.assertEqual(FileUpload.objects.get(pk=second.pk).read_content(), CSV)
+
+        second.delete()
+        self.assertEqual(self._blob(KIND_FILE, digest).ref_count, 0)
+        removed, freed = blobs.collect_garbage(timedelta(0))
+        # The file and the trace
+        self.assertEqual(removed, 2)
+        self.assertGreater(freed, len(CSV))
+        self.assertFalse(os.path.exists(path))
+        self.assertFalse(os.path.exists(trace_path(second.trace_digest)))
+        self.assertFalse(Blob.objects.exists())
+
+    def test_recently_released_blobs_are_kept(self):
+        upload = _upload(self.user)
+        upload.delete()
+        self.assertEqual(blobs.collect_garbage(timedelta(hours=1)), (0, 0))
+        self.assertTrue(os.path.exists(blob_storage.path(upload.file.name)))
+
+    def test_dry_run_deletes_nothing(self):
+        upload = _upload(self.user)
+        upload.delete()
+        path = blob_storage.path(upload.file.name)
+        size = os.path.getsize(path)
+
+        removed, freed = blobs.collect_garbage(timedelta(0), dry_run=True)
+        self.assertEqual(removed, 2)
+        self.assertGreater(freed, size)
+        self.assertTrue(os.path.exists(path))
+        self.assertTrue(os.path.exists(trace_path(upload.trace_digest)))
+        self.assertEqual(Blob.objects.filter(ref_count=0).count(), 2)
+
+        self.assertEqual(blobs.collect_garbage(timedelta(0)), (removed, freed))
+        self.assertFalse(os.path.exists(path))
+
+    def test_unrecorded_data_is_collected_when_old(self):
+        # Stored by an upload that failed before its row was saved
+        name = blob_storage.save('orphan.csv', ContentFile(b'E,I\n0,1\n'))
+        path = blob_storage.path(name)
+        self.assertEqual(blobs.collect_garbage(timedelta(hours=1)), (0, 0))
+
+        old = os.path.getmtime(path) - 2 * 60 * 60
+        os.utime(path, (old, old))
+        size = os.path.getsize(path)
+        self.assertEqual(blobs.collect_garbage(timedelta(hours=1)), (1, size))
+        self.assertFalse(os.path.exists(path))
+
+    def test_recount_repairs_counts(self):
+        first, second = _upload(self.user), _upload(self.user, name='copy.csv')
+        # Bypasses the signals
+        FileUpload.objects.filter(pk=first.pk).update(file=None, trace_digest=None)
+        self.assertEqual(blobs.recount(), 2)
+        self.assertEqual(self._blob(KIND_FILE, self._file_digest(second)).ref_count, 1)
+        self.assertEqual(self._blob(KIND_TRACE, second.trace_digest).ref_count, 1)
+        self.assertEqual(blobs.recount(), 0)
+
+
+def _edited(text, row, value):
+    lines = text.splitlines(keepends=True)
+    lines[row] = value
+    return ''.join(lines)
+
+
+@override_settings(VERSION_SNAPSHOT_INTERVAL=10)
+class UploadDeltaTests(TemporaryMediaMixin, TestCase):
+    """Older upload versions keep only a delta and read back unchanged"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='uploader', password='secret')
+
+    def _versions(self, count):
+        texts = [CSV]
+        versions = [_upload(self.user)]
+        for number in range(1, count):
+            texts.append(_edited(texts[-1], 10 * number, f'{number},1.0e-03,{number}.0\n'))
+            versions.append(versions[-1].create_new_version(texts[-1]))
+        return [FileUpload.objects.get(pk=version.pk) for version in versions], texts
+
+    def test_older_versions_round_trip(self):
+        versions, texts = self._versions(4)
+        for version, text in zip(versions[:-1], texts):
+            self.assertTrue(version.delta_base_id)
+            self.assertFalse(version.file)
+            self.assertIsNone(version.trace_digest)
+            self.assertEqual(version.read_content(), text)
+            expected = parse_trace(io.StringIO(text), ',')
+            np.testing.assert_array_equal(version.get_trace().current, expected.current)
+        self.assertEqual(versions[-1].read_content(), texts[-1])
+        self.assertFalse(versions[-1].delta_base_id)
+
+    def test_unchanged_version_shares_the_file(self):
+        first = _upload(self.user)
+        second = first.create_new_version(CSV)
+        first = FileUpload.objects.get(pk=first.pk)
+        self.assertFalse(first.delta_base_id)
+        self.assertEqual(first.file.name, second.file.name)
+
+    @override_settings(VERSION_SNAPSHOT_INTERVAL=2)
+    def test_snapshots_are_kept_in_full(self):
+        versions, texts = self._versions(4)
+        self.assertTrue(versions[0].delta_base_id)
+        self.assertFalse(versions[1].delta_base_id)
+        self.assertTrue(versions[1].file)
+        self.assertEqual(versions[0].read_content(), texts[0])
+
+    def test_rows_split_at_newlines_only(self):
+        text = 'E,I,t\r\n0.1,2.0,0\r\n0.2,4.0,1\r\n'
+        first = _upload(self.user, text)
+        first.create_new_version(text.replace('4.0', '5.0'))
+        first = FileUpload.objects.get(pk=first.pk)
+        self.assertTrue(first.delta_base_id)
+        self.assertEqual(first.read_content(), text)
+
+    @override_settings(DELTA_MAX_BYTES=100)
+    def test_large_versions_are_kept_in_full(self):
+        versions, texts = self._versions(2)
+        self.assertFalse(versions[0].delta_base_id)
+        self.assertTrue(versions[0].file)
+        self.assertEqual(versions[0].read_content(), texts[0])
+
+    def test_rebuilt_version_is_streamed_to_a_temporary_file(self):
+        versions, texts = self._versions(3)
+        with versions[0].open_content() as content:
+            self.assertNotIsInstance(content, io.BytesIO)
+            self.assertEqual(content.read().decode('utf-8'), texts[0])
+
+    def test_deleting_a_base_materializes_older_versions(self):
+        versions, texts = self._versions(3)
+        versions[1].delete()
+        first = FileUpload.objects.get(pk=versions[0].pk)
+        self.assertFalse(first.delta_base_id)
+        self.assertTrue(first.file)
+        self.assertTrue(first.trace_digest)
+        self.assertEqual(first.read_content(), texts[0])
@@ -1,13 +1,19 @@
+import shutil
 import traceback
-from django.http import HttpResponse
+from itertools import chain
+from django.http import FileResponse, HttpResponse
 from rest_framework import serializers
 from rest_framework import status
 from rest_framework.generics import ListAPIView, CreateAPIView
+from rest_framework.negotiation import DefaultContentNegotiation
 from rest_framework.permissions import IsAuthenticated
 from rest_framework.response import Response
 import io
 import pandas as pd
 
+from apps.common.excel import EXCEL_CONTENT_TYPE, write_workbook
+from . import conversions
+from .ingest import IngestError, read_upload_trace, store_trace
 from .models import DataCategory, DataType, Dataset, FileUpload
 from .serializers import DataCategorySerializer, DataTypeSerializer, FileUploadSerializer
 
@@ -31,7 +37,8 @@ class DataCategoriesListView(ListAPIView):
 class FileUploadCreateView(CreateAPIView):
     """
     API view to handle file uploads from authenticated users.
-    Files will be parsed and stored as text in the database.
+    Files are streamed to storage and their potential/current/time columns
+    are parsed, chunk by chunk, into the trace store.
     """
     permission_classes = [IsAuthenticated]
     serializer_class = FileUploadSerializer
@@ -57,14 +64,22 @@ class FileUploadCreateView(CreateAPIView):
                 raise serializers.ValidationError(
                     {'error': 'Invalid category'})
 
-        # Read and store file content
-        content = file.read().decode('utf-8')
+        # Validate and parse the file while streaming it
+        delimiter = serializer.validated_data.get('delimiter') or ','
+        try:
+            trace = read_upload_trace(file, delimiter)
+        except IngestError as e:
+            raise serializers.ValidationError({'error': str(e)})
+
+        trace_digest, num_points = store_trace(trace)
 
-        # Save file as a new upload record
+        # Save file as a new upload record; storage copies the file in chunks
         file_upload = serializer.save(
             file_name=file.name,
-            content=content,  # Store as text
+            file=file,
             file_size=file.size,
+            trace_digest=trace_digest,
+            num_points=num_points,
             uploaded_by=self.request.user,
             data_type=data_type,
             category=category
@@ -79,10 +94,34 @@ class FileUploadCreateView(CreateAPIView):
         }, status=status.HTTP_201_CREATED)
 
 
+# Rows parsed at a time when converting a dataset for download
+READ_CHUNK_ROWS = 10000
+
+
+def _dataframe_rows(df, chunk_size=READ_CHUNK_ROWS):
+    """Yield DataFrame rows as tuples with missing values as None"""
+    for offset in range(0, len(df), chunk_size):
+        chunk = df.iloc[offset:offset + chunk_size].astype(object)
+        yield from chunk.where(chunk.notna(), None).itertuples(index=False, name=None)
+
+
+class DownloadNegotiation(DefaultContentNegotiation):
+    """Content negotiation that leaves ``?format=`` (csv or excel) to the view"""
+
+    def select_renderer(self, request, renderers, format_suffix=None):
+        return super().select_renderer(request, renderers, format_suffix or renderers[0].format)
+
+
 class DownloadView(ListAPIView):
     """
     API view to handle file downloads, converting stored text data to the requested format.
     """
+    # format -> (file extension, content type)
+    FORMATS = {
+        'csv': ('csv', 'text/csv'),
+        'excel': ('xlsx', EXCEL_CONTENT_TYPE),
+    }
+    content_negotiation_class = DownloadNegotiation
 
     # def get(self, request):
     #     dataset = request.query_params.get('dataset')
@@ -170,45 +209,58 @@ class DownloadView(ListAPIView):
         encoding = request.query_params.get('encoding', 'utf-8')
         skiprows = request.query_params.get('skiprows', 0)
 
+        if format not in self.FORMATS:
+            return Response({'error': 'Invalid format'}, status=status.HTTP_400_BAD_REQUEST)
+
         try:
+            # The content column is only loaded below, on a cache miss
             dataset = Dataset.objects.get(id=dataset_id)
-            content = dataset.content
-            if not content:
+            digest = conversions.content_digest(dataset)
+            if digest is None:
                 return Response({'error': 'File content not found'}, status=status.HTTP_404_NOT_FOUND)
 
-            # Process the content based on the original delimiter and requested format
-            original_delimiter = ','
-            df = pd.read_csv(io.StringIO(
-                content), sep=original_delimiter, encoding=encoding, skiprows=int(skiprows))
-
-            if format == 'csv':
-                response = HttpResponse(content_type='text/csv')
-                response['Content-Disposition'] = f'attachment; filename="{dataset.title}.csv"'
-                df.to_csv(
-                    path_or_buf=response,
-                    sep=delimiter,
-                    index=False,
-                    header=headers
-                )
-                return response
-
-            elif format == 'excel':
-                response = HttpResponse(
-                    content_type='application/vnd.openxmlformats-officedocument.spreadsheetml.sheet')
-                response['Content-Disposition'] = f'attachment; filename="{dataset.title}.xlsx"'
-                with io.BytesIO() as output:
-                    with pd.ExcelWriter(output, engine='openpyxl') as writer:
-                        df.to_excel(writer, index=False, header=headers)
-                    response.write(output.getvalue())
-                return response
-            else:
-                return Response({'error': 'Invalid format'}, status=status.HTTP_400_BAD_REQUEST)
+            # Repeat downloads with the same options are served from disk
+            key = conversions.conversion_key(
+                digest, format=format, delimiter=delimiter,
+                headers=headers, encoding=encoding, skiprows=int(skiprows))
+            output = conversions.get_cached(key)
+            if output is None:
+                # Process the content based on the original delimiter and requested format
+                original_delimiter = ','
+                # Parsed and written chunk by chunk, never as one DataFrame
+                with dataset.open_content() as content, pd.read_csv(
+                        content, sep=original_delimiter, encoding=encoding,
+                        skiprows=int(skiprows), chunksize=READ_CHUNK_ROWS) as chunks:
+                    output = conversions.store(
+                        key, lambda file: self._render(chunks, format, delimiter, headers, file))
+
+            extension, content_type = self.FORMATS[format]
+            return FileResponse(output, as_attachment=True, filename=f'{dataset.title}.{extension}',
+                                content_type=content_type)
         except FileUpload.DoesNotExist:
             return Response({'error': 'File not found'}, status=status.HTTP_404_NOT_FOUND)
         except Exception as e:
             print(traceback.print_exc())
             return Response({'error': str(e)}, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
 
+    @staticmethod
+    def _render(chunks, format, delimiter, headers, file):
+        """Write the DataFrame chunks of a parsed dataset in the requested format"""
+        chunks = iter(chunks)
+        first = next(chunks, None)
+        if first is None:
+            return
+        chunks = chain([first], chunks)
+        if format == 'csv':
+            for number, df in enumerate(chunks):
+                df.to_csv(path_or_buf=file, sep=delimiter, index=False,
+                          header=headers and number == 0, encoding='utf-8')
+        else:
+            header = [str(column) for column in first.columns] if headers else None
+            rows = (row for df in chunks for row in _dataframe_rows(df))
+            with write_workbook([('Sheet1', header, rows)]) as workbook:
+                shutil.copyfileobj(workbook, file)
+
     def _generate_sample_data(self, dataset_id, file_format, delimiter):
         if 'voltammetry' in dataset_id.lower():
             import numpy as np
@@ -1,5 +1,5 @@
 from django.contrib import admin
-from .models import Experiment, ExperimentFile, Instrument, Electrode, VoltammetryTechnique
+from .models import Experiment, ExperimentFile, ExportJob, Instrument, Electrode, VoltammetryTechnique
 
 admin.site.register(Instrument)
 admin.site.register(Electrode)
@@ -61,8 +61,8 @@ class ExperimentAdmin(admin.ModelAdmin):
         ),
         (
             'Data', {
-                'fields': ('data_points',),
-            }   
+                'fields': ('trace_digest', 'num_points', 'trace_delta', 'delta_base', 'data_points'),
+            }
         ),
         (
             'Calculated Metrics', {
@@ -71,10 +71,12 @@ class ExperimentAdmin(admin.ModelAdmin):
                     'peak_cathodic_current',
                     'peak_anodic_potential',
                     'peak_cathodic_potential',
+                    'analysis_version',
                 )
             }
         ),
     )
+    readonly_fields = ('trace_digest', 'num_points', 'trace_delta', 'delta_base', 'analysis_version')
     date_hierarchy = 'created_at'
 
 
@@ -101,3 +103,29 @@ class ExperimentFileAdmin(admin.ModelAdmin):
     )
 
     date_hierarchy = 'created_at'
+
+
+@admin.register(ExportJob)
+class ExportJobAdmin(admin.ModelAdmin):
+    list_display = (
+        'job_id',
+        'created_by',
+        'research',
+        'file_format',
+        'status',
+        'processed',
+        'total',
+        'created_at'
+    )
+
+    list_filter = (
+        'status',
+        'file_format'
+    )
+
+    search_fields = (
+        'job_id',
+        'created_by__username'
+    )
+
+    date_hierarchy = 'created_at'
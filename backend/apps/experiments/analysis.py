@@ -0,0 +1,114 @@
+"""
+Peak metrics for voltammetry traces.
+
+The trace is split at its switching potential into an anodic (increasing
+potential) and a cathodic sweep, in whichever order the scan runs. Each
+sweep is optionally smoothed with a moving average and corrected for the
+capacitive background by subtracting a line fitted to the start of the
+sweep. The anodic peak is the maximum of the corrected anodic sweep and the
+cathodic peak the minimum of the corrected cathodic sweep; peak currents are
+reported relative to that baseline.
+"""
+import numpy as np
+
+from .traces import read_trace
+
+# Bump whenever a change here alters the computed metrics, so that
+# `manage.py reanalyze_experiments` picks up every experiment again
+ANALYSIS_VERSION = 1
+
+DEFAULT_SMOOTHING_WINDOW = 5
+# Share of each sweep used to fit the linear baseline
+BASELINE_FRACTION = 0.1
+# Potential steps that decide the direction a scan starts in
+DIRECTION_STEPS = 10
+# Techniques without a potential sweep have no voltammetric peaks
+NO_SWEEP_TYPES = ('chronoamperometry',)
+
+METRIC_FIELDS = (
+    'peak_anodic_current',
+    'peak_anodic_potential',
+    'peak_cathodic_current',
+    'peak_cathodic_potential',
+)
+
+
+def sweep_direction(potential, steps=DIRECTION_STEPS):
+    """
+    1 if the scan starts towards positive potentials (anodic), -1 if it
+    starts towards negative ones, judged by the first non-zero potential steps
+    """
+    changes = np.diff(potential[np.isfinite(potential)])
+    changes = changes[changes != 0][:steps]
+    return -1 if changes.sum() < 0 else 1
+
+
+def split_sweeps(potential):
+    """
+    Return the ``(anodic, cathodic)`` slices of a scan, split at its first
+    turning point: the highest potential of an anodic-first scan or the
+    lowest of a cathodic-first one
+    """
+    n = len(potential)
+    if n < 2 or not np.isfinite(potential).any():
+        return slice(0, n), slice(0, 0)
+    if sweep_direction(potential) > 0:
+        turn = int(np.nanargmax(potential))
+        return slice(0, turn + 1), slice(turn, n)
+    turn = int(np.nanargmin(potential))
+    return slice(turn, n), slice(0, turn + 1)
+
+
+def smooth(values, window=DEFAULT_SMOOTHING_WINDOW):
+    """Centered moving average; the ends are averaged over the shorter window"""
+    if window is None or window < 2 or len(values) < window:
+        return values
+    kernel = np.ones(window)
+    total = np.convolve(values, kernel, mode='same')
+    counts = np.convolve(np.ones(len(values)), kernel, mode='same')
+    return total / counts
+
+
+def subtract_baseline(potential, current, fraction=BASELINE_FRACTION):
+    """Subtract a straight line fitted to the first part of the sweep"""
+    count = max(2, int(len(potential) * fraction))
+    if len(potential) < 3 or np.ptp(potential[:count]) == 0:
+        return current
+    slope, intercept = np.polyfit(potential[:count], current[:count], 1)
+    return current - (slope * potential + intercept)
+
+
+def _sweep_peak(potential, current, largest, smoothing_window, baseline):
+    valid = np.isfinite(potential) & np.isfinite(current)
+    potential, current = potential[valid], current[valid]
+    if len(potential) < 3:
+        return None, None
+    current = smooth(current, smoothing_window)
+    if baseline:
+        current = subtract_baseline(potential, current)
+    index = int(np.argmax(current) if largest else np.argmin(current))
+    return float(current[index]), float(potential[index])
+
+
+def analyze_trace(trace, experiment_type=None,
+                  smoothing_window=DEFAULT_SMOOTHING_WINDOW, baseline=True):
+    """Return the peak metrics of a Trace as ``{field: value}``"""
+    metrics = dict.fromkeys(METRIC_FIELDS)
+    if experiment_type in NO_SWEEP_TYPES or len(trace) < 3:
+        return metrics
+
+    potential = np.asarray(trace.potential)
+    current = np.asarray(trace.current)
+    anodic, cathodic = split_sweeps(potential)
+
+    metrics['peak_anodic_current'], metrics['peak_anodic_potential'] = _sweep_peak(
+        potential[anodic], current[anodic], True, smoothing_window, baseline)
+    metrics['peak_cathodic_current'], metrics['peak_cathodic_potential'] = _sweep_peak(
+        potential[cathodic], current[cathodic], False, smoothing_window, baseline)
+    return metrics
+
+
+def analyze_stored_trace(trace_digest, experiment_type=None, **options):
+    """analyze_trace() on a trace read (memory-mapped) from the trace store"""
+    return analyze_trace(
+        read_trace(trace_digest, mmap=True), experiment_type, **options)
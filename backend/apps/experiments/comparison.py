@@ -0,0 +1,182 @@
+"""
+Comparison of several voltammetry traces on a common potential grid.
+
+Every trace is split into its forward (increasing potential) and reverse
+branches, and each branch is interpolated onto the same grid. The stacked
+curves are then compared with vectorized correlation, RMS difference and
+peak-position/peak-current deltas. Each pair of curves is compared on the
+grid points both of them cover, so one short trace does not shrink the
+comparison of all the others.
+"""
+import logging
+
+import numpy as np
+
+logger = logging.getLogger(__name__)
+
+DEFAULT_GRID_POINTS = 500
+
+
+def _branch(potential, current, forward):
+    """Points of the forward or reverse sweep, sorted by potential"""
+    step = np.diff(potential, prepend=potential[:1])
+    mask = step > 0 if forward else step < 0
+    if not mask.any():
+        # Monotonic traces (e.g. linear sweeps) only have one branch
+        mask = np.ones(len(potential), dtype=bool) if forward else mask
+    order = np.argsort(potential[mask], kind='stable')
+    return potential[mask][order], current[mask][order]
+
+
+def _interpolate(potential, current, grid):
+    if len(potential) < 2:
+        return np.full(len(grid), np.nan)
+    return np.interp(grid, potential, current, left=np.nan, right=np.nan)
+
+
+def _peak(grid, curve, largest):
+    """Potential and current of the maximum (or minimum) of a curve"""
+    if np.isnan(curve).all():
+        return np.nan, np.nan
+    index = np.nanargmax(curve) if largest else np.nanargmin(curve)
+    return grid[index], curve[index]
+
+
+def _matrix(values):
+    values = np.asarray(values, dtype=np.float64)
+    return np.where(np.isfinite(values), values, None).tolist()
+
+
+def _scalar(value):
+    return float(value) if np.isfinite(value) else None
+
+
+def _pairwise(curves):
+    """
+    Correlation, RMS difference and number of compared points of every pair
+    of rows, each over the columns where both rows are finite. Pairs with
+    fewer than two such columns are NaN.
+    """
+    covered = np.isfinite(curves)
+    mask = covered.astype(np.float64)
+    values = np.where(covered, curves, 0.0)
+    counts = mask @ mask.T
+    # [i, j] sums over the columns shared by rows i and j
+    sums = values @ mask.T
+    squares = (values * values) @ mask.T
+    products = values @ values.T
+
+    with np.errstate(invalid='ignore', divide='ignore'):
+        n = np.where(counts >= 2, counts, np.nan)
+        covariance = products - sums * sums.T / n
+        variance = squares - sums * sums / n
+        # Flat curves have no defined correlation and come out as NaN
+        correlation = covariance / np.sqrt(variance * variance.T)
+        rms = np.sqrt(np.clip(squares + squares.T - 2 * products, 0, None) / n)
+    return np.clip(correlation, -1, 1), rms, counts.astype(int)
+
+
+def compare_traces(traces, grid_points=DEFAULT_GRID_POINTS):
+    """
+    Compare a mapping of ``{experiment_id: Trace}``.
+    Returns a JSON-serializable dict with the common grid, the pairwise
+    correlation and RMS-difference matrices and the peak deltas.
+    """
+    ids = list(traces)
+    cleaned = {}
+    for experiment_id in ids:
+        trace = traces[experiment_id]
+        valid = np.isfinite(trace.potential) & np.isfinite(trace.current)
+        cleaned[experiment_id] = (
+            np.asarray(trace.potential[valid]), np.asarray(trace.current[valid]))
+
+    non_empty = [p for p, _ in cleaned.values() if len(p)]
+    if len(non_empty) < 2:
+        raise ValueError('At least two datasets with data points are required')
+
+    # Use the potential window shared by all traces; fall back to the union
+    low = max(p.min() for p in non_empty)
+    high = min(p.max() for p in non_empty)
+    if low >= high:
+        low = min(p.min() for p in non_empty)
+        high = max(p.max() for p in non_empty)
+    grid = np.linspace(low, high, grid_points)
+
+    forward = np.empty((len(ids), grid_points))
+    reverse = np.empty((len(ids), grid_points))
+    for row, experiment_id in enumerate(ids):
+        potential, current = cleaned[experiment_id]
+        forward[row] = _interpolate(*_branch(potential, current, True), grid)
+        reverse[row] = _interpolate(*_branch(potential, current, False), grid)
+
+    correlation, rms, compared = _pairwise(np.concatenate([forward, reverse], axis=1))
+
+    anodic = np.array([_peak(grid, curve, True) for curve in forward])
+    cathodic = np.array([_peak(grid, curve, False) for curve in reverse])
+
+    def deltas(values):
+        return values[None, :] - values[:, None]
+
+    off_diagonal = correlation[~np.eye(len(ids), dtype=bool)]
+    return {
+        'summary': f'Comparison between {len(ids)} datasets',
+        'experiment_ids': ids,
+        'grid': {
+            'start': float(low),
+            'stop': float(high),
+            'points': grid_points,
+        },
+        'correlation': _scalar(np.nanmean(off_diagonal)) if np.isfinite(off_diagonal).any() else None,
+        'correlation_matrix': _matrix(correlation),
+        'rms_difference': _matrix(rms),
+        # Grid points (of both branches) each pair was compared on
+        'compared_points': compared.tolist(),
+        'peaks': {
+            experiment_id: {
+                'anodic_potential': _scalar(anodic[row, 0]),
+                'anodic_current': _scalar(anodic[row, 1]),
+                'cathodic_potential': _scalar(cathodic[row, 0]),
+                'cathodic_current': _scalar(cathodic[row, 1]),
+            }
+            for row, experiment_id in enumerate(ids)
+        },
+        # Entry [i][j] is the value of dataset j minus the value of dataset i
+        'peak_differences': {
+            'anodic': {
+                'potential': _matrix(deltas(anodic[:, 0])),
+                'current': _matrix(deltas(anodic[:, 1])),
+            },
+            'cathodic': {
+                'potential': _matrix(deltas(cathodic[:, 0])),
+                'current': _matrix(deltas(cathodic[:, 1])),
+            },
+        },
+    }
+
+
+def run_comparison(comparison_pk):
+    """Compute and store the results of a DatasetComparison"""
+    from apps.data.models import DatasetComparison
+    from .models import Experiment
+
+    comparison = DatasetComparison.objects.get(pk=comparison_pk)
+    comparison.status = 'running'
+    comparison.save(update_fields=['status', 'updated_at'])
+    try:
+        experiments = Experiment.objects.filter(
+            experiment_id__in=comparison.datasets)
+        traces = {
+            experiment.experiment_id: experiment.get_trace(mmap=True)
+            for experiment in experiments
+        }
+        # Keep the order in which the datasets were selected
+        traces = {i: traces[i] for i in comparison.datasets if i in traces}
+        comparison.comparison_results = compare_traces(traces)
+        comparison.status = 'completed'
+    except Exception as e:
+        logger.exception('Dataset comparison %s failed', comparison.comparison_id)
+        comparison.comparison_results = {'error': str(e)}
+        comparison.status = 'failed'
+    comparison.save(
+        update_fields=['comparison_results', 'status', 'updated_at'])
+    return comparison
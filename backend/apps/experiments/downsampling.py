@@ -0,0 +1,115 @@
+"""
+Level-of-detail reduction for plotting long traces.
+
+Both modes return the *indices* of the points to keep, so callers can pick
+any channel of a trace with the same selection.
+
+- ``lttb``: Largest-Triangle-Three-Buckets, keeps the visually dominant point
+  of every bucket and preserves the overall shape of the curve.
+- ``minmax``: keeps the minimum and maximum of every bucket, so narrow spikes
+  are never dropped.
+"""
+import numpy as np
+
+MODES = ('lttb', 'minmax')
+
+
+def _end_points(n, threshold):
+    return np.array([0, n - 1], dtype=np.int64)[:max(threshold, 0)]
+
+
+def lttb_indices(x, y, threshold):
+    """Select ``threshold`` points from (x, y) with Largest-Triangle-Three-Buckets"""
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    n = len(x)
+    if threshold >= n:
+        return np.arange(n)
+    if threshold < 3:
+        # No room for a bucket between the end points
+        return _end_points(n, threshold)
+
+    # The first and last points are always kept; the rest is split into
+    # threshold - 2 buckets of (nearly) equal size.
+    edges = np.linspace(1, n - 1, threshold - 1).astype(np.int64)
+    starts, ends = edges[:-1], edges[1:]
+
+    # Average of every bucket, used as the third vertex for the previous one
+    counts = ends - starts
+    sum_x = np.add.reduceat(x[1:n - 1], starts - 1)
+    sum_y = np.add.reduceat(y[1:n - 1], starts - 1)
+    avg_x = np.append(sum_x / counts, x[-1])
+    avg_y = np.append(sum_y / counts, y[-1])
+
+    selected = np.empty(threshold, dtype=np.int64)
+    selected[0] = 0
+    selected[-1] = n - 1
+    anchor = 0
+    for i in range(threshold - 2):
+        lo, hi = starts[i], ends[i]
+        ax, ay = x[anchor], y[anchor]
+        cx, cy = avg_x[i + 1], avg_y[i + 1]
+        # Twice the triangle area for every candidate in the bucket
+        areas = np.abs((ax - cx) * (y[lo:hi] - ay) - (ax - x[lo:hi]) * (cy - ay))
+        anchor = lo + int(np.argmax(areas))
+        selected[i + 1] = anchor
+    return selected
+
+
+def minmax_indices(y, threshold):
+    """
+    Select the minimum and maximum of equal buckets, plus both end points,
+    at most ``threshold`` indices in all
+    """
+    y = np.asarray(y, dtype=np.float64)
+    n = len(y)
+    if threshold >= n:
+        return np.arange(n)
+    # Two points per bucket besides the end points
+    buckets = (threshold - 2) // 2
+    if buckets < 1:
+        return _end_points(n, threshold)
+
+    size = -(-n // buckets)
+    buckets = -(-n // size)
+    padded = np.full(buckets * size, np.nan)
+    padded[:n] = y
+    padded = padded.reshape(buckets, size)
+
+    offsets = np.arange(buckets) * size
+    lows = offsets + np.nanargmin(padded, axis=1)
+    highs = offsets + np.nanargmax(padded, axis=1)
+    pairs = np.sort(np.stack([lows, highs], axis=1), axis=1).ravel()
+    # Keep the end points so the x-range of the plot does not shrink
+    return np.unique(np.concatenate([[0], pairs, [n - 1]]))
+
+
+def downsample_indices(x, y, threshold, mode='lttb'):
+    """
+    Return the indices of at most ``threshold`` points of (x, y).
+    Points with a missing x or y value are skipped.
+    """
+    if mode not in MODES:
+        raise ValueError(f"Unknown downsampling mode: {mode}")
+
+    x = np.asarray(x, dtype=np.float64)
+    y = np.asarray(y, dtype=np.float64)
+    valid = np.flatnonzero(np.isfinite(x) & np.isfinite(y))
+    if len(valid) == len(x):
+        x_valid, y_valid = x, y
+    else:
+        x_valid, y_valid = x[valid], y[valid]
+
+    if mode == 'lttb':
+        keep = lttb_indices(x_valid, y_valid, threshold)
+    else:
+        keep = minmax_indices(y_valid, threshold)
+    return valid[keep]
+
+
+def downsample(x, y, threshold, mode='lttb'):
+    """Return the reduced ``(x, y)`` arrays"""
+    x = np.asarray(x)
+    y = np.asarray(y)
+    keep = downsample_indices(x, y, threshold, mode)
+    return x[keep], y[keep]
@@ -0,0 +1,115 @@
+"""
+Bulk export of experiments into a ZIP archive.
+
+Jobs are recorded as ExportJob rows and run on the background pool, so the
+request that creates a job returns immediately; clients poll the job for
+progress and download the archive once it is completed.
+"""
+import json
+import logging
+import os
+import zipfile
+from datetime import timedelta
+
+from django.conf import settings
+from django.utils import timezone
+
+from apps.common import tasks
+from .models import Experiment, ExportJob
+
+logger = logging.getLogger(__name__)
+
+
+def submit_export(job):
+    """Queue an ExportJob on the background pool"""
+    return tasks.submit(run_export, job.pk)
+
+
+def archive_path(job):
+    return os.path.join(settings.EXPORT_ROOT, f'{job.job_id}.zip')
+
+
+def fail_stale_jobs(queryset=None):
+    """
+    Mark pending or running jobs that have not progressed for
+    ``settings.EXPORT_JOB_TIMEOUT`` seconds as failed, such as jobs lost when
+    the process running the pool exited. Returns the number of jobs marked.
+    """
+    if queryset is None:
+        queryset = ExportJob.objects.all()
+    now = timezone.now()
+    return queryset.filter(
+        status__in=('pending', 'running'),
+        updated_at__lt=now - timedelta(seconds=settings.EXPORT_JOB_TIMEOUT),
+    ).update(status='failed', error='The export timed out', updated_at=now)
+
+
+def run_export(job_pk):
+    """Build the archive for a job; runs on a worker thread"""
+    job = ExportJob.objects.get(pk=job_pk)
+    if job.status != 'pending':
+        # Timed out while it was queued
+        return
+    job.status = 'running'
+    job.save(update_fields=['status', 'updated_at'])
+    try:
+        _write_archive(job)
+    except Exception as e:
+        logger.exception('Export job %s failed', job.job_id)
+        job.status = 'failed'
+        job.error = str(e)
+        job.save(update_fields=['status', 'error', 'updated_at'])
+
+
+def _write_archive(job):
+    # Imported here to keep the experiments app free of a module-level
+    # dependency on the dashboard app
+    from apps.dashboard.export import experiment_csv_chunks, experiment_json_chunks
+    chunks_for = {
+        'csv': experiment_csv_chunks,
+        'json': experiment_json_chunks,
+    }[job.file_format]
+
+    experiments = Experiment.objects.filter(
+        experiment_id__in=job.experiment_ids).order_by('experiment_id')
+    found = set()
+    entries = []
+
+    path = archive_path(job)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    partial = f'{path}.part'
+    with zipfile.ZipFile(partial, 'w', compression=zipfile.ZIP_DEFLATED) as archive:
+        for experiment in experiments.iterator():
+            file_name = f'{experiment.experiment_id}.{job.file_format}'
+            # Write through the zip stream so a trace is never held in memory whole
+            with archive.open(file_name, 'w', force_zip64=True) as member:
+                for chunk in chunks_for(experiment):
+                    member.write(chunk.encode('utf-8'))
+
+            found.add(experiment.experiment_id)
+            entries.append({
+                'experiment_id': experiment.experiment_id,
+                'title': experiment.title,
+                'experiment_type': experiment.experiment_type,
+                'version': experiment.version,
+                'num_points': experiment.num_points,
+                'trace_digest': experiment.trace_digest,
+                'file': file_name,
+            })
+            job.processed += 1
+            job.save(update_fields=['processed', 'updated_at'])
+
+        manifest = {
+            'job_id': job.job_id,
+            'research_id': job.research.research_id if job.research else None,
+            'format': job.file_format,
+            'created_at': timezone.now().isoformat(),
+            'experiments': entries,
+            'missing': [i for i in job.experiment_ids if i not in found],
+        }
+        archive.writestr('manifest.json', json.dumps(manifest, indent=4))
+
+    os.replace(partial, path)
+    job.file_path = path
+    job.status = 'completed'
+    job.save(update_fields=['file_path', 'status', 'updated_at'])
@@ -0,0 +1,2 @@
+
+# Required file to make this a proper Python package
@@ -0,0 +1,31 @@
+from django.core.management.base import BaseCommand
+from apps.experiments.models import Experiment
+from apps.experiments.traces import build_pyramid
+
+
+class Command(BaseCommand):
+    help = 'Build the reduced pyramid levels for experiment traces in the trace store'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--force', action='store_true',
+            help='Rebuild levels that already exist')
+
+    def handle(self, *args, **options):
+        digests = Experiment.objects.filter(
+            trace_digest__isnull=False).values_list('trace_digest', flat=True).distinct()
+        total = digests.count()
+        self.stdout.write(f'Building pyramids for {total} traces...')
+
+        built = failed = 0
+        for digest in digests.iterator():
+            try:
+                build_pyramid(digest, force=options['force'])
+                built += 1
+            except (ValueError, OSError) as e:
+                failed += 1
+                self.stdout.write(self.style.ERROR(
+                    f'Could not build pyramid for {digest}: {str(e)}'))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Built pyramids for {built} traces ({failed} failed)'))
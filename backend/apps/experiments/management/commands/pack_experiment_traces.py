@@ -0,0 +1,32 @@
+from django.core.management.base import BaseCommand
+from apps.experiments.models import Experiment
+from apps.experiments.traces import trace_from_records
+
+
+class Command(BaseCommand):
+    help = 'Move JSON data_points of existing experiments into the columnar trace store'
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size', type=int, default=100,
+            help='Number of experiments fetched from the database at a time')
+
+    def handle(self, *args, **options):
+        pending = Experiment.objects.with_payload().filter(
+            trace_digest__isnull=True, data_points__isnull=False)
+        total = pending.count()
+        self.stdout.write(f'Packing traces for {total} experiments...')
+
+        packed = failed = 0
+        for experiment in pending.iterator(chunk_size=options['batch_size']):
+            try:
+                experiment.set_trace(trace_from_records(experiment.data_points))
+                experiment.save(update_fields=Experiment.TRACE_FIELDS)
+                packed += 1
+            except (ValueError, TypeError, AttributeError, OSError) as e:
+                failed += 1
+                self.stdout.write(self.style.ERROR(
+                    f'Could not pack {experiment.experiment_id}: {str(e)}'))
+
+        self.stdout.write(self.style.SUCCESS(
+            f'Packed {packed} experiments ({failed} failed)'))
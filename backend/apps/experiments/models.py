@@ -1,6 +1,13 @@
+from django.core.files.base import ContentFile
 from django.db import models
 
+from apps.common.managers import MetadataManager
 from apps.common.models import CreatedAtModel, TimeStampedModel
+from apps.data.blobs import blob_storage
+from apps.data.deltas import apply_trace_delta, encode_trace_delta, is_snapshot
+
+from .analysis import ANALYSIS_VERSION, METRIC_FIELDS, analyze_trace
+from .traces import Trace, build_pyramid, read_trace, trace_from_records, write_trace
 
 
 class Instrument(models.Model):
@@ -26,6 +33,10 @@ class VoltammetryTechnique(models.Model):
 
 class Experiment(TimeStampedModel):
     """Model for storing voltammetry experimental data"""
+    # Fields written by set_trace()
+    TRACE_FIELDS = ('data_points', 'trace_digest', 'num_points', 'trace_delta',
+                    'delta_base', 'analysis_version') + METRIC_FIELDS
+    PAYLOAD_FIELDS = ('data_points',)
 
     experiment_id = models.CharField(max_length=50, unique=True, db_index=True)
     title = models.CharField(max_length=200)
@@ -63,15 +74,28 @@ class Experiment(TimeStampedModel):
     temperature = models.FloatField(
         blank=True, null=True, help_text="Temperature in °C")
 
-    # Raw data fields are stored as JSON in data_points
-    # This will contain arrays of potential, current, and time values
-    data_points = models.JSONField()
+    # Raw data is kept as columnar arrays in the trace store (see traces.py).
+    # data_points only holds legacy JSON rows that have not been packed yet;
+    # anything assigned to it is moved to the trace store on save.
+    data_points = models.JSONField(blank=True, null=True)
+    trace_digest = models.CharField(
+        max_length=64, blank=True, null=True, db_index=True,
+        help_text="SHA-256 key of the trace in the trace store")
+    num_points = models.PositiveIntegerField(default=0)
+    # Older versions keep only a delta against the next newer version
+    # instead of a full trace (see apps.data.deltas)
+    trace_delta = models.FileField(storage=blob_storage, blank=True, null=True)
+    delta_base = models.ForeignKey(
+        'self', null=True, blank=True, on_delete=models.SET_NULL, related_name='delta_versions')
 
-    # Fields for calculated metrics
+    # Fields for calculated metrics, filled by analysis.analyze_trace()
     peak_anodic_current = models.FloatField(blank=True, null=True)
     peak_cathodic_current = models.FloatField(blank=True, null=True)
     peak_anodic_potential = models.FloatField(blank=True, null=True)
     peak_cathodic_potential = models.FloatField(blank=True, null=True)
+    analysis_version = models.PositiveSmallIntegerField(
+        default=0, db_index=True,
+        help_text="Version of the analysis that computed the metrics (0: never analyzed)")
 
     # Version control field
     version = models.IntegerField(default=1)
@@ -83,6 +107,8 @@ class Experiment(TimeStampedModel):
     research = models.ForeignKey(
         'research.Research', null=True, blank=True, on_delete=models.SET_NULL, related_name='experiments')
 
+    objects = MetadataManager()
+
     def __str__(self):
         return f"{self.title} ({self.experiment_id}) v{self.version}"
 
@@ -90,6 +116,67 @@ class Experiment(TimeStampedModel):
         verbose_name = "Voltammetry Dataset"
         verbose_name_plural = "Voltammetry Datasets"
 
+    def save(self, *args, **kwargs):
+        # A deferred data_points was not changed; do not load it to find out
+        if 'data_points' not in self.get_deferred_fields() and self.data_points:
+            self.set_trace(trace_from_records(self.data_points))
+            update_fields = kwargs.get('update_fields')
+            if update_fields is not None:
+                kwargs['update_fields'] = set(update_fields) | set(self.TRACE_FIELDS)
+        super().save(*args, **kwargs)
+
+    def get_trace(self, mmap=False):
+        """
+        Return the potential/current/time arrays of this experiment.
+        Falls back to parsing data_points for rows that are not packed yet.
+        """
+        if self.trace_digest:
+            return read_trace(self.trace_digest, mmap=mmap)
+        if self.delta_base_id:
+            with self.trace_delta.open('rb') as delta:
+                return apply_trace_delta(self.delta_base.get_trace(), delta.read())
+        if self.data_points:
+            return trace_from_records(self.data_points)
+        return Trace.empty()
+
+    @property
+    def trace(self):
+        """Lazily loaded Trace, cached on the instance until the data changes"""
+        if not self.trace_digest:
+            return self.get_trace()
+        cached = self.__dict__.get('_trace_cache')
+        if cached is None or cached[0] != self.trace_digest:
+            cached = (self.trace_digest, self.get_trace())
+            self.__dict__['_trace_cache'] = cached
+        return cached[1]
+
+    def set_trace(self, trace):
+        """
+        Write a Trace (and its reduced pyramid levels) to the trace store,
+        point this experiment at it and recompute the peak metrics
+        """
+        self.trace_digest = write_trace(trace)
+        build_pyramid(self.trace_digest, trace)
+        self.num_points = len(trace)
+        self.data_points = None
+        self.trace_delta = None
+        self.delta_base = None
+        self.__dict__['_trace_cache'] = (self.trace_digest, trace)
+        self.analyze(trace)
+
+    def analyze(self, trace=None, **options):
+        """
+        Compute the peak metrics from the trace and set them on this
+        experiment (without saving). ``options`` are passed to analyze_trace.
+        """
+        if trace is None:
+            trace = self.get_trace(mmap=True)
+        metrics = analyze_trace(trace, self.experiment_type, **options)
+        for field, value in metrics.items():
+            setattr(self, field, value)
+        self.analysis_version = ANALYSIS_VERSION
+        return metrics
+
     def create_new_version(self, new_data=None):
         """
         Create a new version of this experiment
@@ -102,21 +189,51 @@ class Experiment(TimeStampedModel):
             self.save()
 
         # Create new version
-        new_version = Experiment.objects.get(pk=self.pk)
+        new_version = Experiment.objects.with_payload().get(pk=self.pk)
         new_version.pk = None
         new_version.version = self.version + 1
         new_version.is_latest_version = True
         new_version.parent_experiment = self
+        if new_version.delta_base_id:
+            # Versions made from a delta-encoded one start out in full
+            new_version.set_trace(self.get_trace())
 
         # Update with new data if provided
         if new_data:
             for key, value in new_data.items():
                 if hasattr(new_version, key):
                     setattr(new_version, key, value)
+            # New data points are analyzed on save; otherwise refresh the
+            # metrics in case the fields they depend on changed
+            if not new_version.data_points and new_version.trace_digest:
+                new_version.analyze()
 
         new_version.save()
+        self.store_trace_as_delta(new_version)
         return new_version
 
+    def store_trace_as_delta(self, base):
+        """
+        Keep only a delta of this version's trace against ``base``, a newer
+        version, and release the full trace. Snapshots are kept in full.
+        """
+        if (is_snapshot(self.version) or not self.trace_digest or
+                self.trace_digest == base.trace_digest):
+            return
+        delta = encode_trace_delta(base.get_trace(), self.get_trace())
+        self.trace_delta.save(f'{self.experiment_id}.delta', ContentFile(delta), save=False)
+        self.delta_base = base
+        self.trace_digest = None
+        self.__dict__.pop('_trace_cache', None)
+        self.save(update_fields=['trace_delta', 'delta_base', 'trace_digest'])
+
+    def materialize(self):
+        """Store the trace in full again, e.g. before its delta base is deleted"""
+        if not self.delta_base_id:
+            return
+        self.set_trace(self.get_trace())
+        self.save(update_fields=self.TRACE_FIELDS)
+
 
 class ExperimentFile(CreatedAtModel):
     experiment = models.ForeignKey(
@@ -143,3 +260,47 @@ class ExperimentFile(CreatedAtModel):
     class Meta:
         verbose_name = "Experiment File"
         verbose_name_plural = "Experiment Files"
+
+
+class ExportJob(TimeStampedModel):
+    """Background job that bundles several experiments into one ZIP archive"""
+    STATUS_CHOICES = (
+        ('pending', 'Pending'),
+        ('running', 'Running'),
+        ('completed', 'Completed'),
+        ('failed', 'Failed'),
+    )
+    FORMAT_CHOICES = (
+        ('csv', 'CSV'),
+        ('json', 'JSON'),
+    )
+
+    job_id = models.CharField(max_length=50, unique=True)
+    created_by = models.ForeignKey(
+        'auth.User', on_delete=models.CASCADE, related_name='export_jobs')
+    research = models.ForeignKey(
+        'research.Research', null=True, blank=True, on_delete=models.SET_NULL, related_name='export_jobs')
+    experiment_ids = models.JSONField(default=list)
+    file_format = models.CharField(
+        max_length=10, choices=FORMAT_CHOICES, default='csv')
+    status = models.CharField(
+        max_length=20, choices=STATUS_CHOICES, default='pending')
+    total = models.PositiveIntegerField(default=0)
+    processed = models.PositiveIntegerField(default=0)
+    file_path = models.CharField(max_length=500, blank=True, null=True)
+    error = models.TextField(blank=True, null=True)
+
+    def __str__(self):
+        return f"Export {self.job_id} ({self.get_status_display()})"
+
+    @property
+    def progress(self):
+        """Fraction of experiments written so far, between 0 and 1"""
+        if not self.total:
+            return 1.0 if self.status == 'completed' else 0.0
+        return self.processed / self.total
+
+    class Meta:
+        verbose_name = "Export Job"
+        verbose_name_plural = "Export Jobs"
+        ordering = ['-created_at']
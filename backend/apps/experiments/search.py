@@ -0,0 +1,19 @@
+"""
+Full-text search over experiment metadata (see apps.common.fulltext).
+The index is created after ``migrate`` and kept current by signals.py.
+"""
+from apps.common.fulltext import FullTextIndex
+
+# Searchable fields with their weight class (A ranks highest)
+experiment_index = FullTextIndex('experiments.Experiment', {
+    'title': 'A',
+    'description': 'C',
+    'experiment_id': 'A',
+    'electrode_material': 'B',
+    'electrolyte': 'B',
+}, name='experiments_experiment')
+
+
+def search_experiments(queryset, query):
+    """Filter an Experiment queryset by ``query``, annotated with ``search_rank``"""
+    return experiment_index.search(queryset, query)
@@ -0,0 +1,38 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from .models import Experiment
+from .search import experiment_index
+from .suggestions import suggestion_index
+
+
+def _suggested_values(instance):
+    return {field: getattr(instance, field) for field in suggestion_index.fields}
+
+
+@receiver(pre_save, sender=Experiment)
+def remember_suggested_values(sender, instance, using, **kwargs):
+    """Keep the values being replaced, so the suggestion index can drop them"""
+    instance._suggested_before = None
+    if instance.pk and suggestion_index.is_built():
+        instance._suggested_before = Experiment.objects.using(using).filter(
+            pk=instance.pk).values(*suggestion_index.fields).first()
+
+
+@receiver(post_save, sender=Experiment)
+def index_experiment(sender, instance, using, **kwargs):
+    """Keep the full-text and suggestion indexes in step with saved experiments"""
+    experiment_index.index(instance, using=using)
+    suggestion_index.update(
+        getattr(instance, '_suggested_before', None), _suggested_values(instance))
+
+
+@receiver(post_delete, sender=Experiment)
+def unindex_experiment(sender, instance, using, **kwargs):
+    experiment_index.unindex(instance.pk, using=using)
+    suggestion_index.update(_suggested_values(instance), None)
+
+
+def create_search_index(sender, using, **kwargs):
+    """Create the experiment search index after migrate"""
+    experiment_index.ensure(using=using)
@@ -0,0 +1,188 @@
+"""
+In-process autocomplete index of experiment values, ranked by the number of
+experiments that carry them. Kept current by the Experiment signals and
+rebuilt in the background every ``settings.SUGGESTION_INDEX_TTL`` seconds.
+"""
+import bisect
+import threading
+import time
+from collections import Counter, OrderedDict
+
+from django.conf import settings
+
+from apps.common import tasks
+
+# Suggested columns with the number of suggestions each may contribute
+SUGGESTION_FIELDS = {
+    'title': 5,
+    'electrode_material': 3,
+    'electrolyte': 3,
+}
+MAX_SUGGESTIONS = 10
+# Matches examined per lookup, which bounds the cost of one-letter prefixes
+MAX_SCAN = 2000
+# Recent lookups remembered until a matching value changes
+RESULT_CACHE_SIZE = 1024
+
+
+def _normalize(value):
+    return ' '.join(value.lower().split())
+
+
+class SuggestionIndex:
+    """Sorted array of ``(key, field, value)`` with per-value popularity"""
+
+    def __init__(self, fields=SUGGESTION_FIELDS):
+        self.fields = dict(fields)
+        self._lock = threading.RLock()
+        # Held while a build scans the table, so only one runs at a time
+        self._build_lock = threading.Lock()
+        self._refreshing = False
+        self._counts = Counter()
+        self._keys = []
+        self._results = OrderedDict()
+        self._built_at = None
+
+    @staticmethod
+    def _word_keys(value):
+        """One key per word start, so 'Ferrocene in MeCN' is found by 'mecn'"""
+        normalized = _normalize(value)
+        keys = [normalized]
+        for index, char in enumerate(normalized):
+            if char == ' ':
+                keys.append(normalized[index + 1:])
+        return keys
+
+    def _is_stale(self):
+        return (self._built_at is None or
+                time.monotonic() - self._built_at > settings.SUGGESTION_INDEX_TTL)
+
+    def is_built(self):
+        return self._built_at is not None
+
+    def build(self):
+        """(Re)load every value from the database"""
+        with self._build_lock:
+            self._build()
+
+    def _build(self):
+        from .models import Experiment
+
+        counts = Counter()
+        rows = Experiment.objects.values_list(*self.fields)
+        for row in rows.iterator(chunk_size=5000):
+            for field, value in zip(self.fields, row):
+                if value:
+                    counts[field, value] += 1
+
+        keys = sorted(
+            (key, field, value)
+            for field, value in counts
+            for key in self._word_keys(value))
+        with self._lock:
+            self._counts = counts
+            self._keys = keys
+            self._results = OrderedDict()
+            self._built_at = time.monotonic()
+
+    def _ensure_fresh(self):
+        """
+        Build the index on first use; once built, a stale index is rebuilt in
+        the background and keeps serving until the new one is swapped in
+        """
+        if not self.is_built():
+            with self._build_lock:
+                # Another request may have built it while this one waited
+                if not self.is_built():
+                    self._build()
+            return
+        with self._lock:
+            if self._refreshing:
+                return
+            self._refreshing = True
+        tasks.submit(self._refresh)
+
+    def _refresh(self):
+        try:
+            self.build()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def _add(self, field, value, delta):
+        if not value:
+            return
+        count = self._counts[field, value] + delta
+        if count > 0:
+            if self._counts[field, value] <= 0:
+                for key in self._word_keys(value):
+                    bisect.insort(self._keys, (key, field, value))
+            self._counts[field, value] = count
+            return
+        del self._counts[field, value]
+        for key in self._word_keys(value):
+            position = bisect.bisect_left(self._keys, (key, field, value))
+            if position < len(self._keys) and self._keys[position] == (key, field, value):
+                del self._keys[position]
+
+    def update(self, old=None, new=None):
+        """
+        Apply a change of one experiment, given its ``{field: value}`` before
+        (None when created) and after (None when deleted)
+        """
+        if not self.is_built():
+            return
+        with self._lock:
+            changed = []
+            for field in self.fields:
+                before = old.get(field) if old else None
+                after = new.get(field) if new else None
+                if before != after:
+                    self._add(field, before, -1)
+                    self._add(field, after, 1)
+                    changed.extend(self._word_keys(before) if before else ())
+                    changed.extend(self._word_keys(after) if after else ())
+            # Forget only the lookups whose results may have changed
+            for prefix, limit in list(self._results):
+                if any(key.startswith(prefix) for key in changed):
+                    del self._results[prefix, limit]
+
+    def suggest(self, query, limit=MAX_SUGGESTIONS):
+        """Most popular values with a word starting with ``query``"""
+        prefix = _normalize(query)
+        if not prefix:
+            return []
+        if self._is_stale():
+            self._ensure_fresh()
+
+        cached = self._results.get((prefix, limit))
+        if cached is not None:
+            return cached
+
+        keys = self._keys
+        matches = {}
+        start = bisect.bisect_left(keys, (prefix,))
+        for key, field, value in keys[start:start + MAX_SCAN]:
+            if not key.startswith(prefix):
+                break
+            matches[field, value] = self._counts.get((field, value), 0)
+
+        # Most popular first, then shortest (closest to the typed prefix)
+        ranked = sorted(matches.items(), key=lambda item: (-item[1], len(item[0][1]), item[0][1]))
+        quota = dict(self.fields)
+        suggestions = []
+        for (field, value), _ in ranked:
+            if quota[field] and value not in suggestions:
+                quota[field] -= 1
+                suggestions.append(value)
+                if len(suggestions) == limit:
+                    break
+
+        with self._lock:
+            self._results[prefix, limit] = suggestions
+            if len(self._results) > RESULT_CACHE_SIZE:
+                self._results.popitem(last=False)
+        return suggestions
+
+
+suggestion_index = SuggestionIndex()
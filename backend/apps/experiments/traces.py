@@ -0,0 +1,223 @@
+"""
+Columnar storage for voltammetry traces.
+
+Each trace is stored as one ``.npy`` file per channel (potential, current,
+time) in a content-addressed directory under ``settings.TRACE_STORE_ROOT``.
+Identical traces share a directory, and readers can load or memory-map the
+float arrays directly instead of parsing a JSON list of per-point dicts.
+
+Next to the full-resolution channels, a pyramid of min/max-reduced levels
+(1/4, 1/16, 1/64 of the points) is kept under ``levels/<factor>/`` so that
+zoomed-out plots can read a small level instead of scanning the whole trace.
+"""
+import hashlib
+import os
+import shutil
+import tempfile
+
+import numpy as np
+from django.conf import settings
+
+from .downsampling import minmax_indices
+
+CHANNELS = ('potential', 'current', 'time')
+TRACE_DTYPE = np.float64
+
+PYRAMID_FACTORS = (4, 16, 64)
+# Levels smaller than this are not worth storing; plotting reduces them anyway
+PYRAMID_MIN_POINTS = 1000
+
+
+class Trace:
+    """Potential, current and time arrays of equal length"""
+
+    def __init__(self, potential, current, time):
+        self.potential = np.asarray(potential, dtype=TRACE_DTYPE)
+        self.current = np.asarray(current, dtype=TRACE_DTYPE)
+        self.time = np.asarray(time, dtype=TRACE_DTYPE)
+        if not (len(self.potential) == len(self.current) == len(self.time)):
+            raise ValueError('Trace channels must have the same length')
+
+    def __len__(self):
+        return len(self.potential)
+
+    def __getitem__(self, key):
+        """Slice all channels at once, e.g. ``trace[1000:2000]``"""
+        return Trace(self.potential[key], self.current[key], self.time[key])
+
+    def time_window(self, t_from=None, t_to=None):
+        """
+        Return the ``(start, stop)`` index range covering ``t_from <= time <= t_to``.
+        Uses a binary search on the (monotonic) time channel, so a memory-mapped
+        trace only pages in a handful of blocks to locate the window.
+        """
+        start = 0 if t_from is None else int(
+            np.searchsorted(self.time, t_from, side='left'))
+        stop = len(self) if t_to is None else int(
+            np.searchsorted(self.time, t_to, side='right'))
+        return start, max(start, stop)
+
+    def channels(self):
+        return {name: getattr(self, name) for name in CHANNELS}
+
+    def to_columns(self):
+        """Return ``{channel: [values]}`` with NaN mapped to None for JSON"""
+        return {name: _to_list(values) for name, values in self.channels().items()}
+
+    def to_records(self):
+        """Return the legacy ``[{potential, current, time}, ...]`` layout"""
+        columns = self.to_columns()
+        return [
+            {'potential': p, 'current': c, 'time': t}
+            for p, c, t in zip(columns['potential'], columns['current'], columns['time'])
+        ]
+
+    @classmethod
+    def empty(cls):
+        return cls([], [], [])
+
+
+def _to_list(values):
+    values = np.asarray(values)
+    if values.size and np.isnan(values).any():
+        return np.where(np.isnan(values), None, values).tolist()
+    return values.tolist()
+
+
+def _as_float(value):
+    if value is None or value == '':
+        return np.nan
+    return float(value)
+
+
+def trace_from_records(data_points):
+    """
+    Build a Trace from the JSON stored in ``Experiment.data_points``.
+    Accepts both a list of ``{potential, current, time}`` dicts and a dict of
+    per-channel lists. Missing values become NaN.
+    """
+    if not data_points:
+        return Trace.empty()
+
+    if isinstance(data_points, dict):
+        length = max(len(data_points.get(name) or []) for name in CHANNELS)
+        arrays = []
+        for name in CHANNELS:
+            values = data_points.get(name) or []
+            column = np.full(length, np.nan, dtype=TRACE_DTYPE)
+            column[:len(values)] = [_as_float(v) for v in values]
+            arrays.append(column)
+        return Trace(*arrays)
+
+    return Trace(*(
+        np.fromiter((_as_float(point.get(name)) for point in data_points),
+                    dtype=TRACE_DTYPE, count=len(data_points))
+        for name in CHANNELS
+    ))
+
+
+def trace_digest(trace):
+    """SHA-256 over the channel bytes; used as the storage key"""
+    sha = hashlib.sha256()
+    for name, values in trace.channels().items():
+        values = np.ascontiguousarray(values, dtype=TRACE_DTYPE)
+        sha.update(name.encode())
+        sha.update(len(values).to_bytes(8, 'little'))
+        sha.update(values.tobytes())
+    return sha.hexdigest()
+
+
+def trace_path(digest):
+    return os.path.join(settings.TRACE_STORE_ROOT, digest[:2], digest)
+
+
+def level_path(digest, factor):
+    return os.path.join(trace_path(digest), 'levels', str(factor))
+
+
+def _write_arrays(path, arrays):
+    """Write ``{name: array}`` as .npy files into ``path`` in one atomic rename"""
+    parent = os.path.dirname(path)
+    os.makedirs(parent, exist_ok=True)
+    staging = tempfile.mkdtemp(prefix='.tmp-', dir=parent)
+    try:
+        for name, values in arrays.items():
+            np.save(os.path.join(staging, f'{name}.npy'), values)
+        os.rename(staging, path)
+    except OSError:
+        shutil.rmtree(staging, ignore_errors=True)
+        # A concurrent writer may have stored the same data first
+        if not os.path.isdir(path):
+            raise
+
+
+def _read_arrays(path, names, mmap=False):
+    mode = 'r' if mmap else None
+    return [np.load(os.path.join(path, f'{name}.npy'), mmap_mode=mode) for name in names]
+
+
+def write_trace(trace):
+    """Store a trace and return its digest. Existing traces are not rewritten."""
+    digest = trace_digest(trace)
+    path = trace_path(digest)
+    if not os.path.isdir(path):
+        _write_arrays(path, trace.channels())
+    return digest
+
+
+def read_trace(digest, mmap=False):
+    """
+    Load a stored trace. With ``mmap=True`` the channels are memory-mapped
+    read-only, so only the pages that are actually touched are read.
+    """
+    return Trace(*_read_arrays(trace_path(digest), CHANNELS, mmap=mmap))
+
+
+def build_pyramid(digest, trace=None, force=False):
+    """
+    Write the reduced levels of a stored trace and return their factors.
+    Each level keeps the per-bucket minimum and maximum current of the level
+    below it, together with the original index of every kept point. Points
+    with a missing (NaN) current are left out of the levels.
+    """
+    if trace is None:
+        trace = read_trace(digest, mmap=True)
+
+    built = []
+    index = np.arange(len(trace))
+    level = trace
+    for factor in PYRAMID_FACTORS:
+        target = len(trace) // factor
+        if target < PYRAMID_MIN_POINTS:
+            break
+        path = level_path(digest, factor)
+        if os.path.isdir(path) and not force:
+            index, *channels = _read_arrays(path, ('index',) + CHANNELS)
+            level = Trace(*channels)
+        else:
+            # Missing cells are NaN; a bucket of only NaN has no minimum
+            finite = np.flatnonzero(np.isfinite(level.current))
+            keep = finite[minmax_indices(level.current[finite], target)]
+            index, level = index[keep], level[keep]
+            shutil.rmtree(path, ignore_errors=True)
+            _write_arrays(path, {'index': index, **level.channels()})
+        built.append(factor)
+    return built
+
+
+def read_reduced_window(digest, start, stop, min_points):
+    """
+    Return ``(factor, trace)`` for the window ``[start, stop)`` of a stored
+    trace, read from the coarsest pyramid level that still has at least
+    ``min_points`` points in the window. ``factor`` is 1 for the full trace.
+    """
+    for factor in reversed(PYRAMID_FACTORS):
+        if (stop - start) // factor < min_points:
+            continue
+        path = level_path(digest, factor)
+        if not os.path.isdir(path):
+            continue
+        index, *channels = _read_arrays(path, ('index',) + CHANNELS, mmap=True)
+        lo, hi = np.searchsorted(index, [start, stop])
+        return factor, Trace(*channels)[lo:hi]
+    return 1, read_trace(digest, mmap=True)[start:stop]
@@ -1,14 +1,17 @@
-from .views import ExperimentDataView, ExperimentRawDataView, ExperimentPlotView, ExportDataView, Electrodes, Instruments, VoltammetryTechniques
+from .views import ExperimentDataView, ExperimentRawDataView, ExperimentPlotView, ExportDataView, ExportDownloadView, Electrodes, Instruments, VoltammetryTechniques
 from django.urls import path
 
 
 urlpatterns = [
+    # Bulk export routes (before the <experiment_id> routes so they are not shadowed)
+    path('export/', ExportDataView.as_view(), name='voltammetry_export'),
+    path('export/<str:job_id>/download/', ExportDownloadView.as_view(), name='voltammetry_export_download'),
+
     # Voltammetry data routes
     path('', ExperimentDataView.as_view(), name='voltammetry_data_list'),
     path('<str:experiment_id>/', ExperimentDataView.as_view(), name='voltammetry_data_detail'),
     path('<str:experiment_id>/raw/', ExperimentRawDataView.as_view(), name='voltammetry_raw_data'),
     path('<str:experiment_id>/plot/', ExperimentPlotView.as_view(), name='voltammetry_plot'),
-    path('export/', ExportDataView.as_view(), name='voltammetry_export'),
 
     # path('methods/', Methods.as_view(), name='methods'),
     path('electrodes/', Electrodes.as_view(), name='electrodes'),
@@ -1,42 +1,83 @@
+import os
+import uuid
+
+from django.db.models import Q
+from django.http import FileResponse
+from django.urls import reverse
 from rest_framework.views import APIView
 from rest_framework.response import Response
 from rest_framework import status
-from rest_framework.permissions import AllowAny
-from .models import Electrode, Instrument, VoltammetryTechnique
+from rest_framework.permissions import AllowAny, IsAuthenticated
+from apps.research.permissions import accessible_research_ids
+from . import downsampling
+from .analysis import METRIC_FIELDS
+from .exports import fail_stale_jobs, submit_export
+from .models import Electrode, Experiment, ExportJob, Instrument, VoltammetryTechnique
+from .traces import read_reduced_window
 
 
 class ExperimentDataView(APIView):
     """
     API view to handle voltammetry data.
+    Pass ``?layout=columns`` to receive data_points as per-channel arrays.
+    The list can be filtered on the peak metrics with ``?<metric>_min=`` and
+    ``?<metric>_max=`` and sorted with ``?ordering=<metric>`` (or ``-<metric>``).
     """
+    ORDERING_FIELDS = ('created_at', 'title') + METRIC_FIELDS
 
     def get(self, request, experiment_id=None):
-        from apps.dashboard.models import VoltammetryData
-
         if experiment_id:
             try:
-                experiment = VoltammetryData.objects.get(
+                experiment = Experiment.objects.get(
                     experiment_id=experiment_id)
-                return Response({
-                    'id': experiment.experiment_id,
-                    'title': experiment.title,
-                    'description': experiment.description,
-                    'experiment_type': experiment.experiment_type,
-                    'scan_rate': experiment.scan_rate,
-                    'electrode_material': experiment.electrode_material,
-                    'electrolyte': experiment.electrolyte,
-                    'temperature': experiment.temperature,
-                    'data_points': experiment.data_points,
-                    'peak_anodic_current': experiment.peak_anodic_current,
-                    'peak_cathodic_current': experiment.peak_cathodic_current,
-                    'peak_anodic_potential': experiment.peak_anodic_potential,
-                    'peak_cathodic_potential': experiment.peak_cathodic_potential,
-                })
-            except VoltammetryData.DoesNotExist:
+            except Experiment.DoesNotExist:
                 return Response({'error': 'Experiment not found'}, status=status.HTTP_404_NOT_FOUND)
+
+            trace = experiment.trace
+            if request.query_params.get('layout') == 'columns':
+                data_points = trace.to_columns()
+            else:
+                data_points = trace.to_records()
+
+            return Response({
+                'id': experiment.experiment_id,
+                'title': experiment.title,
+                'description': experiment.description,
+                'experiment_type': experiment.experiment_type,
+                'scan_rate': experiment.scan_rate,
+                'electrode_material': experiment.electrode_material,
+                'electrolyte': experiment.electrolyte,
+                'temperature': experiment.temperature,
+                'num_points': len(trace),
+                'data_points': data_points,
+                'peak_anodic_current': experiment.peak_anodic_current,
+                'peak_cathodic_current': experiment.peak_cathodic_current,
+                'peak_anodic_potential': experiment.peak_anodic_potential,
+                'peak_cathodic_potential': experiment.peak_cathodic_potential,
+            })
         else:
-            experiments = VoltammetryData.objects.all().values(
-                'experiment_id', 'title', 'experiment_type', 'date_created'
+            experiments = Experiment.objects.all()
+            params = request.query_params
+            try:
+                for field in METRIC_FIELDS:
+                    low = _optional(params, f'{field}_min', float)
+                    high = _optional(params, f'{field}_max', float)
+                    if low is not None:
+                        experiments = experiments.filter(**{f'{field}__gte': low})
+                    if high is not None:
+                        experiments = experiments.filter(**{f'{field}__lte': high})
+            except ValueError as e:
+                return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+
+            ordering = params.get('ordering')
+            if ordering:
+                if ordering.lstrip('-') not in self.ORDERING_FIELDS:
+                    return Response({'error': f"Ordering must be one of: {', '.join(self.ORDERING_FIELDS)}"},
+                                    status=status.HTTP_400_BAD_REQUEST)
+                experiments = experiments.order_by(ordering)
+
+            experiments = experiments.values(
+                'experiment_id', 'title', 'experiment_type', 'created_at', *METRIC_FIELDS
             )
             return Response(list(experiments))
 
@@ -44,39 +85,236 @@ class ExperimentDataView(APIView):
 class ExperimentRawDataView(APIView):
     """
     API view to retrieve raw voltammetry data.
+    A window can be selected by index (``?start=&stop=``) or by time
+    (``?t_from=&t_to=``); only that window is read from the trace store.
+    Without an end the window holds ``DEFAULT_POINTS`` points, and no window
+    holds more than ``MAX_POINTS``; clients page on with ``?start=<stop>``.
     """
+    DEFAULT_POINTS = 10000
+    MAX_POINTS = 100000
 
     def get(self, request, experiment_id):
-        # Implementation to retrieve raw voltammetry data
+        try:
+            experiment = Experiment.objects.get(experiment_id=experiment_id)
+        except Experiment.DoesNotExist:
+            return Response({'error': 'Experiment not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        params = request.query_params
+        trace = experiment.get_trace(mmap=True)
+        try:
+            start, stop = _window_bounds(params, trace)
+            open_ended = (_optional(params, 'stop', int) is None and
+                          _optional(params, 't_to', float) is None)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        stop = min(stop, start + (self.DEFAULT_POINTS if open_ended else self.MAX_POINTS))
+        window = trace[start:stop]
+
+        if params.get('layout') == 'columns':
+            data = window.to_columns()
+        else:
+            data = window.to_records()
+
         return Response({
-            'data': []
+            'experiment_id': experiment.experiment_id,
+            'total_points': len(trace),
+            'start': start,
+            'stop': stop,
+            'data': data
         })
 
 
 class ExperimentPlotView(APIView):
     """
     API view to generate voltammetry plots.
+    The series is reduced to about ``?width=`` points (one per pixel) with
+    ``?mode=lttb`` (default) or ``?mode=minmax``, so the payload stays small
+    however long the run is. Accepts the same window parameters as the raw view;
+    wide windows are served from the trace's precomputed pyramid levels.
     """
+    DEFAULT_WIDTH = 1000
+    MAX_WIDTH = 10000
+    AXES = {
+        'potential': 'Potential (V)',
+        'current': 'Current (μA)',
+        'time': 'Time (s)',
+    }
 
     def get(self, request, experiment_id):
-        # Implementation to generate voltammetry plots
+        try:
+            experiment = Experiment.objects.get(experiment_id=experiment_id)
+        except Experiment.DoesNotExist:
+            return Response({'error': 'Experiment not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        params = request.query_params
+        x_axis = params.get('x', 'potential')
+        y_axis = params.get('y', 'current')
+        mode = params.get('mode', 'lttb')
+        if x_axis not in self.AXES or y_axis not in self.AXES:
+            return Response({'error': f"Axes must be one of: {', '.join(self.AXES)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+        if mode not in downsampling.MODES:
+            return Response({'error': f"Mode must be one of: {', '.join(downsampling.MODES)}"},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        trace = experiment.get_trace(mmap=True)
+        try:
+            width = _optional(params, 'width', int) or self.DEFAULT_WIDTH
+            start, stop = _window_bounds(params, trace)
+        except ValueError as e:
+            return Response({'error': str(e)}, status=status.HTTP_400_BAD_REQUEST)
+        width = max(4, min(width, self.MAX_WIDTH))
+
+        # Zoomed-out views read a small pre-reduced level instead of the full trace
+        if experiment.trace_digest:
+            level, window = read_reduced_window(
+                experiment.trace_digest, start, stop, width)
+        else:
+            level, window = 1, trace[start:stop]
+        x = getattr(window, x_axis)
+        y = getattr(window, y_axis)
+        keep = downsampling.downsample_indices(x, y, width, mode)
+
         return Response({
-            'plot_data': {}
+            'plot_data': {
+                'x': x[keep].tolist(),
+                'y': y[keep].tolist(),
+                'x_title': self.AXES[x_axis],
+                'y_title': self.AXES[y_axis],
+                'mode': mode,
+                'level': level,
+                'start': start,
+                'stop': stop,
+                'total_points': len(trace),
+                'num_points': len(keep),
+            }
         })
 
 
 class ExportDataView(APIView):
     """
-    API view to export data in various formats.
+    API view to export several experiments as one ZIP archive.
+    POST starts a background job for a list of ``experiment_ids`` or a
+    ``research_id``; GET with ``?job_id=`` reports its progress and, once
+    completed, the URL the archive can be downloaded from.
     """
+    permission_classes = [IsAuthenticated]
+
+    def post(self, request):
+        experiment_ids = request.data.get('experiment_ids') or []
+        research_id = request.data.get('research_id')
+        file_format = request.data.get('format', 'csv')
+
+        if file_format not in dict(ExportJob.FORMAT_CHOICES):
+            return Response({'error': f'Invalid format: {file_format}'}, status=status.HTTP_400_BAD_REQUEST)
+        if not experiment_ids and not research_id:
+            return Response({'error': 'experiment_ids or research_id is required'},
+                            status=status.HTTP_400_BAD_REQUEST)
+
+        experiments = Experiment.objects.filter(
+            Q(researcher=request.user) |
+            Q(research__in=accessible_research_ids(request.user))
+        )
+        research = None
+        if research_id:
+            from apps.research.models import Research
+            try:
+                research = Research.objects.get(research_id=research_id)
+            except Research.DoesNotExist:
+                return Response({'error': 'Research project not found'}, status=status.HTTP_404_NOT_FOUND)
+            experiments = experiments.filter(research=research)
+        if experiment_ids:
+            experiments = experiments.filter(experiment_id__in=experiment_ids)
+
+        accessible = sorted(set(experiments.values_list('experiment_id', flat=True)))
+        if not accessible:
+            return Response({'error': 'No accessible experiments to export'}, status=status.HTTP_404_NOT_FOUND)
+
+        fail_stale_jobs()
+        job = ExportJob.objects.create(
+            job_id=f"EXP-{uuid.uuid4().hex[:8].upper()}",
+            created_by=request.user,
+            research=research,
+            experiment_ids=accessible,
+            file_format=file_format,
+            total=len(accessible),
+        )
+        submit_export(job)
+
+        return Response({
+            'job_id': job.job_id,
+            'status': job.status,
+            'total': job.total,
+            'skipped': [i for i in experiment_ids if i not in accessible],
+        }, status=status.HTTP_202_ACCEPTED)
 
     def get(self, request):
-        # Implementation to export data
+        job_id = request.query_params.get('job_id')
+        if not job_id:
+            return Response({'error': 'job_id is required'}, status=status.HTTP_400_BAD_REQUEST)
+        jobs = ExportJob.objects.filter(job_id=job_id, created_by=request.user)
+        fail_stale_jobs(jobs)
+        try:
+            job = jobs.get()
+        except ExportJob.DoesNotExist:
+            return Response({'error': 'Export job not found'}, status=status.HTTP_404_NOT_FOUND)
+
+        export_url = ''
+        if job.status == 'completed':
+            export_url = request.build_absolute_uri(
+                reverse('v0:voltammetry_export_download', args=[job.job_id]))
+
         return Response({
-            'export_url': ''
+            'job_id': job.job_id,
+            'status': job.status,
+            'processed': job.processed,
+            'total': job.total,
+            'progress': job.progress,
+            'error': job.error,
+            'export_url': export_url
         })
 
 
+class ExportDownloadView(APIView):
+    """
+    API view to download the archive of a completed export job.
+    """
+    permission_classes = [IsAuthenticated]
+
+    def get(self, request, job_id):
+        try:
+            job = ExportJob.objects.get(job_id=job_id, created_by=request.user)
+        except ExportJob.DoesNotExist:
+            return Response({'error': 'Export job not found'}, status=status.HTTP_404_NOT_FOUND)
+        if job.status != 'completed' or not job.file_path or not os.path.exists(job.file_path):
+            return Response({'error': 'Export is not ready'}, status=status.HTTP_409_CONFLICT)
+
+        return FileResponse(open(job.file_path, 'rb'), as_attachment=True,
+                            filename=f'{job.job_id}.zip', content_type='application/zip')
+
+
+def _optional(params, name, cast):
+    value = params.get(name)
+    if value in (None, ''):
+        return None
+    try:
+        return cast(value)
+    except ValueError:
+        raise ValueError(f'Invalid value for {name}: {value}')
+
+
+def _window_bounds(params, trace):
+    """Resolve ?start=&stop= or ?t_from=&t_to= into an index range of the trace"""
+    start = _optional(params, 'start', int)
+    stop = _optional(params, 'stop', int)
+    t_from = _optional(params, 't_from', float)
+    t_to = _optional(params, 't_to', float)
+    if t_from is not None or t_to is not None:
+        start, stop = trace.time_window(t_from, t_to)
+    start, stop, _ = slice(start, stop).indices(len(trace))
+    return start, max(start, stop)
+
+
 # class Methods(APIView):
 #     """
 #     API view to get the list of methods
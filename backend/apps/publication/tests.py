@@ -1,3 +1,37 @@
-from django.test import TestCase
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.test import RequestFactory, TestCase
+from django.urls import reverse
 
-# Create your tests here.
+from apps.common.testing import TemporaryMediaMixin
+from apps.data.models import Dataset
+from .models import Publication
+from .views import DatasetDownloadView
+
+
+class DatasetDownloadTests(TemporaryMediaMixin, TestCase):
+    """Datasets stored as content-addressed blobs download under their uploaded name"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='author', password='secret')
+        Publication.objects.create(title='Ferrocene', author='A. Author', year='2023', doi='10.1/a')
+
+    def test_download_keeps_the_uploaded_name_and_type(self):
+        self.client.force_login(self.user)
+        response = self.client.post(reverse('v0:upload_dataset', args=['10.1_a']), {
+            'file': SimpleUploadedFile('results.csv', b'E,I\n0.1,2.0\n', content_type='text/csv'),
+            'is_public': 'true',
+        })
+        self.assertEqual(response.status_code, 200)
+        dataset = Dataset.objects.get(id=response.json()['dataset_id'])
+        self.assertEqual(dataset.file_name, 'results.csv')
+        self.assertNotIn('results', dataset.file_path)
+
+        request = RequestFactory().get('/')
+        request.user = self.user
+        response = DatasetDownloadView.as_view()(request, dataset_id=dataset.id)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response['Content-Type'], 'text/csv')
+        self.assertEqual(response['Content-Disposition'], 'attachment; filename="results.csv"')
+        self.assertEqual(b''.join(response.streaming_content), b'E,I\n0.1,2.0\n')
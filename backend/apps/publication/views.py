@@ -16,6 +16,7 @@ import os
 import traceback
 import uuid
 
+from apps.data.blobs import blob_storage
 from apps.data.models import Dataset
 from apps.research.models import Researcher
 from .models import Publication, PublicationResearcher
@@ -129,6 +130,7 @@ class PublicationDetailView(APIView):
                     "title": dataset.title,
                     "description": dataset.description,
                     "file_path": dataset.file_path,
+                    "file_name": dataset.file_name,
                     "file_size": dataset.file_size,
                     "file_type": dataset.file_type,
                     "created_at": dataset.created_at.isoformat(),
@@ -269,15 +271,14 @@ class PublicationFileUploadView(APIView):
             if 'file' not in request.FILES:
                 return JsonResponse({"error": "No file was uploaded"}, status=400)
             file = request.FILES['file']
-            content = "".join([str(x) for x in file.readlines()])
-            # Generate a unique file name to prevent overwriting
+            path = blob_storage.save(file.name, file)
 
             # Create dataset record
-            print(content)
             dataset = Dataset.objects.create(
                 title=request.POST.get('title', file.name),
-                content=content,
                 description=request.POST.get('description', ''),
+                file_path=path,
+                file_name=file.name,
                 file_size=file.size,
                 file_type=file.content_type,
                 is_public=request.POST.get(
@@ -322,20 +323,15 @@ class DatasetDownloadView(APIView):
             if not os.path.exists(file_path):
                 return JsonResponse({"error": "File not found on server"}, status=404)
 
-            # Determine the file's content type
-            content_type, encoding = mimetypes.guess_type(file_path)
-            if not content_type:
-                content_type = 'application/octet-stream'
+            # Blobs are named by their content hash, so the name and content
+            # type come from the upload (older datasets kept the name in the path)
+            file_name = dataset.file_name or os.path.basename(dataset.file_path)
+            content_type = dataset.file_type or mimetypes.guess_type(file_name)[0]
 
-            # Open the file
-            file = open(file_path, 'rb')
-            response = FileResponse(file, content_type=content_type)
-
-            # Set the Content-Disposition header to force a file download
-            file_name = os.path.basename(dataset.file_path)
-            response['Content-Disposition'] = f'attachment; filename="{file_name}"'
-
-            return response
+            # Force a file download under the uploaded name
+            return FileResponse(
+                open(file_path, 'rb'), as_attachment=True, filename=file_name,
+                content_type=content_type or 'application/octet-stream')
 
         except Exception as e:
             return JsonResponse({"error": str(e)}, status=500)
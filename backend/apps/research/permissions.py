@@ -0,0 +1,95 @@
+"""
+Research project permissions.
+
+A user's role in every project they belong to is loaded with one query
+(headed projects and collaborations, combined with UNION) into a role map
+``{research pk: role}``. The map is kept on the user object, so all checks
+made while serving one request share it, and, when
+``settings.RESEARCH_ROLE_CACHE_TIMEOUT`` is set, in the shared cache for
+that many seconds. Collaborator and head researcher changes drop the shared
+entry (signals.py).
+"""
+from django.conf import settings
+from django.core.cache import cache
+from django.db.models import CharField, Value
+
+from apps.collaboration.models import ResearchCollaborator
+from .models import Research
+
+ROLE_HEAD = 'head'
+MANAGE_ROLES = (ROLE_HEAD, 'manager')
+CONTRIBUTE_ROLES = (ROLE_HEAD, 'manager', 'contributor')
+
+
+def _cache_key(user_id):
+    return f'research_roles:{user_id}'
+
+
+def _load_roles(user):
+    collaborations = ResearchCollaborator.objects.filter(
+        user=user).values_list('research_id', 'role')
+    headed = Research.objects.filter(head_researcher=user).values_list(
+        'pk', Value(ROLE_HEAD, output_field=CharField()))
+    roles = {}
+    for research_pk, role in collaborations.union(headed, all=True):
+        # Heading a project outranks a collaborator entry for it
+        if roles.get(research_pk) != ROLE_HEAD:
+            roles[research_pk] = role
+    return roles
+
+
+def get_role_map(user):
+    """``{research pk: role}`` for every project the user heads or collaborates on"""
+    if not user.is_authenticated:
+        return {}
+    roles = getattr(user, '_research_roles', None)
+    if roles is not None:
+        return roles
+
+    timeout = settings.RESEARCH_ROLE_CACHE_TIMEOUT
+    if timeout:
+        roles = cache.get(_cache_key(user.pk))
+    if roles is None:
+        roles = _load_roles(user)
+        if timeout:
+            cache.set(_cache_key(user.pk), roles, timeout)
+    user._research_roles = roles
+    return roles
+
+
+def invalidate_roles(user_id, user=None):
+    """Forget the cached role map of a user"""
+    cache.delete(_cache_key(user_id))
+    if user is not None:
+        user.__dict__.pop('_research_roles', None)
+
+
+def get_role(user, project):
+    """'head', a collaborator role, or None"""
+    return get_role_map(user).get(project.pk)
+
+
+def has_access(user, project):
+    return get_role(user, project) is not None
+
+
+def can_manage(user, project):
+    return get_role(user, project) in MANAGE_ROLES
+
+
+def can_contribute(user, project):
+    return get_role(user, project) in CONTRIBUTE_ROLES
+
+
+def accessible_research_ids(user):
+    return list(get_role_map(user))
+
+
+def filter_accessible(queryset, user, field=None):
+    """
+    Restrict ``queryset`` to the projects the user can access, or, for other
+    models, to rows whose ``field`` (default ``research``) points to one
+    """
+    if field is None:
+        field = 'pk' if queryset.model is Research else 'research'
+    return queryset.filter(**{f'{field}__in': accessible_research_ids(user)})
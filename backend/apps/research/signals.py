@@ -0,0 +1,30 @@
+from django.db.models.signals import post_delete, post_save, pre_save
+from django.dispatch import receiver
+
+from apps.collaboration.models import ResearchCollaborator
+from .models import Research
+from .permissions import invalidate_roles
+
+
+@receiver(pre_save, sender=Research)
+def remember_head_researcher(sender, instance, using, **kwargs):
+    """Keep the head being replaced, whose role map changes too"""
+    instance._head_before = None
+    if instance.pk:
+        instance._head_before = Research.objects.using(using).filter(
+            pk=instance.pk).values_list('head_researcher_id', flat=True).first()
+
+
+@receiver(post_save, sender=Research)
+@receiver(post_delete, sender=Research)
+def invalidate_head_roles(sender, instance, **kwargs):
+    invalidate_roles(instance.head_researcher_id)
+    previous = getattr(instance, '_head_before', None)
+    if previous and previous != instance.head_researcher_id:
+        invalidate_roles(previous)
+
+
+@receiver(post_save, sender=ResearchCollaborator)
+@receiver(post_delete, sender=ResearchCollaborator)
+def invalidate_collaborator_roles(sender, instance, **kwargs):
+    invalidate_roles(instance.user_id)
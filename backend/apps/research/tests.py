@@ -1,3 +1,268 @@
-from django.test import TestCase
+from datetime import timedelta
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.db import connection
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+
+from apps.collaboration.models import ResearchCollaborator
+from apps.common.pagination import InvalidCursor, paginate_by_cursor
+from apps.common.testing import LOCAL_CACHES
+from apps.data.models import DatasetComparison
+from apps.experiments.models import Electrode, Experiment, Instrument, VoltammetryTechnique
+from apps.research import permissions
+from apps.research.models import Research
+
+
+@override_settings(CACHES=LOCAL_CACHES)
+class ResearchListQueryCountTests(TestCase):
+    """The project listing must not issue queries per project"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(username='researcher', password='secret')
+        other = User.objects.create_user(username='other', password='secret')
+        instrument = Instrument.objects.create(name='Potentiostat')
+        electrode = Electrode.objects.create(type='Glassy Carbon')
+        technique = VoltammetryTechnique.objects.create(name='Cyclic Voltammetry')
+
+        for number in range(12):
+            # Alternate between headed projects and collaborations
+            head = cls.user if number % 2 else other
+            project = Research.objects.create(
+                research_id=f'RES-{number}', title=f'Project {number}', head_researcher=head)
+            if head == other:
+                ResearchCollaborator.objects.create(
+                    research=project, user=cls.user, role='contributor')
+            for index in range(2):
+                Experiment.objects.create(
+                    experiment_id=f'EXP-{number}-{index}', title='Run', researcher=head,
+                    instrument=instrument, electrode=electrode,
+                    voltammetry_technique=technique, experiment_type='cyclic',
+                    scan_rate=100, research=project)
+
+        # Not visible to the user
+        Research.objects.create(research_id='RES-hidden', title='Hidden', head_researcher=other)
+
+    def setUp(self):
+        self.client.force_login(self.user)
+        self.url = reverse('v0:research_projects')
+
+    def _list(self, page_size):
+        response = self.client.get(self.url, {'page_size': page_size})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_query_count_does_not_depend_on_page_size(self):
+        # Session, user, role map, page of projects
+        with self.assertNumQueries(4):
+            small = self._list(page_size=2)
+        with self.assertNumQueries(4):
+            large = self._list(page_size=12)
+        self.assertEqual(len(small['results']), 2)
+        self.assertEqual(len(large['results']), 12)
+
+    def test_listing_content(self):
+        results = self._list(page_size=50)['results']
+        self.assertEqual(len(results), 12)
+        for project in results:
+            self.assertEqual(project['experiments_count'], 2)
+            if project['is_head']:
+                self.assertEqual(project['role'], 'head')
+            else:
+                self.assertEqual(project['role'], 'contributor')
+
+
+class KeysetPaginationTests(TestCase):
+    """Cursor pages cover every row once, including rows that tie on the sort key"""
+
+    @classmethod
+    def setUpTestData(cls):
+        user = User.objects.create_user(username='researcher', password='secret')
+        for number in range(11):
+            Research.objects.create(
+                research_id=f'RES-{number}', title=f'Project {number}', head_researcher=user)
+        # Three distinct timestamps, most of them shared by several rows
+        now = timezone.now()
+        for project in Research.objects.all():
+            Research.objects.filter(pk=project.pk).update(
+                created_at=now - timedelta(seconds=project.pk % 3))
+        cls.expected = list(Research.objects.order_by('-created_at', '-pk').values_list('pk', flat=True))
+
+    def _page(self, **params):
+        return paginate_by_cursor(Research.objects.all(), params)
+
+    def _pks(self, page):
+        return [project.pk for project in page['results']]
+
+    def test_first_page(self):
+        page = self._page(page_size=4)
+        self.assertEqual(self._pks(page), self.expected[:4])
+        self.assertTrue(page['has_next'])
+        self.assertFalse(page['has_previous'])
+        self.assertIsNone(page['previous_cursor'])
+
+    def test_forward_through_ties(self):
+        pks, page = [], self._page(page_size=4)
+        while True:
+            pks.extend(self._pks(page))
+            if not page['has_next']:
+                break
+            page = self._page(page_size=4, cursor=page['next_cursor'])
+        self.assertEqual(pks, self.expected)
+        # The last page is short and ends the walk
+        self.assertEqual(len(page['results']), 3)
+        self.assertTrue(page['has_previous'])
+        self.assertIsNone(page['next_cursor'])
+
+    def test_backward_from_last_page(self):
+        page = self._page(page_size=4)
+        page = self._page(page_size=4, cursor=page['next_cursor'])
+        last = self._page(page_size=4, cursor=page['next_cursor'])
+        self.assertEqual(self._pks(last), self.expected[8:])
+
+        page = self._page(page_size=4, cursor=last['previous_cursor'])
+        self.assertEqual(self._pks(page), self.expected[4:8])
+        self.assertTrue(page['has_next'])
+        page = self._page(page_size=4, cursor=page['previous_cursor'])
+        self.assertEqual(self._pks(page), self.expected[:4])
+        self.assertFalse(page['has_previous'])
+        self.assertTrue(page['has_next'])
+
+    def test_single_page(self):
+        page = self._page(page_size=50, count='exact')
+        self.assertEqual(self._pks(page), self.expected)
+        self.assertFalse(page['has_next'] or page['has_previous'])
+        self.assertEqual(page['count'], 11)
+
+    def test_invalid_cursor(self):
+        with self.assertRaises(InvalidCursor):
+            self._page(cursor='not-a-cursor')
+
+
+class RolePermissionTests(TestCase):
+    """Every permission check of a request is answered from one role map"""
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.head = User.objects.create_user(username='head', password='secret')
+        cls.project = Research.objects.create(
+            research_id='RES-ROLES', title='Roles', head_researcher=cls.head)
+        cls.users = {'head': cls.head}
+        for role in ('manager', 'contributor', 'viewer'):
+            user = User.objects.create_user(username=role, password='secret')
+            ResearchCollaborator.objects.create(research=cls.project, user=user, role=role)
+            cls.users[role] = user
+        cls.users['outsider'] = User.objects.create_user(username='outsider', password='secret')
+
+    def _fresh(self, name):
+        # A new user object, so no role map is kept from an earlier check
+        return User.objects.get(pk=self.users[name].pk)
+
+    def test_permission_matrix(self):
+        expected = {
+            # role: (has_access, can_contribute, can_manage)
+            'head': (True, True, True),
+            'manager': (True, True, True),
+            'contributor': (True, True, False),
+            'viewer': (True, False, False),
+            'outsider': (False, False, False),
+        }
+        for name, allowed in expected.items():
+            user = self._fresh(name)
+            with self.subTest(role=name):
+                self.assertEqual((
+                    permissions.has_access(user, self.project),
+                    permissions.can_contribute(user, self.project),
+                    permissions.can_manage(user, self.project),
+                ), allowed)
+                self.assertEqual(permissions.get_role(user, self.project),
+                                 None if name == 'outsider' else name)
+
+    def test_heading_outranks_a_collaborator_entry(self):
+        ResearchCollaborator.objects.create(research=self.project, user=self.head, role='viewer')
+        self.assertTrue(permissions.can_manage(self._fresh('head'), self.project))
+
+    def test_role_map_is_loaded_once_per_user_object(self):
+        user = self._fresh('contributor')
+        with self.assertNumQueries(1):
+            permissions.has_access(user, self.project)
+            permissions.can_contribute(user, self.project)
+            permissions.can_manage(user, self.project)
+            self.assertEqual(permissions.accessible_research_ids(user), [self.project.pk])
+
+    def test_filter_accessible(self):
+        Research.objects.create(research_id='RES-OTHER', title='Other', head_researcher=self.head)
+        self.assertEqual(
+            list(permissions.filter_accessible(Research.objects.all(), self._fresh('viewer'))),
+            [self.project])
+        self.assertFalse(permissions.filter_accessible(Research.objects.all(), self._fresh('outsider')))
+
+    @override_settings(RESEARCH_ROLE_CACHE_TIMEOUT=60, CACHES=LOCAL_CACHES)
+    def test_shared_role_map_follows_membership_changes(self):
+        cache.clear()
+        self.assertEqual(permissions.get_role(self._fresh('viewer'), self.project), 'viewer')
+        viewer = self._fresh('viewer')
+        with self.assertNumQueries(0):
+            self.assertEqual(permissions.get_role(viewer, self.project), 'viewer')
+
+        ResearchCollaborator.objects.filter(user=self.users['viewer']).get().delete()
+        self.assertIsNone(permissions.get_role(self._fresh('viewer'), self.project))
+
+        outsider = self.users['outsider']
+        self.assertIsNone(permissions.get_role(self._fresh('outsider'), self.project))
+        self.project.head_researcher = outsider
+        self.project.save()
+        self.assertEqual(permissions.get_role(self._fresh('outsider'), self.project), 'head')
+        self.assertIsNone(permissions.get_role(self._fresh('head'), self.project))
+
+
+class ComparisonDetailTests(TestCase):
+    """A comparison loads all of its datasets with one query"""
+
+    @classmethod
+    def setUpTestData(cls):
+        owner = User.objects.create_user(username='owner', password='secret')
+        cls.member = User.objects.create_user(username='member', password='secret')
+        cls.outsider = User.objects.create_user(username='outsider', password='secret')
+        project = Research.objects.create(research_id='RES-CMP', title='Compared', head_researcher=owner)
+        ResearchCollaborator.objects.create(research=project, user=cls.member, role='viewer')
+        related = {
+            'researcher': owner,
+            'instrument': Instrument.objects.create(name='Potentiostat'),
+            'electrode': Electrode.objects.create(type='Glassy Carbon'),
+            'voltammetry_technique': VoltammetryTechnique.objects.create(name='Cyclic Voltammetry'),
+            'experiment_type': 'cyclic', 'scan_rate': 100, 'research': project,
+        }
+        ids = [f'EXP-CMP-{number}' for number in range(10)]
+        for experiment_id in ids:
+            Experiment.objects.create(experiment_id=experiment_id, title=experiment_id, **related)
+        for size in (2, 10):
+            DatasetComparison.objects.create(
+                comparison_id=f'CMP-{size}', title='Comparison', created_by=owner,
+                datasets=ids[:size] + ['EXP-MISSING'])
+
+    def _get(self, comparison_id):
+        return self.client.get(reverse('v0:comparison_detail', args=[comparison_id]))
+
+    def test_query_count_does_not_grow_with_datasets(self):
+        self.client.force_login(self.member)
+        with CaptureQueriesContext(connection) as small:
+            self._get('CMP-2')
+        with CaptureQueriesContext(connection) as large:
+            response = self._get('CMP-10')
+        self.assertEqual(len(large), len(small))
+
+        datasets = response.json()['datasets']
+        self.assertEqual([dataset['id'] for dataset in datasets][:3],
+                         ['EXP-CMP-0', 'EXP-CMP-1', 'EXP-CMP-2'])
+        self.assertEqual(len(datasets), 11)
+        self.assertEqual(datasets[-1], {
+            'id': 'EXP-MISSING', 'title': 'Unknown dataset', 'error': 'Dataset not found'})
+
+    def test_private_comparison_needs_project_access(self):
+        self.client.force_login(self.outsider)
+        self.assertEqual(self._get('CMP-2').status_code, 403)
@@ -3,6 +3,25 @@ from . import views
 
 
 urlpatterns = [
+    # Dataset comparison routes (listed first so 'comparisons/' is not
+    # captured as a research_id)
+    path(
+        'comparisons/',
+        views.DatasetComparisonsView.as_view(),
+        name='dataset_comparisons_all'
+    ),
+    path(
+        '<str:research_id>/comparisons/',
+        views.DatasetComparisonsView.as_view(),
+        name='research_dataset_comparisons'
+    ),
+    path(
+        'comparisons/<str:comparison_id>/',
+        views.ComparisonDetail.as_view(),
+        name='comparison_detail'
+    ),
+] + \
+    [
     # Research project routes
     path('', views.ResearchView.as_view(), name='research_projects'),
     path(
@@ -45,22 +64,4 @@ urlpatterns = [
         views.AssignExperimentView.as_view(),
         name="assign_experiment"
     ),
-] + \
-    [
-    # Dataset comparison routes
-    path(
-        'comparisons/',
-        views.DatasetComparisonsView.as_view(),
-        name='dataset_comparisons_all'
-    ),
-    path(
-        '<str:research_id>/comparisons/',
-        views.DatasetComparisonsView.as_view(),
-        name='research_dataset_comparisons'
-    ),
-    path(
-        'comparisons/<str:comparison_id>/',
-        views.ComparisonDetail.as_view(),
-        name='comparison_detail'
-    ),
 ]
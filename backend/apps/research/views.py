@@ -1,11 +1,7 @@
 import traceback
-from django.conf import settings
 from django.contrib.auth.decorators import login_required
 from django.contrib.auth.models import User
-from django.core.files.base import ContentFile
-from django.core.files.storage import default_storage
-from django.core.paginator import Paginator
-from django.db.models import Q
+from django.db.models import Count, Q
 from django.http import JsonResponse
 from django.shortcuts import get_object_or_404
 from django.utils.decorators import method_decorator
@@ -13,41 +9,47 @@ from django.views.decorators.csrf import csrf_exempt
 from rest_framework.views import APIView
 from datetime import datetime
 import json
-import os
 import uuid
 
 from apps.collaboration.models import ResearchCollaborator
+from apps.common import tasks
+from apps.common.pagination import paginate_by_cursor
+from apps.data.blobs import blob_storage
 from apps.data.models import Dataset, DatasetComparison, FileUpload
+from apps.experiments.comparison import run_comparison
 from apps.experiments.models import Experiment
+from apps.research import permissions
 from apps.research.models import Research
 from apps.users.models import OrcidProfile
 
+# Comparisons of up to this many datasets are computed within the request
+COMPARISON_SYNC_LIMIT = 5
+
 
 @method_decorator(csrf_exempt, name='dispatch')
 class ResearchView(APIView):
     """Handle research projects listing and creation"""
     @method_decorator(login_required)
     def get(self, request):
-        # List projects the user is involved in
-        headed_projects = Research.objects.filter(head_researcher=request.user)
-
-        # Projects where user is a collaborator
-        collaborated_projects = Research.objects.filter(
-            collaborators__user=request.user
+        # List projects the user is involved in; their roles come from the
+        # user's role map, loaded once per request
+        roles = permissions.get_role_map(request.user)
+        all_projects = permissions.filter_accessible(
+            Research.objects.all(), request.user
+        ).select_related('head_researcher').annotate(
+            experiments_count=Count('experiments')
         )
 
-        # Combine and remove duplicates
-        all_projects = (headed_projects | collaborated_projects).distinct()
-
-        # Paginate results
-        page = request.GET.get('page', 1)
-        page_size = request.GET.get('page_size', 10)
-        paginator = Paginator(all_projects.order_by('-created_at'), page_size)
-        page_obj = paginator.get_page(page)
+        # Paginate results, newest first
+        try:
+            page = paginate_by_cursor(all_projects, request.GET)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
 
         # Format results
         results = []
-        for project in page_obj:
+        for project in page['results']:
+            is_head = project.head_researcher_id == request.user.id
             results.append({
                 'id': project.research_id,
                 'title': project.title,
@@ -61,19 +63,13 @@ class ResearchView(APIView):
                     'username': project.head_researcher.username,
                     'email': project.head_researcher.email,
                 },
-                'is_head': project.head_researcher == request.user,
-                'role': get_user_role_in_project(request.user, project),
-                'experiments_count': project.experiments.count()
+                'is_head': is_head,
+                'role': roles.get(project.pk),
+                'experiments_count': project.experiments_count
             })
 
-        return JsonResponse({
-            'count': paginator.count,
-            'num_pages': paginator.num_pages,
-            'current_page': int(page),
-            'has_next': page_obj.has_next(),
-            'has_previous': page_obj.has_previous(),
-            'results': results
-        })
+        page['results'] = results
+        return JsonResponse(page)
 
     @method_decorator(login_required)
     def post(self, request):
@@ -396,14 +392,13 @@ class DatasetComparisonsView(APIView):
             if not dataset_ids or len(dataset_ids) < 2:
                 return JsonResponse({"error": "At least two datasets are required for comparison"}, status=400)
 
-            # Validate dataset IDs
-            datasets = []
+            # Validate dataset IDs, loading all datasets in one query
+            found = Experiment.objects.only('experiment_id', 'research').in_bulk(
+                dataset_ids, field_name='experiment_id')
             for dataset_id in dataset_ids:
-                try:
-                    dataset = Experiment.objects.get(experiment_id=dataset_id)
-                    datasets.append(dataset)
-                except Experiment.DoesNotExist:
+                if dataset_id not in found:
                     return JsonResponse({"error": f"Dataset {dataset_id} not found"}, status=404)
+            datasets = [found[dataset_id] for dataset_id in dataset_ids]
 
             # If research_id is provided, validate the project and datasets
             if research_id:
@@ -415,38 +410,36 @@ class DatasetComparisonsView(APIView):
 
                 # Ensure all datasets belong to the project
                 for dataset in datasets:
-                    if dataset.research != research:
+                    if dataset.research_id != research.pk:
                         return JsonResponse({"error": f"Dataset {dataset.experiment_id} does not belong to the project"}, status=400)
 
             # Check if user has access to all datasets (if research_id is not provided)
             if not research_id:
+                roles = permissions.get_role_map(request.user)
                 for dataset in datasets:
-                    if dataset.research and not has_project_access(request.user, dataset.research):
+                    if dataset.research_id and dataset.research_id not in roles:
                         return JsonResponse({"error": f"You don't have access to dataset {dataset.experiment_id}"}, status=403)
 
             # Generate a unique comparison ID
             comparison_id = f"CMP-{uuid.uuid4().hex[:8].upper()}"
 
-            # Create the comparison
-            # In a real system, this would trigger a background job for comparison calculation
+            # Create the comparison; results are filled in by run_comparison
             comparison = DatasetComparison.objects.create(
                 comparison_id=comparison_id,
                 title=title,
                 description=description,
                 created_by=request.user,
+                is_public=is_public,
                 datasets=dataset_ids,
                 research=research if research_id else None,
-                # Simulated comparison results
-                comparison_results={
-                    "summary": "Comparison between multiple datasets",
-                    "correlation": 0.87,
-                    "peak_differences": {
-                        "anodic": [0.02, 0.05, 0.03],
-                        "cathodic": [0.04, 0.02, 0.01]
-                    }
-                }
             )
 
+            # Small selections are compared right away, larger ones in the background
+            if len(dataset_ids) <= COMPARISON_SYNC_LIMIT:
+                comparison = run_comparison(comparison.pk)
+            else:
+                tasks.submit(run_comparison, comparison.pk)
+
             return JsonResponse({
                 'message': 'Dataset comparison created successfully',
                 'comparison': {
@@ -454,7 +447,8 @@ class DatasetComparisonsView(APIView):
                     'title': comparison.title,
                     'description': comparison.description,
                     'created_at': comparison.created_at.isoformat(),
-                    'dataset_count': len(dataset_ids)
+                    'dataset_count': len(dataset_ids),
+                    'status': comparison.status
                 }
             })
 
@@ -487,15 +481,15 @@ class DatasetComparisonsView(APIView):
                 Q(created_by=request.user) | Q(is_public=True)
             ).distinct()
 
-        # Paginate results
-        page = request.GET.get('page', 1)
-        page_size = request.GET.get('page_size', 10)
-        paginator = Paginator(comparisons.order_by('-created_at'), page_size)
-        page_obj = paginator.get_page(page)
+        # Paginate results, newest first
+        try:
+            page = paginate_by_cursor(comparisons, request.GET)
+        except ValueError as e:
+            return JsonResponse({'error': str(e)}, status=400)
 
         # Format results
         results = []
-        for comparison in page_obj:
+        for comparison in page['results']:
             results.append({
                 'id': comparison.comparison_id,
                 'title': comparison.title,
@@ -509,14 +503,8 @@ class DatasetComparisonsView(APIView):
                 }
             })
 
-        return JsonResponse({
-            'count': paginator.count,
-            'num_pages': paginator.num_pages,
-            'current_page': int(page),
-            'has_next': page_obj.has_next(),
-            'has_previous': page_obj.has_previous(),
-            'results': results
-        })
+        page['results'] = results
+        return JsonResponse(page)
 
 
 @method_decorator(csrf_exempt, name='dispatch')
@@ -525,20 +513,20 @@ class ComparisonDetail(APIView):
 
     def get(self, request, comparison_id):
         comparison = get_object_or_404(
-            DatasetComparison, comparison_id=comparison_id)
+            DatasetComparison.objects.select_related('created_by'), comparison_id=comparison_id)
+
+        # Load all datasets of the comparison in one query
+        found = Experiment.objects.only(
+            'experiment_id', 'title', 'experiment_type', 'scan_rate',
+            'electrode_material', 'research'
+        ).in_bulk(comparison.datasets, field_name='experiment_id')
 
         # Check access
-        if comparison.created_by != request.user and not comparison.is_public:
+        if comparison.created_by_id != request.user.id and not comparison.is_public:
             # Check if user has access to any of the datasets' projects
-            has_access = False
-            for dataset_id in comparison.datasets:
-                try:
-                    dataset = Experiment.objects.get(experiment_id=dataset_id)
-                    if dataset.research and has_project_access(request.user, dataset.research):
-                        has_access = True
-                        break
-                except Experiment.DoesNotExist:
-                    continue
+            roles = permissions.get_role_map(request.user)
+            has_access = any(
+                dataset.research_id in roles for dataset in found.values() if dataset.research_id)
 
             if not has_access:
                 return JsonResponse({"error": "You don't have access to this comparison"}, status=403)
@@ -546,8 +534,8 @@ class ComparisonDetail(APIView):
         # Get dataset details
         datasets = []
         for dataset_id in comparison.datasets:
-            try:
-                dataset = Experiment.objects.get(experiment_id=dataset_id)
+            dataset = found.get(dataset_id)
+            if dataset is not None:
                 datasets.append({
                     'id': dataset.experiment_id,
                     'title': dataset.title,
@@ -555,7 +543,7 @@ class ComparisonDetail(APIView):
                     'scan_rate': dataset.scan_rate,
                     'electrode_material': dataset.electrode_material
                 })
-            except Experiment.DoesNotExist:
+            else:
                 datasets.append({
                     'id': dataset_id,
                     'title': 'Unknown dataset',
@@ -574,6 +562,7 @@ class ComparisonDetail(APIView):
                 'username': comparison.created_by.username
             },
             'datasets': datasets,
+            'status': comparison.status,
             'results': comparison.comparison_results
         })
 
@@ -800,23 +789,14 @@ class ResearchFileUploadView(APIView):
 
             file = request.FILES['file']
 
-            # Generate a unique file name to prevent overwriting
-            file_name = f"{uuid.uuid4()}_{file.name}"
-
-            # Create directory if it doesn't exist
-            upload_path = os.path.join('research', research_id, 'datasets')
-            full_path = os.path.join(settings.MEDIA_ROOT, upload_path)
-            os.makedirs(full_path, exist_ok=True)
-
-            # Save the file
-            file_path = os.path.join(upload_path, file_name)
-            path = default_storage.save(file_path, ContentFile(file.read()))
+            path = blob_storage.save(file.name, file)
 
             # Create dataset record
             dataset = Dataset.objects.create(
                 title=request.POST.get('title', file.name),
                 description=request.POST.get('description', ''),
                 file_path=path,
+                file_name=file.name,
                 file_size=file.size,
                 file_type=file.content_type,
                 is_public=request.POST.get(
@@ -1034,53 +1014,22 @@ class ResearchFileDownloadView(APIView):
 
 def has_project_access(user, project):
     """Check if a user has access to a project"""
-    # Head researcher always has access
-    if project.head_researcher == user:
-        return True
-
-    # Public projects are accessible to all
-    if project.is_public:
-        return True
-
-    # Check if user is a collaborator
-    return ResearchCollaborator.objects.filter(project=project, user=user).exists()
+    return permissions.has_access(user, project)
 
 
 def can_manage_project(user, project):
     """Check if a user can manage a project"""
-    # Head researcher can always manage
-    if project.head_researcher == user:
-        return True
-
-    # Check if user is a manager
-    return ResearchCollaborator.objects.filter(
-        project=project, user=user, role='manager'
-    ).exists()
+    return permissions.can_manage(user, project)
 
 
 def can_contribute_to_project(user, project):
     """Check if a user can contribute to a project"""
-    # Head researcher and managers can contribute
-    if can_manage_project(user, project):
-        return True
-
-    # Check if user is a contributor
-    return ResearchCollaborator.objects.filter(
-        project=project, user=user, role__in=['contributor', 'manager']
-    ).exists()
+    return permissions.can_contribute(user, project)
 
 
 def get_user_role_in_project(user, project):
     """Get the user's role in a project"""
-    if project.head_researcher == user:
-        return 'head'
-
-    try:
-        collaborator = ResearchCollaborator.objects.get(
-            project=project, user=user)
-        return collaborator.role
-    except ResearchCollaborator.DoesNotExist:
-        return None
+    return permissions.get_role(user, project)
 
 
 def _check_access(user, research_id):
@@ -212,6 +212,24 @@ if 'DATABASE_URL' in os.environ:
     DATABASES['default'] = dj_database_url.parse(
         os.environ.get('DATABASE_URL'))
 
+# Cache shared by all server processes: cached views, facet counts, version
+# counters and stampede locks are only correct when every process sees the
+# same entries. Uses the database (run `manage.py createcachetable` once)
+# unless REDIS_URL is set. The per-process LocMemCache is rejected by the
+# caching.E001 check outside DEBUG.
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.db.DatabaseCache',
+        'LOCATION': 'django_cache',
+    }
+}
+
+if 'REDIS_URL' in os.environ:
+    CACHES['default'] = {
+        'BACKEND': 'django.core.cache.backends.redis.RedisCache',
+        'LOCATION': os.environ.get('REDIS_URL'),
+    }
+
 
 # Password validation
 # https://docs.djangoproject.com/en/5.1/ref/settings/#auth-password-validators
@@ -260,6 +278,44 @@ os.makedirs(os.path.join(BASE_DIR, 'static', 'frontend'), exist_ok=True)
 MEDIA_URL = '/media/'
 MEDIA_ROOT = os.path.join(BASE_DIR, 'media')
 
+# Columnar experiment traces (content-addressed .npy files)
+TRACE_STORE_ROOT = os.path.join(MEDIA_ROOT, 'traces')
+
+# Bulk experiment exports (ZIP archives)
+EXPORT_ROOT = os.path.join(MEDIA_ROOT, 'exports')
+# Seconds a pending or running export may go without progress before it is
+# marked failed
+EXPORT_JOB_TIMEOUT = int(os.environ.get('EXPORT_JOB_TIMEOUT', 30 * 60))
+
+# Converted dataset downloads kept for repeat requests. The least recently used
+# files are removed once the directory exceeds CONVERSION_CACHE_MAX_BYTES, and
+# outputs larger than CONVERSION_CACHE_MAX_FILE_BYTES are not kept
+CONVERSION_CACHE_ROOT = os.path.join(MEDIA_ROOT, 'conversions')
+CONVERSION_CACHE_MAX_BYTES = int(os.environ.get('CONVERSION_CACHE_MAX_BYTES', 1024 ** 3))
+CONVERSION_CACHE_MAX_FILE_BYTES = int(os.environ.get('CONVERSION_CACHE_MAX_FILE_BYTES', 100 * 1024 ** 2))
+
+# Threads for background jobs such as exports and dataset comparisons
+BACKGROUND_WORKERS = int(os.environ.get('BACKGROUND_WORKERS', 2))
+
+# Seconds before the in-process search suggestion index is reloaded, which
+# picks up changes made by other worker processes
+SUGGESTION_INDEX_TTL = int(os.environ.get('SUGGESTION_INDEX_TTL', 300))
+
+# Seconds search facet counts are cached per normalized query
+FACET_CACHE_TIMEOUT = int(os.environ.get('FACET_CACHE_TIMEOUT', 60))
+
+# Seconds a user's research role map is shared across requests through the
+# cache (0: loaded once per request only)
+RESEARCH_ROLE_CACHE_TIMEOUT = int(os.environ.get('RESEARCH_ROLE_CACHE_TIMEOUT', 0))
+
+# Every this many versions an upload or experiment is stored in full; versions
+# in between keep only a delta against the next newer version
+VERSION_SNAPSHOT_INTERVAL = int(os.environ.get('VERSION_SNAPSHOT_INTERVAL', 10))
+
+# Uploads larger than this many bytes are not delta-encoded, as the diff holds
+# both versions in memory; their older versions are kept in full
+DELTA_MAX_BYTES = int(os.environ.get('DELTA_MAX_BYTES', 16 * 1024 ** 2))
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.1/ref/settings/#default-auto-field
 